@@ -0,0 +1,109 @@
+import base64
+import os
+import shutil
+import tempfile
+import time
+
+import click
+
+from glass import frontmatter
+
+# Times reading the properties of large notes, whose bodies embed attachments (images as base64 data URIs)
+# and use --- horizontal rules, against the whole file parser frontmatter replaced
+# Run with python -m benchmarks.frontmatter --notes 200 --attachment-kb 2048
+
+
+def readWholeNote(metaFilePath):
+    # The parser before frontmatter: every line of the note is read, and any --- line toggles the properties on or off
+    with open(metaFilePath, "r") as metaFile:
+        fileLines = metaFile.readlines()
+
+    withinProperties = False
+    data = {}
+    for line in fileLines:
+        line = line.strip()
+        if line == "---":
+            withinProperties = not withinProperties
+
+        if withinProperties and ":" in line:
+            keyPair = line.split(":")
+
+            if len(keyPair) > 2:
+                keyPair[1] = ":".join(keyPair[1:])
+
+            key, value = keyPair[0], keyPair[1][1:]
+            data[key] = value
+    return data
+
+def generateNotes(notesDir, count, attachmentSize, attachments):
+    # Writes count notes, each embedding attachments of attachmentSize bytes, and returns their paths
+    # The payload stands in for an image, it only has to be the right size
+    payload = base64.b64encode(os.urandom(attachmentSize * 3 // 4)).decode("ascii")
+    paths = []
+    for index in range(count):
+        noteID = f"{index // 1000 + 11}.{index // 10 % 99 + 1:02d}.{index % 10 + 1:02d}"
+        lines = [
+            "---",
+            f"title: Note {index}",
+            "type: project",
+            "revision-stage: working-document",
+            "revision-number: 2",
+            "due-date: 2024-06-30",
+            "meta-override: false",
+            f'glassID: "{noteID}"',
+            "---",
+            f"# Note {index}",
+        ]
+        for attachment in range(attachments):
+            lines += [
+                "---",
+                # The kind of line that a whole file parser mistakes for a property once a rule reopens the block
+                f"revision-number: {attachment + 10}",
+                f"![attachment {attachment}](data:image/png;base64,{payload})",
+            ]
+        path = os.path.join(notesDir, f"Note {index}.md")
+        with open(path, "w", encoding="utf-8") as noteFile:
+            noteFile.write("\n".join(lines) + "\n")
+        paths.append(path)
+    return paths
+
+def timeParser(parser, paths, runs):
+    # Returns the fastest time over the runs, and the properties from the last one
+    bestTime = None
+    for run in range(runs):
+        startTime = time.perf_counter()
+        results = [parser(path) for path in paths]
+        elapsed = time.perf_counter() - startTime
+        bestTime = elapsed if bestTime == None else min(bestTime, elapsed)
+    return bestTime, results
+
+
+@click.command()
+@click.option("count", "--notes", type=int, default=200, help="The number of notes (default=200)")
+@click.option("attachmentKB", "--attachment-kb", type=int, default=1024, help="The size of each embedded attachment in KB (default=1024)")
+@click.option("attachments", "--attachments", type=int, default=2, help="The number of attachments in each note (default=2)")
+@click.option("runs", "--runs", type=int, default=3, help="The number of times each parser is timed, the fastest is kept (default=3)")
+def main(count, attachmentKB, attachments, runs):
+    "Compare the frontmatter parser with the whole file parser it replaced on notes with large attachments"
+    notesDir = tempfile.mkdtemp(prefix="glass-frontmatter-")
+    try:
+        paths = generateNotes(notesDir, count, attachmentKB * 1024, attachments)
+        totalBytes = sum(os.path.getsize(path) for path in paths)
+        # The files are read once first, so both parsers are timed against the page cache
+        timeParser(readWholeNote, paths, 1)
+        wholeTime, wholeResults = timeParser(readWholeNote, paths, runs)
+        frontmatterTime, frontmatterResults = timeParser(frontmatter.readProperties, paths, runs)
+    finally:
+        shutil.rmtree(notesDir, ignore_errors=True)
+
+    click.echo(f"Read {count} notes, {totalBytes / 1e6:.1f} MB in total")
+    click.echo(f"{'Parser':<12} | {'Total (s)':>9} | {'Per note (ms)':>13} | {'revision-number':>15}")
+    click.echo(f"{'-'*13}+{'-'*11}+{'-'*15}+{'-'*16}")
+    for label, elapsed, results in [("whole file", wholeTime, wholeResults), ("frontmatter", frontmatterTime, frontmatterResults)]:
+        # The whole file parser picks up the revision numbers after the horizontal rules in the body
+        click.echo(f"{label:<12} | {elapsed:>9.3f} | {elapsed / count * 1000:>13.3f} | {str(results[0].get('revision-number')):>15}")
+    click.echo(f"The frontmatter parser was {wholeTime / frontmatterTime:.0f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import time
+
+import click
+
+from glass import util
+
+# Times how long it takes to work out the type of a million IDs
+# Run with python -m benchmarks.idparse --count 1000000
+
+
+def generateIDTexts(count):
+    # Returns count distinct IDs of every type, some of them in other storage locations
+    idTexts = []
+    for storage in ["", "B", "C", "D"]:
+        for area in range(10):
+            for category in range(10):
+                idTexts.append(f"{storage}{area}{category}")
+                for subfolder in range(1, 100):
+                    subfolderID = f"{storage}{area}{category}.{subfolder:02d}"
+                    idTexts.append(subfolderID)
+                    for project in range(1, 100):
+                        idTexts.append(f"{subfolderID}.{project:02d}")
+                        idTexts.append(f"{subfolderID}.{project:02d}A1")
+                        if len(idTexts) >= count:
+                            return idTexts
+    return idTexts
+
+def timeParser(parser, idTexts):
+    startTime = time.perf_counter()
+    for idText in idTexts:
+        parser(idText)
+    return time.perf_counter() - startTime
+
+
+@click.command()
+@click.option("count", "--count", type=int, default=1000000, help="The number of IDs to parse (default=1000000)")
+@click.option("workingSet", "--working-set", type=int, default=10000, help="The number of distinct IDs in the repeated lookups (default=10000)")
+def main(count, workingSet):
+    "Compare the ID parser with the step by step parser it replaced"
+    idTexts = generateIDTexts(count)
+    repeatedIDs = (generateIDTexts(workingSet) * (count // workingSet + 1))[:count]
+
+    util.parseID.cache_clear()
+    results = [
+        ("step by step", timeParser(util.parseIDFallback, idTexts)),
+        ("grammar", timeParser(util.parseID.__wrapped__, idTexts)),
+        ("grammar + cache, cold", timeParser(util.parseID, idTexts)),
+    ]
+    util.parseID.cache_clear()
+    results.append((f"cached, {workingSet} distinct", timeParser(util.parseID, repeatedIDs)))
+
+    click.echo(f"Parsed {count} IDs")
+    click.echo(f"{'Parser':<24} | {'Total (s)':>9} | {'Per ID (us)':>11}")
+    click.echo(f"{'-'*25}+{'-'*11}+{'-'*12}")
+    for label, elapsed in results:
+        click.echo(f"{label:<24} | {elapsed:>9.3f} | {elapsed / count * 1e6:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+from click.testing import CliRunner
+
+from glass import appconfig
+from glass import metacache
+from glass import util
+import glass.__main__ as glassCLI
+
+from . import synthetic
+
+# Times whole glass commands on synthetic trees, both in process through CliRunner and as a new process the way a
+# user runs them, and fails if a command is slower than its budget
+# Run with python -m benchmarks.latency, exits with 1 if any command is over budget
+# Budgets can be changed with --budget list=1500 (every tree size) or --budget 10000:list=3000 (one tree size)
+
+# The default budget of each command in milliseconds, as (fixed cost, extra cost per 1000 IDs in the tree)
+defaultBudgets = {
+    "open": (400, 5),
+    "list": (500, 60),
+    "project view": (500, 40),
+    # new rescans the tree before returning, so the next command sees the new ID
+    "new": (1000, 150),
+    "bg": (1000, 150),
+    "bg (cold)": (1000, 250),
+}
+newTitle = "Latency Test"
+# The caches that let the background tasks skip unchanged folders and notes, removed before each cold scan
+coldScanCaches = [os.path.join(".glass", "data", "scanState.json"), metacache.getCachePath("")]
+
+
+def getCommands(projectIDs):
+    # The arguments of each timed command
+    commands = {
+        "open": ["open", projectIDs[-1], "--print", "--no-background"],
+        "list": ["list"],
+        "project view": ["project", "view", projectIDs[len(projectIDs) // 2]],
+        "new": ["new", "--id", projectIDs[0][:2], "--title", newTitle, "--force"],
+        "bg": ["bg"],
+        # Every folder and note is read again, as on the first scan of a tree
+        "bg (cold)": ["bg"],
+    }
+    return commands
+
+def parseBudgets(budgetOptions):
+    # Returns the budgets given on the command line, keyed by (tree size or None for every size, command)
+    budgets = {}
+    for budgetOption in budgetOptions:
+        try:
+            target, milliseconds = budgetOption.rsplit("=", 1)
+            scale, command = target.split(":", 1) if ":" in target else (None, target)
+            budgets[(int(scale) if scale != None else None, command)] = float(milliseconds)
+        except ValueError:
+            raise click.BadParameter(f"{budgetOption} should look like COMMAND=MS or SCALE:COMMAND=MS", param_hint="--budget")
+        if command not in defaultBudgets:
+            raise click.BadParameter(f"{command} is not one of {', '.join(defaultBudgets.keys())}", param_hint="--budget")
+    return budgets
+
+def getBudget(budgets, scale, idCount, command):
+    if (scale, command) in budgets:
+        return budgets[(scale, command)]
+    if (None, command) in budgets:
+        return budgets[(None, command)]
+    fixedCost, costPerThousand = defaultBudgets[command]
+    return fixedCost + costPerThousand * idCount / 1000
+
+def removeNewIDs(rootPath):
+    # `glass new` makes the same folder every time it's timed, so it's removed between runs
+    for dirPath, dirNames, fileNames in os.walk(rootPath):
+        for dirName in dirNames:
+            if dirName.endswith(f" - {newTitle}"):
+                os.rmdir(os.path.join(dirPath, dirName))
+
+def resetWorkspace(rootPath, command):
+    # Undo what the last timed command changed, and for a cold scan forget what the previous scans read
+    removeNewIDs(rootPath)
+    if command == "bg (cold)":
+        for cachePath in coldScanCaches:
+            try:
+                os.remove(os.path.join(rootPath, cachePath))
+            except FileNotFoundError:
+                pass
+
+def ageWorkspace(workDir):
+    # Anything modified in the last few seconds is always read again, so the tree and vault are made an hour old
+    # for the warm scans to be able to skip them
+    agedTime = time.time() - 3600
+    for treePath in [os.path.join(workDir, "root"), os.path.join(workDir, "vault")]:
+        for dirPath, dirNames, fileNames in os.walk(treePath):
+            for name in fileNames + [""]:
+                os.utime(os.path.join(dirPath, name), (agedTime, agedTime))
+
+def buildWorkspace(workDir, shape):
+    # Creates a tree, its vault and a config pointing at them, and returns the environment to run glass in
+    rootPath = os.path.join(workDir, "root")
+    vaultPath = os.path.join(workDir, "vault")
+    projectIDs = synthetic.generateTree(rootPath, **shape)
+    synthetic.generateVault(vaultPath, projectIDs)
+    os.makedirs(os.path.join(rootPath, ".glass", "backups"), exist_ok=True)
+    with open(os.path.join(rootPath, ".glass", "data", "drives.json"), "w") as driveFile:
+        json.dump({"generated": time.time(), "version": "", "drives": [{"letter": "A", "label": "Local Storage", "path": rootPath}]}, driveFile)
+
+    environment = {
+        "GLASS_CONFIG": os.path.join(workDir, "config.json"),
+        "GLASS_NO_DAEMON": "1",
+        # glass is run from this checkout, even if a different version is installed
+        "PYTHONPATH": os.pathsep.join([os.path.dirname(os.path.dirname(os.path.abspath(util.__file__))), os.environ.get("PYTHONPATH", "")]),
+    }
+    os.environ["GLASS_CONFIG"] = environment["GLASS_CONFIG"]
+    appconfig.saveConfig({
+        "root_path": rootPath,
+        "markdown_path": vaultPath,
+        "project_template_path": os.path.join(workDir, "template.md"),
+        "excluded_folders": [".glass"],
+        "storage_locations": {"A": "Main Drive"},
+        "revision_labels": {"A": "planning", "B": "working-document", "C": "editing", "D": "submission"},
+    })
+    return environment, projectIDs
+
+def timeInProcess(runner, arguments, environment):
+    startTime = time.perf_counter()
+    result = runner.invoke(glassCLI.cli, arguments, env=environment, catch_exceptions=False)
+    elapsed = time.perf_counter() - startTime
+    if result.exit_code != 0:
+        raise click.ClickException(f"glass {' '.join(arguments)} failed in process:\n{result.output}")
+    return elapsed
+
+def timeSubprocess(arguments, environment):
+    startTime = time.perf_counter()
+    result = subprocess.run([sys.executable, "-m", "glass"] + arguments, env=dict(os.environ, **environment), capture_output=True, text=True)
+    elapsed = time.perf_counter() - startTime
+    if result.returncode != 0:
+        raise click.ClickException(f"glass {' '.join(arguments)} failed:\n{result.stdout}{result.stderr}")
+    return elapsed
+
+def measureScale(workDir, shape, runs):
+    # Returns the median time of each command in process and as a new process, and the size of the tree
+    environment, projectIDs = buildWorkspace(workDir, shape)
+    rootPath = os.path.join(workDir, "root")
+    runner = CliRunner()
+    # Build the ID index and write the bytecode cache, so neither is part of the first timed command
+    timeSubprocess(["bg"], environment)
+    # The first scan also updates the revisions in the notes
+    ageWorkspace(workDir)
+    idCount = len(util.loadIDDict(rootPath))
+
+    timings = {}
+    for command, arguments in getCommands(projectIDs).items():
+        inProcess, newProcess = [], []
+        for run in range(runs + 1):
+            resetWorkspace(rootPath, command)
+            inProcessTime = timeInProcess(runner, arguments, environment)
+            resetWorkspace(rootPath, command)
+            newProcessTime = timeSubprocess(arguments, environment)
+            # The first run of each command warms the file system cache, so it isn't counted
+            if run != 0:
+                inProcess.append(inProcessTime)
+                newProcess.append(newProcessTime)
+        removeNewIDs(rootPath)
+        timings[command] = {"inProcess": statistics.median(inProcess) * 1000, "subprocess": statistics.median(newProcess) * 1000}
+    return timings, idCount
+
+
+@click.command()
+@click.option("scales", "--scale", type=int, multiple=True, default=[1000, 10000], help="The approximate number of IDs in each tree, can be given more than once (default=1000 and 10000)")
+@click.option("budgetOptions", "--budget", multiple=True, help="The budget of a command in milliseconds, as COMMAND=MS or SCALE:COMMAND=MS, can be given more than once")
+@click.option("runs", "--runs", type=int, default=5, help="The number of times each command is timed, the median is compared with the budget (default=5)")
+@click.option("output", "--output", type=click.Path(dir_okay=False), help="Also save the results as JSON")
+def main(scales, budgetOptions, runs, output):
+    "Check that glass commands finish within their time budgets on trees of different sizes"
+    budgets = parseBudgets(budgetOptions)
+    previousConfig = os.environ.get("GLASS_CONFIG")
+    results = []
+    try:
+        for scale in scales:
+            shape = synthetic.getTreeShape(scale)
+            workDir = tempfile.mkdtemp(prefix="glass-latency-")
+            try:
+                timings, idCount = measureScale(workDir, shape, runs)
+            finally:
+                shutil.rmtree(workDir, ignore_errors=True)
+            for command, commandTimings in timings.items():
+                results.append(dict(commandTimings, scale=scale, ids=idCount, command=command, budget=getBudget(budgets, scale, idCount, command)))
+    finally:
+        if previousConfig == None:
+            os.environ.pop("GLASS_CONFIG", None)
+        else:
+            os.environ["GLASS_CONFIG"] = previousConfig
+
+    failures = []
+    click.echo(f"{'IDs':>7} | {'Command':<13} | {'In process (ms)':>15} | {'Subprocess (ms)':>15} | {'Budget (ms)':>11}")
+    click.echo(f"{'-'*8}+{'-'*15}+{'-'*17}+{'-'*17}+{'-'*12}")
+    for result in results:
+        overBudget = max(result["inProcess"], result["subprocess"]) > result["budget"]
+        line = f"{result['ids']:>7} | {result['command']:<13} | {result['inProcess']:>15.1f} | {result['subprocess']:>15.1f} | {result['budget']:>11.0f}"
+        click.echo(click.style(line, fg="red") if overBudget else line)
+        if overBudget:
+            failures.append(f"glass {result['command']} took {max(result['inProcess'], result['subprocess']):.0f} ms on {result['ids']} IDs, over the {result['budget']:.0f} ms budget")
+
+    if output != None:
+        with open(output, "w") as outputFile:
+            json.dump({"generated": time.time(), "runs": runs, "results": results}, outputFile, indent=2)
+
+    for failure in failures:
+        click.echo(click.style(f"FAIL {failure}", fg="red"))
+    if len(failures) != 0:
+        sys.exit(1)
+    click.echo(click.style("PASS", fg="green"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import gc
+import time
+import tracemalloc
+
+import click
+
+from glass import util
+
+from . import synthetic
+
+# Measures the memory used by the pathIDs of a large ID file
+# Run with python -m benchmarks.memory --count 100000
+
+
+class UnslottedPathID(util.pathID):
+    # Lays a pathID out the way it used to be: with a __dict__, its own copy of levelDict and
+    # strings that aren't shared between IDs
+    def __init__(self, idString, path, doValidation, **kwargs):
+        super().__init__(idString, path, doValidation, **kwargs)
+        self.levelDict = dict(util.pathID.levelDict)
+        self.idType = "".join(self.idType)
+        self.storageLocation = "".join(self.storageLocation)
+        self.revisionStage = "".join(self.revisionStage)
+
+
+def copyRecords(records):
+    # Each record gets its own strings, like records that have just been parsed from JSON
+    return {idText: {key: ("".join(value) if isinstance(value, str) else value) for key, value in record.items()} for idText, record in records.items()}
+
+def measure(idClass, records):
+    # Returns the bytes allocated by building a pathID for every record, and the time it took
+    gc.collect()
+    tracemalloc.start()
+    startTime = time.perf_counter()
+    ids = []
+    for idText, record in records.items():
+        ids.append(idClass(
+            idText,
+            record["path"],
+            False,
+            idType=record["type"],
+            numericalID=record["numericalID"],
+            desc=record["descriptor"],
+            storage=record["storageLocation"],
+            revision=record["revisionCount"],
+            revisionStage=record["revisionStage"]
+        ))
+    elapsed = time.perf_counter() - startTime
+    allocated, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return allocated, elapsed
+
+
+@click.command()
+@click.option("count", "--count", type=int, default=100000, help="The number of IDs to build (default=100000)")
+def main(count):
+    "Compare the memory used by slotted pathIDs with the old per-instance layout"
+    records = synthetic.generateIDRecords(count)
+    results = {}
+    for label, idClass in [("unslotted", UnslottedPathID), ("slotted", util.pathID)]:
+        results[label] = measure(idClass, copyRecords(records))
+
+    click.echo(f"{'Layout':<10} | {'Total (MB)':>10} | {'Per ID (B)':>10} | {'Build (s)':>9}")
+    click.echo(f"{'-'*11}+{'-'*12}+{'-'*12}+{'-'*10}")
+    for label, (allocated, elapsed) in results.items():
+        click.echo(f"{label:<10} | {allocated / 2**20:>10.2f} | {allocated / len(records):>10.0f} | {elapsed:>9.3f}")
+    saved = results["unslotted"][0] - results["slotted"][0]
+    click.echo(f"Saved {saved / 2**20:.2f} MB ({saved / results['unslotted'][0]:.0%}) across {len(records)} IDs")
+
+
+if __name__ == "__main__":
+    main()
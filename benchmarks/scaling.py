@@ -0,0 +1,157 @@
+from datetime import datetime
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import click
+
+from glass.appinfo import version
+from glass import project
+from glass import util
+
+from . import synthetic
+
+# Times the steps of the background tasks and the ID loading on synthetic trees of increasing size
+# Run with python -m benchmarks.scaling --output results.json, and compare two runs with --compare old.json
+# Nothing is written outside of a temporary directory (or --workdir) apart from the results
+
+excludedList = [".glass"]
+
+
+def timeCall(function, *args):
+    # Returns the result of the call and the time it took
+    startTime = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - startTime
+
+def loadAllIDs(rootPath):
+    # What `glass list` does: open the ID file and build a pathID for every ID in it
+    idDict = util.loadIDDict(rootPath)
+    return [idDict[idText] for idText in idDict]
+
+def updateMetaFiles(projects):
+    return sum(1 for proj in projects if proj.updateMetaFileRevisions())
+
+def runScale(workDir, shape, runs, workers):
+    # Builds the tree and vault for one shape, and returns the fastest time of each step over the runs
+    rootPath = os.path.join(workDir, "root")
+    vaultPath = os.path.join(workDir, "vault")
+    projectIDs = synthetic.generateTree(rootPath, **shape)
+
+    timings = {}
+    def record(step, elapsed):
+        timings[step] = min(timings.get(step, elapsed), elapsed)
+
+    for run in range(runs):
+        # The metafiles are rewritten each run, so every run has the same updates to make
+        synthetic.generateVault(vaultPath, projectIDs)
+
+        (IDList, invalidIDList), elapsed = timeCall(util.generateIDList, rootPath, excludedList, None, workers)
+        record("generateIDList", elapsed)
+        record("assignRevisions", timeCall(util.assignRevisions, IDList)[1])
+        # Every ID file is written from scratch, rather than skipping the shards left unchanged by the last run
+        shutil.rmtree(os.path.join(rootPath, ".glass", "data"))
+        os.makedirs(os.path.join(rootPath, ".glass", "data"))
+        record("exportIDlist", timeCall(util.exportIDlist, IDList, util.getIDFilePath(rootPath))[1])
+        record("loadIDDict", timeCall(loadAllIDs, rootPath)[1])
+        (validProjects, invalidProjects), elapsed = timeCall(project.generateProjectList, IDList, vaultPath)
+        record("generateProjectList", elapsed)
+        updatedCount, elapsed = timeCall(updateMetaFiles, validProjects)
+        record("updateMetaFileRevisions", elapsed)
+
+    return {
+        "shape": shape,
+        "ids": len(IDList),
+        "invalidIDs": len(invalidIDList),
+        "projects": len(validProjects) + len(invalidProjects),
+        "updatedMetaFiles": updatedCount,
+        "timings": timings
+    }
+
+def printComparison(results, previousResults):
+    # Shows how each step changed against an earlier run at the same scale
+    previousScales = {result["scale"]: result for result in previousResults["results"]}
+    click.echo(f"\nCompared with the run from {datetime.fromtimestamp(previousResults['generated']).strftime('%H:%M %d/%m/%Y')}")
+    click.echo(f"{'Scale':>7} | {'Step':<24} | {'Before (s)':>10} | {'After (s)':>10} | {'Change':>7}")
+    click.echo(f"{'-'*8}+{'-'*26}+{'-'*12}+{'-'*12}+{'-'*8}")
+    for result in results:
+        previous = previousScales.get(result["scale"])
+        if previous == None:
+            continue
+        for step, elapsed in result["timings"].items():
+            if step not in previous["timings"]:
+                continue
+            before = previous["timings"][step]
+            change = (elapsed - before) / before if before != 0 else 0
+            click.echo(f"{result['scale']:>7} | {step:<24} | {before:>10.3f} | {elapsed:>10.3f} | {change:>+7.0%}")
+
+
+@click.command()
+@click.option("scales", "--scale", type=int, multiple=True, default=[1000, 10000, 100000], help="The approximate number of IDs in each tree, can be given more than once (default=1000, 10000 and 100000)")
+@click.option("revisions", "--revisions", type=click.IntRange(0, 36), default=2, help="The number of revision folders in each project (default=2)")
+@click.option("areas", "--areas", type=click.IntRange(1, 9), help="Use a fixed number of areas rather than the scales")
+@click.option("categories", "--categories", type=click.IntRange(0, 9), default=9, help="The number of categories in each area with --areas (default=9)")
+@click.option("subfolders", "--subfolders", type=click.IntRange(0, 99), default=10, help="The number of subfolders in each category with --areas (default=10)")
+@click.option("projects", "--projects", type=click.IntRange(0, 99), default=10, help="The number of projects in each subfolder with --areas (default=10)")
+@click.option("runs", "--runs", type=int, default=3, help="The number of times each step is timed, the fastest is kept (default=3)")
+@click.option("workers", "--workers", type=int, default=8, help="The number of scanning threads (default=8)")
+@click.option("output", "--output", type=click.Path(dir_okay=False), help="Where to save the results as JSON (default=benchmark-<date>.json)")
+@click.option("compare", "--compare", type=click.Path(exists=True, dir_okay=False), help="The results of an earlier run to compare against")
+@click.option("workDir", "--workdir", type=click.Path(file_okay=False), help="Build the trees here instead of a temporary directory (it is emptied first)")
+def main(scales, revisions, areas, categories, subfolders, projects, runs, workers, output, compare, workDir):
+    "Time how glass scales on synthetic trees of 1k, 10k and 100k IDs"
+    if areas != None:
+        shape = {"areas": areas, "categories": categories, "subfolders": subfolders, "projects": projects, "revisions": revisions}
+        shapes = [(None, shape)]
+    else:
+        shapes = [(scale, synthetic.getTreeShape(scale, revisions)) for scale in scales]
+
+    results = []
+    for scale, shape in shapes:
+        click.echo(f"Building a tree of {shape['areas']} areas, {shape['categories']} categories, {shape['subfolders']} subfolders, {shape['projects']} projects and {shape['revisions']} revisions")
+        if workDir != None:
+            # The last tree is left in the working directory to look at
+            shutil.rmtree(workDir, ignore_errors=True)
+            result = runScale(workDir, shape, runs, workers)
+        else:
+            scaleDir = tempfile.mkdtemp(prefix="glass-benchmark-")
+            try:
+                result = runScale(scaleDir, shape, runs, workers)
+            finally:
+                shutil.rmtree(scaleDir, ignore_errors=True)
+        # Runs are compared by the scale they asked for, or by the size of the tree if it was given directly
+        result["scale"] = scale if scale != None else result["ids"]
+        results.append(result)
+
+    click.echo(f"\n{'IDs':>7} | {'Step':<24} | {'Time (s)':>9} | {'Per ID (us)':>11}")
+    click.echo(f"{'-'*8}+{'-'*26}+{'-'*11}+{'-'*12}")
+    for result in results:
+        for step, elapsed in result["timings"].items():
+            click.echo(f"{result['ids']:>7} | {step:<24} | {elapsed:>9.3f} | {elapsed / max(1, result['ids']) * 1e6:>11.2f}")
+
+    resultsData = {
+        "generated": time.time(),
+        "version": version("glass"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "runs": runs,
+        "workers": workers,
+        "results": results
+    }
+    if output == None:
+        output = f"benchmark-{datetime.now().strftime('%Y-%m-%d-%H%M%S')}.json"
+    with open(output, "w") as outputFile:
+        json.dump(resultsData, outputFile, indent=2)
+    click.echo(f"\nSaved the results to {output}")
+
+    if compare != None:
+        with open(compare, "r") as compareFile:
+            printComparison(results, json.load(compareFile))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import subprocess
+import sys
+
+import click
+
+# Checks how long `import glass.__main__` takes, which every command pays before it can do anything
+# Run with python -m benchmarks.startup, exits with 1 if glass starts too slowly
+
+# Modules only a few commands need, that must not be imported when glass starts
+lazyModules = [
+    "importlib.metadata",
+    "glass.backup",
+    "glass.completion",
+    "glass.configmanager",
+    "glass.daemon",
+    "glass.drivemanager",
+    "glass.idstore",
+    "glass.metacache",
+    "glass.project",
+    "glass.searchindex",
+    "glass.standin",
+    "glass.tools",
+    "glass.trace",
+    "glass.util",
+    "glass.watcher",
+    "click.testing",
+    "concurrent.futures",
+    "ctypes",
+    "sqlite3",
+]
+
+
+def measureImport(moduleName):
+    # Returns the cumulative import time of every module imported (in microseconds), keyed by name
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {moduleName}"],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    importTimes = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        selfTime, cumulativeTime, name = line[len("import time:"):].split("|")
+        importTimes[name.strip()] = int(cumulativeTime)
+    return importTimes
+
+
+def checkStartup(budget, runs):
+    # Returns the import times of the fastest run, and why glass failed the check (empty if it passed)
+    # The first import also writes the bytecode cache, so it isn't timed
+    measureImport("glass.__main__")
+    measurements = [measureImport("glass.__main__") for run in range(runs)]
+    fastest = min(measurements, key=lambda importTimes: importTimes["glass.__main__"])
+
+    failures = []
+    startupTime = fastest["glass.__main__"] / 1000
+    if startupTime > budget:
+        failures.append(f"Importing glass took {startupTime:.1f} ms, over the {budget:.1f} ms budget")
+
+    for moduleName in lazyModules:
+        if moduleName in fastest:
+            failures.append(f"{moduleName} is imported at startup ({fastest[moduleName] / 1000:.1f} ms)")
+    return fastest, failures
+
+
+@click.command()
+@click.option("budget", "--budget-ms", type=float, default=80, help="The longest glass is allowed to take to import, in milliseconds (default=80)")
+@click.option("runs", "--runs", type=int, default=5, help="The number of imports to time, the fastest is compared with the budget (default=5)")
+def main(budget, runs):
+    "Check that glass starts within its time budget without importing modules it doesn't need"
+    fastest, failures = checkStartup(budget, runs)
+    click.echo(f"glass.__main__ imported in {fastest['glass.__main__'] / 1000:.1f} ms (budget {budget:.1f} ms)")
+
+    slowest = sorted(
+        [(name, importTime) for name, importTime in fastest.items() if name.startswith("glass.")],
+        key=lambda pair: pair[1],
+        reverse=True
+    )
+    for name, importTime in slowest[:5]:
+        click.echo(f"{name:<24} | {importTime / 1000:>6.1f} ms")
+
+    for failure in failures:
+        click.echo(click.style(f"FAIL {failure}", fg="red"))
+    if len(failures) != 0:
+        sys.exit(1)
+    click.echo(click.style("PASS", fg="green"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import math
+import os
+
+# Builds fake Johnny Decimal data for the benchmarks, laid out the way glass writes it
+
+def getFanOut(count):
+    # The number of subfolders per category (and projects per subfolder) needed to reach count IDs
+    # There are always 9 areas with 9 categories each
+    return min(99, max(1, math.ceil(math.sqrt(count / 81))))
+
+def generateIDRecords(count, rootPath="C:\\glass"):
+    # Returns count records in the format of the ID files, keyed by ID text
+    # Every ID is followed by its descendants, the same order as the sorted ID files
+    records = {}
+    fanOut = getFanOut(count)
+
+    def addRecord(idText, idType, descriptor, path):
+        records[idText] = {
+            "numericalID": idText,
+            "path": path,
+            "type": idType,
+            "descriptor": descriptor,
+            "storageLocation": "A",
+            "revisionStage": "A",
+            "revisionCount": -1
+        }
+        return len(records) >= count
+
+    for areaDigit in range(1, 10):
+        areaID = f"{areaDigit}0"
+        areaPath = f"{rootPath}\\{areaID} - Area {areaDigit}"
+        if addRecord(areaID, "area", f"Area {areaDigit}", areaPath):
+            return records
+        for categoryDigit in range(1, 10):
+            categoryID = f"{areaDigit}{categoryDigit}"
+            categoryPath = f"{areaPath}\\{categoryID} - Category {categoryID}"
+            if addRecord(categoryID, "category", f"Category {categoryID}", categoryPath):
+                return records
+            for subfolderNumber in range(1, fanOut + 1):
+                subfolderID = f"{categoryID}.{subfolderNumber:02d}"
+                subfolderPath = f"{categoryPath}\\{subfolderID} - Subfolder {subfolderID}"
+                if addRecord(subfolderID, "subfolder", f"Subfolder {subfolderID}", subfolderPath):
+                    return records
+                for projectNumber in range(1, fanOut + 1):
+                    projectID = f"{subfolderID}.{projectNumber:02d}"
+                    if addRecord(projectID, "project", f"Project {projectID}", f"{subfolderPath}\\{projectID} - Project {projectID}"):
+                        return records
+    return records
+
+def getTreeShape(count, revisions=2):
+    # The number of each level of folder needed for a tree of roughly count IDs
+    # There are always 9 areas with 9 categories each, every project has the given number of revision folders
+    subfolders = min(99, max(1, round(math.sqrt(count / (81 * (1 + revisions))))))
+    return {"areas": 9, "categories": 9, "subfolders": subfolders, "projects": subfolders, "revisions": revisions}
+
+def getRevisionName(revisionIndex):
+    # Revisions count up through a stage before moving on to the next one, e.g. A1..A9, B1..
+    return f"{'ABCD'[revisionIndex // 9]}{revisionIndex % 9 + 1}"
+
+def generateTree(rootPath, areas=9, categories=9, subfolders=10, projects=10, revisions=2):
+    # Creates the folders of a Johnny Decimal root directory, returns the IDs of the projects
+    # Revision folders use the short form of their ID (e.g. "A1 - Revision A1"), as glass allows inside a project
+    projectIDs = []
+    os.makedirs(os.path.join(rootPath, ".glass", "data"), exist_ok=True)
+    os.makedirs(os.path.join(rootPath, ".glass", "logs"), exist_ok=True)
+    for areaDigit in range(1, areas + 1):
+        areaPath = os.path.join(rootPath, f"{areaDigit}0 - Area {areaDigit}")
+        for categoryDigit in range(1, categories + 1):
+            categoryID = f"{areaDigit}{categoryDigit}"
+            categoryPath = os.path.join(areaPath, f"{categoryID} - Category {categoryID}")
+            for subfolderNumber in range(1, subfolders + 1):
+                subfolderID = f"{categoryID}.{subfolderNumber:02d}"
+                subfolderPath = os.path.join(categoryPath, f"{subfolderID} - Subfolder {subfolderID}")
+                os.makedirs(subfolderPath)
+                for projectNumber in range(1, projects + 1):
+                    projectID = f"{subfolderID}.{projectNumber:02d}"
+                    projectPath = os.path.join(subfolderPath, f"{projectID} - Project {projectID}")
+                    os.mkdir(projectPath)
+                    for revisionIndex in range(revisions):
+                        revisionName = getRevisionName(revisionIndex)
+                        os.mkdir(os.path.join(projectPath, f"{revisionName} - Revision {revisionName}"))
+                    projectIDs.append(projectID)
+            if subfolders == 0:
+                os.makedirs(categoryPath)
+        if categories == 0:
+            os.makedirs(areaPath)
+    return projectIDs
+
+def generateVault(vaultPath, projectIDs):
+    # Writes an Obsidian metafile for every project, each one behind its latest revision so the
+    # background tasks have to update it
+    os.makedirs(vaultPath, exist_ok=True)
+    for projectID in projectIDs:
+        with open(os.path.join(vaultPath, f"Project {projectID}.md"), "w") as metaFile:
+            metaFile.write(
+                "---\n"
+                f"title: Project {projectID}\n"
+                "type: project\n"
+                "revision-stage: planning\n"
+                "revision-number: 1\n"
+                f"glassID: {projectID}\n"
+                "meta-override: false\n"
+                "---\n"
+                f"# Project {projectID}\n"
+                "### planning\n"
+                "#### A1\n"
+                "### working paper\n"
+                "### editing\n"
+                "### submission\n"
+            )
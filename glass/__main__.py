@@ -1,25 +1,81 @@
+import importlib
 import re
 import click
 import os
 import sys
-from importlib.metadata import version
+from .appinfo import version
 import json
-import ctypes
 
-from . import backup
-from . import configmanager
-from . import constants
-from . import drivemanager
-from . import project
-from . import standin
-from . import tools
-from . import util
+from . import appconfig
+from . import client
+
+# Only the modules every command needs are imported here, the rest are imported by the commands that use them
+
+
+class LazyGroup(click.Group):
+    # A click group whose subcommands are only imported when they're run (or listed in the help)
+    # so a command doesn't pay for importing the modules of every other command
+    def __init__(self, *args, lazySubcommands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Maps each command name to "module:attribute", relative to the glass package
+        self.lazySubcommands = lazySubcommands if lazySubcommands != None else {}
+
+    def list_commands(self, ctx):
+        return sorted(super().list_commands(ctx) + list(self.lazySubcommands.keys()))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.lazySubcommands:
+            moduleName, attributeName = self.lazySubcommands[cmd_name].split(":")
+            return getattr(importlib.import_module(moduleName, "glass"), attributeName)
+        return super().get_command(ctx, cmd_name)
+
+
+class AppContext(dict):
+    # The state shared by every command, the IDs are only loaded when a command first uses them
+    def __missing__(self, key):
+        if key != "ids":
+            raise KeyError(key)
+        from . import trace
+        from . import util
+        try: 
+            with trace.span("loadIDDict"):
+                idDict = util.loadIDDict(self["root"])
+        except Exception as e:
+            # The ID file is missing or unreadable, so rebuild it
+            util.doBackgroundTasks(
+                self["root"],
+                self["metafiles"],
+                self["excludeDirs"],
+                " ".join(sys.argv), 
+                version('glass'),
+                self["scanWorkers"],
+            )
+            idDict = util.loadIDDict(self["root"])
+        self["ids"] = idDict
+        return idDict
+
+
+@click.group(cls=LazyGroup, lazySubcommands={
+    "diagram": ".tools:generateMermaidDiagram",
+    "bg": ".tools:manuallyDoBackgroundTasks",
+    "about": ".tools:printAbout",
+    "serve": ".daemon:serveCommands",
+})
+@click.option("profile", "--profile", default=False, is_flag=True, help="Save a Chrome trace of where the command spent its time to .glass/logs")
+@click.pass_context
+def cli(ctx, profile):
+    # The resident daemon passes in its already loaded state
+    if ctx.obj != None:
+        return
 
+    if profile or os.environ.get("GLASS_TRACE", "") not in ["", "0"]:
+        from . import trace
+        if trace.startFromEnvironment() or profile:
+            if not trace.enabled:
+                trace.start()
+            startTracing(ctx)
 
-@click.group()
-@click.pass_context
-def cli(ctx):
-    appConstants = constants.CONSTANTS
+    appConstants = appconfig.loadConfig()
 
     if appConstants["root_path"] == "EMPTY" or appConstants["root_path"] == "":
         if "glass config build" in " ".join(sys.argv):
@@ -30,34 +86,43 @@ def cli(ctx):
         click.echo("Run " + click.style("glass config build", fg='blue') + " to activate the startup wizard")
         exit()
 
-    try: 
-        idDict = util.loadIDDict(appConstants["root_path"])
-    except Exception as e:
-        try:
-            util.doBackgroundTasks(
-                appConstants["root_path"],
-                appConstants["markdown_path"],
-                appConstants["excluded_folders"],
-                " ".join(sys.argv), 
-                version('glass'),
-            )
-        except KeyError:
-            ctx.invoke(configmanager.buildConfig)
-            return
+    try:
+        ctx.obj = AppContext({
+            "root":  appConstants["root_path"], 
+            "metafiles": appConstants["markdown_path"],
+            "templatePath": appConstants["project_template_path"],
+            "storageLocations": appConstants["storage_locations"],
+            "revisionLabels": appConstants["revision_labels"],
+            "excludeDirs": appConstants["excluded_folders"],
+            "scanWorkers": appconfig.getInt(appConstants, "scan_workers", 1),
+            "scanFreshness": appconfig.getInt(appConstants, "scan_freshness", 0)
+        })
+    except KeyError:
+        from . import configmanager
+        ctx.invoke(configmanager.buildConfig)
+        return
+
+
+def completeID(ctx, param, incomplete):
+    # Shell completion normally starts in completion.main, this only runs when click completes the arguments itself
+    from . import completion
+    return completion.completeID(ctx, param, incomplete)
+
 
-    ctx.obj = {
-        "root":  appConstants["root_path"], 
-        "ids": util.loadIDDict(appConstants["root_path"]),
-        "metafiles": appConstants["markdown_path"],
-        "templatePath": appConstants["project_template_path"],
-        "storageLocations": appConstants["storage_locations"],
-        "revisionLabels": appConstants["revision_labels"],
-        "excludeDirs": appConstants["excluded_folders"]
-    }
+def startTracing(ctx):
+    # Time the whole command, and save the trace once it has finished
+    from . import trace
+    commandSpan = trace.span(" ".join(["glass"] + sys.argv[1:]), "command")
+    commandSpan.__enter__()
+    def saveTrace():
+        commandSpan.__exit__(*sys.exc_info())
+        tracePath = trace.save(ctx.obj["root"] if ctx.obj != None else None)
+        click.echo(f"Saved the trace to {tracePath}", err=True)
+    ctx.call_on_close(saveTrace)
 
 
 @cli.command('open')
-@click.argument("id")
+@click.argument("id", shell_complete=completeID)
 @click.option("printPath", "--print", default=False, is_flag=True, help="Will display the path rather then opening it")
 @click.option("noBackground", "--no-background", default=False, is_flag=True, help="Disables running the background tasks after the path has been opened")
 @click.option("quiet", "--quiet", default=False, is_flag=True, help="Disables printing infromation to the terminal")
@@ -65,6 +130,9 @@ def cli(ctx):
 @click.pass_context
 def openID(ctx, id, printPath, noBackground, quiet, jsonOutput, doReccurance=True):
     """Open a specific id"""
+    from . import drivemanager
+    from . import tools
+    from . import util
     # If the command is called via URI, remove the URI header
     if 'glass://' in id:
         id = id[7:]
@@ -108,7 +176,7 @@ def openID(ctx, id, printPath, noBackground, quiet, jsonOutput, doReccurance=Tru
                     return
         else: # If the drive location is NOT "A"
             try:
-                alternateIDs = util.loadIDDict(ctx.obj["root"], searchID.storageLocation)
+                openPath = util.resolveID(ctx.obj["root"], id, searchID.storageLocation)
             except FileNotFoundError:
                 if jsonOutput:
                     click.echo(json.dumps({
@@ -119,8 +187,6 @@ def openID(ctx, id, printPath, noBackground, quiet, jsonOutput, doReccurance=Tru
                     return
                 else:
                     raise click.ClickException(f"There is no alternate ID file for the Storage Location provided {searchID.storageLocation}")
-            try:
-                openPath = alternateIDs[id].path
             except KeyError:
                 if jsonOutput:
                     click.echo(json.dumps({
@@ -133,6 +199,7 @@ def openID(ctx, id, printPath, noBackground, quiet, jsonOutput, doReccurance=Tru
                     raise click.ClickException(f"The Storage Location {ctx.obj['storageLocations'][searchID.storageLocation]} ({searchID.storageLocation}) does not contain the provided ID")
     if printPath == False and jsonOutput == False:
         if openPath[0:5] == "msg:\\":
+            import ctypes
             ctypes.windll.user32.MessageBoxW(0, openPath[5:], f"Path for {id}", 0)
             click.echo(openPath[5:])
         else:
@@ -154,23 +221,91 @@ def openID(ctx, id, printPath, noBackground, quiet, jsonOutput, doReccurance=Tru
         }))
 
     if not noBackground:
+        ctx.invoke(tools.manuallyDoBackgroundTasks, detach=True, ifStale=True)
+
+
+@cli.command("where")
+@click.argument("id", shell_complete=completeID)
+@click.option("jsonOutput", "--json", default=False, is_flag=True, help="Returns data in a JSON format")
+@click.pass_context
+def whereID(ctx, id, jsonOutput):
+    """Find the path of an ID on every storage location"""
+    from . import util
+    searchID = util.pathID(id, "", True)
+    if searchID.idType == "invalid":
+        raise click.ClickException(f"{id} is not a valid ID")
+    try:
+        paths = util.findID(ctx.obj["root"], searchID.idText)
+    except KeyError:
+        paths = {}
+
+    if jsonOutput:
+        click.echo(json.dumps({
+            "status": "success" if len(paths) != 0 else "failure",
+            "data": paths,
+            "reason ": "" if len(paths) != 0 else f"{id} is not in any storage location"
+        }))
+        return
+    if len(paths) == 0:
+        raise click.ClickException(f"{id} is not in any storage location")
+
+    click.echo(f"{'Storage':<20} | {'Storage Name':<20} | {'Path':<20}")
+    click.echo(f"{'-'*21}|{'-'*22}|{'-'*21}")
+    for storage, path in sorted(paths.items()):
+        click.echo(f"{storage:<20} | {ctx.obj['storageLocations'].get(storage, 'UNREGISTERED STORAGE'):<20} | {path}")
+
+
+@cli.command("search")
+@click.argument("text", nargs=-1, required=True)
+@click.option("limit", "--limit", default=20, type=click.IntRange(min=1), help="The maximum number of matches to show")
+@click.option("jsonOutput", "--json", default=False, is_flag=True, help="Returns data in a JSON format")
+@click.pass_context
+def searchIDs(ctx, text, limit, jsonOutput):
+    """Find IDs by their title"""
+    from . import searchindex
+    from . import tools
+    text = " ".join(text)
+    try:
+        matches = searchindex.search(os.path.join(ctx.obj["root"], ".glass/data"), text, limit)
+    except FileNotFoundError:
+        # If the IDs haven't been read yet
         ctx.invoke(tools.manuallyDoBackgroundTasks)
+        matches = searchindex.search(os.path.join(ctx.obj["root"], ".glass/data"), text, limit)
+
+    if jsonOutput:
+        click.echo(json.dumps({
+            "status": "success",
+            "data": matches,
+            "reason ": ""
+        }))
+        return
+    if len(matches) == 0:
+        click.echo(f"No IDs match {text}")
+        return
+
+    click.echo(f"{'ID':<20} | {'Title':<40} | {'Path':<20}")
+    click.echo(f"{'-'*21}|{'-'*42}|{'-'*21}")
+    for match in matches:
+        click.echo(f"{match['id']:<20} | {match['text']:<40} | {match['path']}")
 
 
 @cli.command("list")
-@click.option("id", "--id", help="The parent ID of the IDs to be displayed")
+@click.option("id", "--id", help="The parent ID of the IDs to be displayed", shell_complete=completeID)
 @click.option("jsonOutput", "--json", default=False, is_flag=True, help="Returns the data in a JSON format")
 @click.option("quiet", "--quiet", default=False, is_flag=True, help="Will not print anything")
 @click.pass_context
 def listIDs(ctx, id, jsonOutput, quiet):
     "List all the IDs in the file system"
+    from . import util
     idLevels = ['area', 'category', 'subfolder', 'project', 'child-project']
     titles = []
     searchDepth = 0
     idDict = ctx.obj['ids']
     if id != None: 
         searchID = util.pathID(id, "", True)
-        idDict = util.loadIDDict(ctx.obj["root"], searchID.storageLocation)
+        if searchID.idType != "invalid" and (searchID.storageLocation != "A" or idDict.idFilePath != None):
+            # Only the ID and its descendants are needed, unless every ID is already in memory
+            idDict = util.loadIDDict(ctx.obj["root"], searchID.storageLocation, searchID.numericalID[0] if searchID.idType == "area" else searchID.numericalID)
         if searchID.idType == "invalid":
             if len(id) == 1:
                 try:
@@ -184,19 +319,18 @@ def listIDs(ctx, id, jsonOutput, quiet):
         else:
             searchDepth = idLevels.index(searchID.idType)
     outputText = ""
-    for thisIDText in idDict.keys():
-        thisID = idDict[thisIDText]
+    if id == None:
+        listedIDs = idDict.values()
+    else:
+        # Only the IDs within the parent ID
+        listedIDs = idDict.tree.walk(searchID.numericalID)
+
+    for thisID in listedIDs:
+        if thisID.idType not in idLevels or thisID.idType == "child-project":
+            continue
         idDepth = idLevels.index(thisID.idType)
-        # Check if ID within parent ID
-        try:
-            if id == None and thisID.idType != "child-project":
-                titles.append(f"{thisID.idText} - {thisID.descriptor}")
-                outputText += f"{'| ' * (idDepth - searchDepth)}{thisID.idText} - {thisID.descriptor}\n"
-            if thisID.getHigherLevel(idLevels[searchDepth]) == searchID.numericalID and thisID.idType != "child-project":    
-                titles.append(f"{thisID.idText} - {thisID.descriptor}")
-                outputText += f"{'| ' * (idDepth - searchDepth)}{thisID.idText} - {thisID.descriptor}\n"  
-        except Exception as E:
-            pass
+        titles.append(f"{thisID.idText} - {thisID.descriptor}")
+        outputText += f"{'| ' * (idDepth - searchDepth)}{thisID.idText} - {thisID.descriptor}\n"
     
     if not (jsonOutput or quiet):
         click.echo(outputText)
@@ -213,6 +347,9 @@ def listIDs(ctx, id, jsonOutput, quiet):
 @click.pass_context
 def createNewID(ctx, id, title, noIncrement, force, doReccurance=True):
     "Generate a new ID and Associated Folder"
+    from . import drivemanager
+    from . import tools
+    from . import util
 
 
     numbers = re.compile("[0-9]")
@@ -222,9 +359,7 @@ def createNewID(ctx, id, title, noIncrement, force, doReccurance=True):
         childrenCount = 0
         try:
             idDict = util.loadIDDict(ctx.obj["root"], id)
-            for idText in idDict:
-                if idDict[idText].idType == "area":
-                    childrenCount += 1
+            childrenCount = len([areaNode for areaNode in idDict.tree.levels["area"] if areaNode.id != None])
         except FileNotFoundError:
             # If the storage area doesn't exist, create it new
             util.exportIDlist([], os.path.join(ctx.obj["root"], f".glass/data/IDPaths{id[0]}.json"))
@@ -325,21 +460,8 @@ def createNewID(ctx, id, title, noIncrement, force, doReccurance=True):
                     return
                 return
         
-        # Find number of child IDs
-        childrenCount = 0
-        idTypes = ["area", "category", "subfolder", "project", "project-child"]
-        if isPrimaryStorage:
-            searchID = id
-        else:
-            searchID = id[1:]
-        for idText in idDict:
-            thisID = idDict[idText]
-            try:
-                if searchID == thisID.getHigherLevel(parentID.idType):  # If the ID is a child of the parentID
-                    if idTypes.index(thisID.idType) - idTypes.index(parentID.idType) == 1: # If the child ID is a DIRECT child of the parentID
-                        childrenCount += 1
-            except Exception as e:
-                pass
+        # Find number of direct child IDs
+        childrenCount = util.countChildren(ctx.obj["root"], parentID.numericalID, "A" if isPrimaryStorage else id[0])
         
         if noIncrement:
             newID = id
@@ -382,7 +504,8 @@ def createNewID(ctx, id, title, noIncrement, force, doReccurance=True):
                 return
         
         if isPrimaryStorage:
-            os.mkdir(f"{parentID.path}/{newID} - {title}")
+            # The paths of IDs are stored with backslashes, which are turned back into this platform's separator
+            os.mkdir(os.path.join(parentID.path.replace("\\", os.sep), f"{newID} - {title}"))
         else:
             # Ensure the storage System is registered
             # Ensure the file system exists
@@ -399,7 +522,8 @@ def createNewID(ctx, id, title, noIncrement, force, doReccurance=True):
             util.exportIDlist(newIDList, os.path.join(ctx.obj["root"], f".glass/data/IDPaths{id[0]}.json"))
         click.echo("Created new ID!")
 
-    ctx.invoke(tools.manuallyDoBackgroundTasks)
+    # The next command counts the children of the parent from the index, so the new ID is scanned in before returning
+    ctx.invoke(tools.manuallyDoBackgroundTasks, afterChange=True)
 
 
 @cli.command("modify")
@@ -410,6 +534,7 @@ def createNewID(ctx, id, title, noIncrement, force, doReccurance=True):
 @click.pass_context
 def modifyID(ctx, id, parameter, newValue, force):
     "Modify the path or metadata of a specific ID"
+    from . import util
     selectedID = util.pathID(id, "", True)
     if selectedID.storageLocation == "A":
         click.echo(click.style("WARNING, the ID you input is within the Primary file system, changes will be overwritten by the background tasks", fg="yellow"))
@@ -444,57 +569,66 @@ def modifyID(ctx, id, parameter, newValue, force):
     click.echo("Completed!")
 
 # Projects Commands
-@cli.group("project")
+@cli.group("project", cls=LazyGroup, lazySubcommands={
+    "view": ".project:viewProj",
+    "new": ".project:newProj",
+    "repair": ".project:repairProj",
+})
 @click.pass_context
 def projectCLI(ctx):
     """Manage Projects tracked by Looking Glass"""
+    # The daemon keeps the list of projects in memory
+    if "projects" in ctx.obj:
+        return
+
     # Generate list of projects 
+    from . import metacache
+    from . import project
     projList = [pair[1] for pair in ctx.obj['ids'].items()]
-    validProjectsList, invalidProjectsList = project.generateProjectList(projList, ctx.obj['metafiles'])
+    validProjectsList, invalidProjectsList = project.generateProjectList(projList, ctx.obj['metafiles'], ctx.obj['ids'].tree, metacache.getCachePath(ctx.obj['root']))
     ctx.obj['projects'] = {"valid": validProjectsList, "invalid": invalidProjectsList}
 
 
-cli.add_command(tools.generateMermaidDiagram)
-cli.add_command(tools.manuallyDoBackgroundTasks)
-cli.add_command(tools.printAbout)
-
-projectCLI.add_command(project.viewProj)
-projectCLI.add_command(project.newProj)
-projectCLI.add_command(project.repairProj)
-
-@cli.group("standin")
+@cli.group("standin", cls=LazyGroup, lazySubcommands={
+    "new": ".standin:newStandIn",
+    "modify": ".standin:modifyStandIn",
+    "view": ".standin:viewStandIn",
+    "open": ".standin:openStandIn",
+})
 def standInCLI():
     """Manage Stand In Files in the file system"""
     
 
-standInCLI.add_command(standin.newStandIn)
-standInCLI.add_command(standin.modifyStandIn)
-standInCLI.add_command(standin.viewStandIn)
-standInCLI.add_command(standin.openStandIn)
-
-@cli.group("config")
+@cli.group("config", cls=LazyGroup, lazySubcommands={
+    "view": ".configmanager:viewConfig",
+    "modify": ".configmanager:modifyConfig",
+    "build": ".configmanager:buildConfig",
+})
 def config():
     """Manage App Config"""
 
-config.add_command(configmanager.viewConfig)
-config.add_command(configmanager.modifyConfig)
-config.add_command(configmanager.buildConfig)
-
-@cli.group("backup")
+@cli.group("backup", cls=LazyGroup, lazySubcommands={
+    "encode": ".backup:generateMetaData",
+    "view": ".backup:viewBackups",
+})
 def backupManager():
     """Create and track backups"""
 
-backupManager.add_command(backup.generateMetaData)
-backupManager.add_command(backup.viewBackups)
-
-@cli.group("drive")
+@cli.group("drive", cls=LazyGroup, lazySubcommands={
+    "new": ".drivemanager:newDrive",
+    "modify": ".drivemanager:modifyDriveData",
+    "view": ".drivemanager:viewDrives",
+    "duplicate": ".tools:duplicateStorage",
+})
 def driveManager():
     """Create and Manage drives"""
 
-driveManager.add_command(drivemanager.newDrive)
-driveManager.add_command(drivemanager.modifyDriveData)
-driveManager.add_command(drivemanager.viewDrives)
-driveManager.add_command(tools.duplicateStorage)
+def main():
+    # Let a running daemon answer the command if it can, otherwise run it in this process
+    exitCode = client.forwardCommand(sys.argv[1:])
+    if exitCode != None:
+        sys.exit(exitCode)
+    cli()
 
 if __name__ == '__main__':
-    cli()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,91 @@
+import json
+import os
+
+# The app config is a JSON file in the user's config directory, so the installed package is never rewritten
+# GLASS_CONFIG can point at a different config file
+# This module is imported before every command, so it must stay free of click and the rest of glass
+
+# Values used when a key is missing from an older config file
+configDefaults = {"scan_workers": "8", "scan_freshness": "30", "id_store": "json", "pretty_index": "false"}
+
+# The last config that was read, with the file's (path, mtime, size) when it was read
+cachedConfig = None
+cachedSignature = None
+
+def getConfigPath():
+    if os.environ.get("GLASS_CONFIG"):
+        return os.environ["GLASS_CONFIG"]
+    if os.name == "nt":
+        configDir = os.environ.get("APPDATA", os.path.expanduser("~\\AppData\\Roaming"))
+    else:
+        configDir = os.environ.get("XDG_CONFIG_HOME", os.path.expanduser("~/.config"))
+    return os.path.join(configDir, "glass", "config.json")
+
+def getSignature(configPath):
+    try:
+        fileStats = os.stat(configPath)
+    except FileNotFoundError:
+        return None
+    return configPath, fileStats.st_mtime_ns, fileStats.st_size
+
+def migrateConstants():
+    # Older versions stored the config in a generated glass/constants.py module
+    # Returns its values, or None if there isn't one
+    constantsPath = os.path.join(os.path.dirname(__file__), "constants.py")
+    try:
+        with open(constantsPath, "r", encoding="utf-8") as constantsFile:
+            source = constantsFile.read()
+    except FileNotFoundError:
+        return None
+    # The module only ever contained a single dictionary literal
+    import ast
+    return ast.literal_eval(source.split("=", 1)[1].strip())
+
+def loadConfig():
+    # Returns the app config, only reading the file again if it has changed since the last call
+    # A missing config has an EMPTY root path, which makes the CLI ask for `glass config build`
+    global cachedConfig, cachedSignature
+    configPath = getConfigPath()
+    signature = getSignature(configPath)
+    if signature != None and signature == cachedSignature:
+        return cachedConfig
+
+    if signature == None:
+        config = migrateConstants()
+        if config == None:
+            return {"root_path": "EMPTY"}
+        saveConfig(config)
+        return config
+
+    with open(configPath, "r", encoding="utf-8") as configFile:
+        config = json.load(configFile)
+    cachedConfig, cachedSignature = config, signature
+    return config
+
+def saveConfig(config):
+    # Writes the whole config, replacing the old file in one step so a command never reads half of it
+    global cachedConfig, cachedSignature
+    configPath = getConfigPath()
+    os.makedirs(os.path.dirname(configPath), exist_ok=True)
+    tempPath = configPath + ".tmp"
+    with open(tempPath, "w", encoding="utf-8") as configFile:
+        json.dump(config, configFile, indent=4)
+    os.replace(tempPath, configPath)
+    cachedConfig, cachedSignature = config, getSignature(configPath)
+
+def getValue(config, key):
+    # Read a config value, falling back to its default for keys added after the config was built
+    return config.get(key, configDefaults.get(key))
+
+def getInt(config, key, minimum=0):
+    # Read a whole number, falling back to its default if the config holds anything else (e.g. an edit by hand)
+    try:
+        value = int(getValue(config, key))
+    except (TypeError, ValueError):
+        return int(configDefaults[key])
+    return value if value >= minimum else int(configDefaults[key])
+
+def getChoice(config, key, choices):
+    # Read a value that must be one of choices, falling back to its default otherwise
+    value = getValue(config, key)
+    return value if value in choices else configDefaults[key]
@@ -0,0 +1,8 @@
+import functools
+
+# importlib.metadata takes longer to import than most of glass, so it's only loaded when the version is shown
+
+@functools.lru_cache(maxsize=None)
+def version(distributionName):
+    from importlib import metadata
+    return metadata.version(distributionName)
@@ -1,5 +1,5 @@
 from datetime import datetime
-from importlib.metadata import version
+from .appinfo import version
 import json
 import os
 import click
@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+import socket
+import sys
+import tempfile
+
+# This module is imported before every command, so it must stay free of click and the rest of glass (apart from appconfig)
+
+def isForwardable(argv):
+    # Only read-only commands that can be answered from the daemon's in-memory state are forwarded
+    if len(argv) == 0 or "--help" in argv:
+        return False
+    if argv[0] == "list":
+        return True
+    if argv[0] == "open":
+        return "--print" in argv or "--json" in argv
+    return argv[:2] == ["project", "view"]
+
+def runtimePath(rootPath, extension):
+    # The daemon's socket lives on the local machine, even when the root directory is on network storage
+    name = "glass-" + hashlib.sha1(os.path.abspath(rootPath).encode("utf-8")).hexdigest()[:12]
+    runtimeDir = os.environ.get("XDG_RUNTIME_DIR", tempfile.gettempdir())
+    return os.path.join(runtimeDir, name + extension)
+
+def serverAddress(rootPath):
+    # Returns the socket family, address and access token of the daemon for a root directory
+    # Unix sockets are used where available, otherwise a loopback TCP port recorded in a file
+    if hasattr(socket, "AF_UNIX"):
+        return socket.AF_UNIX, runtimePath(rootPath, ".sock"), ""
+
+    with open(runtimePath(rootPath, ".json"), "r", encoding="utf-8") as infoFile:
+        serverInfo = json.load(infoFile)
+    return socket.AF_INET, ("127.0.0.1", serverInfo["port"]), serverInfo["token"]
+
+def sendRequest(rootPath, request, timeout=60):
+    # Send a single request to the daemon and wait for its response
+    family, address, token = serverAddress(rootPath)
+    request["token"] = token
+    with socket.socket(family, socket.SOCK_STREAM) as connection:
+        connection.settimeout(timeout)
+        connection.connect(address)
+        connection.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with connection.makefile("rb") as responseFile:
+            return json.loads(responseFile.readline())
+
+def forwardCommand(argv):
+    # Run a command on the resident daemon if one is running
+    # Returns the command's exit code, or None if the command has to be run locally
+    # A traced command has to run in this process for its spans to be recorded
+    if os.environ.get("GLASS_NO_DAEMON") or os.environ.get("GLASS_TRACE") or not isForwardable(argv):
+        return None
+
+    try:
+        from . import appconfig
+        rootPath = appconfig.loadConfig()["root_path"]
+    except (OSError, ValueError, SyntaxError, KeyError):
+        return None
+
+    try:
+        response = sendRequest(rootPath, {"argv": argv, "color": sys.stdout.isatty()})
+    except (OSError, ValueError):
+        # No daemon is running (or it stopped responding), so fall back to running locally
+        return None
+
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    return response["exitCode"]
@@ -0,0 +1,157 @@
+import os
+import shlex
+import sys
+
+from . import appconfig
+
+# Shell completion of IDs, answered from .glass/data/completion.txt which the background tasks write
+# The cache has a line per ID, "idText, type, descriptor" separated by tabs and sorted by ID text
+# The glass script starts here, so completing an ID never imports click or reads the ID files
+# This module must stay free of click and the rest of glass (apart from appconfig)
+cacheName = "completion.txt"
+shellFormats = {"bash_complete": "bash", "zsh_complete": "zsh", "fish_complete": "fish"}
+
+def getCachePath(rootPath):
+    return os.path.join(rootPath, ".glass/data", cacheName)
+
+def getLine(idText, record):
+    descriptor = str(record["descriptor"] if record["descriptor"] != None else "").replace("\t", " ").replace("\n", " ")
+    return f"{idText}\t{record['type']}\t{descriptor}\n"
+
+def writeCache(rootPath, records):
+    # records are (ID text, record) pairs from every storage location
+    from . import idstore
+    lines = [getLine(idText, record) for idText, record in records]
+    lines.sort()
+    idstore.writeAtomic(getCachePath(rootPath), lines)
+
+def updateCache(rootPath, changedRecords):
+    # Replaces the lines of the changed IDs (keyed by ID text, None removes the ID), without reading any ID files
+    from . import idstore
+    with open(getCachePath(rootPath), "r", encoding="utf-8") as cacheFile:
+        lines = [line for line in cacheFile if line.split("\t", 1)[0] not in changedRecords]
+    lines += [getLine(idText, record) for idText, record in changedRecords.items() if record != None]
+    lines.sort()
+    idstore.writeAtomic(getCachePath(rootPath), lines)
+
+def findFirstLine(data, prefix):
+    # Binary search of the sorted lines for the offset of the first one that isn't before prefix
+    low, high = 0, len(data)
+    while low < high:
+        lineStart = data.rfind(b"\n", 0, (low + high) // 2) + 1
+        lineEnd = data.find(b"\n", lineStart)
+        if data[lineStart:lineEnd] < prefix:
+            low = lineEnd + 1
+        else:
+            high = lineStart
+    return low
+
+def getCandidates(rootPath, incomplete, projectsOnly=False):
+    # Returns the (ID text, descriptor) of the cached IDs starting with incomplete
+    # Raises FileNotFoundError if the cache hasn't been written yet
+    with open(getCachePath(rootPath), "rb") as cacheFile:
+        data = cacheFile.read()
+    # The lines are sorted (UTF-8 keeps the order of the text), so the matches are the run of lines between the first
+    # one that isn't before incomplete and the first one after every line starting with it (0xff is never in UTF-8)
+    prefix = incomplete.encode("utf-8")
+    matchingLines = data[findFirstLine(data, prefix):findFirstLine(data, prefix + b"\xff")].decode("utf-8")
+    candidates = []
+    for line in matchingLines.split("\n")[:-1]:
+        idText, idType, descriptor = line.split("\t")
+        if projectsOnly and idType != "project":
+            continue
+        candidates.append((idText, descriptor))
+    return candidates
+
+def splitArgs(string):
+    # The same as click's split_arg_string, a missing closing quote or incomplete escape uses the partial word
+    lex = shlex.shlex(string, posix=True)
+    lex.whitespace_split = True
+    lex.commenters = ""
+    words = []
+    try:
+        words.extend(lex)
+    except ValueError:
+        words.append(lex.token)
+    return words
+
+def getCompletionArgs(shell):
+    # The words before the one being completed (without the program name), and the word being completed
+    words = splitArgs(os.environ["COMP_WORDS"])
+    if shell == "fish":
+        incomplete = os.environ["COMP_CWORD"]
+        if incomplete:
+            incomplete = splitArgs(incomplete)[0]
+        args = words[1:]
+        if incomplete and args and args[-1] == incomplete:
+            args.pop()
+        return args, incomplete
+    wordIndex = int(os.environ["COMP_CWORD"])
+    return words[1:wordIndex], words[wordIndex] if wordIndex < len(words) else ""
+
+def getIDArgument(args, incomplete):
+    # Returns whether the word being completed is an ID and whether it has to be a project,
+    # or None if the completion should be left to click
+    if incomplete.startswith("-"):
+        return None
+    # Every other option of these commands is a flag, so any earlier word without a dash is the ID
+    positionalArgs = [arg for arg in args if not arg.startswith("-")]
+    if positionalArgs == ["open"] or positionalArgs == ["where"]:
+        return False
+    if positionalArgs == ["project", "view"]:
+        return True
+    if len(args) != 0 and args[0] == "list" and args[-1] == "--id":
+        return False
+    return None
+
+def formatCompletion(shell, value, descriptor):
+    # The formats click's completion scripts expect
+    if shell == "bash":
+        return f"plain,{value}"
+    if shell == "zsh":
+        if descriptor == "":
+            return f"plain\n{value}\n_"
+        escapedValue = value.replace(":", "\\:")
+        return f"plain\n{escapedValue}\n{descriptor}"
+    if descriptor == "":
+        return f"plain,{value}"
+    return f"plain,{value}\t{descriptor}"
+
+def completeFromCache():
+    # Answers the completion of an ID argument from the cache, returns False if click needs to handle it
+    shell = shellFormats.get(os.environ.get("_GLASS_COMPLETE", ""))
+    if shell == None:
+        return False
+    try:
+        args, incomplete = getCompletionArgs(shell)
+        projectsOnly = getIDArgument(args, incomplete)
+        if projectsOnly == None:
+            return False
+        candidates = getCandidates(appconfig.loadConfig()["root_path"], incomplete, projectsOnly)
+    except (KeyError, OSError, ValueError):
+        return False
+
+    sys.stdout.write("\n".join(formatCompletion(shell, value, descriptor) for value, descriptor in candidates) + "\n")
+    return True
+
+def getCompletionItems(incomplete, projectsOnly):
+    from click.shell_completion import CompletionItem
+    try:
+        candidates = getCandidates(appconfig.loadConfig()["root_path"], incomplete, projectsOnly)
+    except (KeyError, OSError, ValueError):
+        return []
+    return [CompletionItem(value, help=descriptor if descriptor != "" else None) for value, descriptor in candidates]
+
+# shell_complete callbacks for ID parameters, used when click handles the completion itself
+def completeID(ctx, param, incomplete):
+    return getCompletionItems(incomplete, False)
+
+def completeProjectID(ctx, param, incomplete):
+    return getCompletionItems(incomplete, True)
+
+def main():
+    # The glass script
+    if completeFromCache():
+        return
+    from .__main__ import main as glassMain
+    glassMain()
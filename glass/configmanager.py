@@ -1,19 +1,23 @@
-from importlib.metadata import version
+from .appinfo import version
 import os
 import time
 import click
-from . import constants
+from . import appconfig
+from . import idstore
 import json
 
-configKeys = ["root", "meta", "template", "excluded"]
-keyLabels = {"root": "root_path", "meta":"markdown_path", "template": "project_template_path", "excluded": "excluded_folders"}
+configKeys = ["root", "meta", "template", "excluded", "workers", "freshness", "store", "pretty"]
+keyLabels = {"root": "root_path", "meta":"markdown_path", "template": "project_template_path", "excluded": "excluded_folders", "workers": "scan_workers", "freshness": "scan_freshness", "store": "id_store", "pretty": "pretty_index"}
+configDefaults = appconfig.configDefaults
+# The settings that aren't paths or folder names, and the values they accept (checked the same way by modify)
+keyTypes = {"workers": click.IntRange(1), "freshness": click.IntRange(0), "store": click.Choice(idstore.engines), "pretty": bool}
 
 @click.command("view")
 @click.option("doJson", "--json", is_flag=True, default=False, help="Returns the data in a JSON format rather then human-readable")
 @click.pass_context
 def viewConfig(ctx, doJson):
     "View the config values"
-    vals = constants.CONSTANTS
+    vals = appconfig.loadConfig()
     if not doJson:
         click.echo("Glass Application Config")
         click.echo(f"{'App Version':<21} | {version('glass')}")
@@ -21,6 +25,10 @@ def viewConfig(ctx, doJson):
         click.echo(f"{'Project Metadata Path':<21} | {vals['markdown_path']}")
         click.echo(f"{'Project Template Path':<21} | {vals['project_template_path']}")
         click.echo(f"{'Excluded Folders':<21} | {', '.join(vals['excluded_folders'])}")
+        click.echo(f"{'Scan Workers':<21} | {vals.get('scan_workers', configDefaults['scan_workers'])}")
+        click.echo(f"{'Scan Freshness (s)':<21} | {vals.get('scan_freshness', configDefaults['scan_freshness'])}")
+        click.echo(f"{'ID Store':<21} | {vals.get('id_store', configDefaults['id_store'])}")
+        click.echo(f"{'Pretty ID Files':<21} | {vals.get('pretty_index', configDefaults['pretty_index'])}")
     if doJson:
         click.echo(json.dumps(vals))
 
@@ -34,41 +42,55 @@ def modifyConfig(ctx, key, newval, force, doJson):
     "Modify key-value pair of app config"
     newval = newval.replace("\\", "/")
     actualKey = keyLabels[key]
+    if key == "workers" and (not newval.isdigit() or int(newval) < 1):
+        raise click.ClickException("The number of workers must be a whole number above 0")
+    if key == "freshness" and not newval.isdigit():
+        raise click.ClickException("The freshness window must be a whole number of seconds")
+    if key == "store" and newval not in idstore.engines:
+        raise click.ClickException(f"The ID store must be one of {', '.join(idstore.engines)}")
+    if key == "pretty" and newval not in ["true", "false"]:
+        raise click.ClickException("Pretty ID files must be either true or false")
 
     if not force:
         click.echo(f"About to update value {key}")
-        click.echo(f"From {click.style(constants.CONSTANTS[actualKey], fg='blue')} to {click.style(newval, fg='blue')}")
+        click.echo(f"From {click.style(appconfig.getValue(appconfig.loadConfig(), actualKey), fg='blue')} to {click.style(newval, fg='blue')}")
         if not click.confirm("Are you sure?"):
             click.echo("Canceled")
             return
     
 
     if not doJson:
-        with open(f"{__file__.replace('configmanager.py', '')}constants.py", "w") as configFile:
-            constantsDict = constants.CONSTANTS
-            constantsDict[actualKey] = newval
-
-            if key == "excluded":
-                constantsDict["excluded_folders"] = constantsDict["excluded_folders"].split(",")
-
-                newExcludedFolders = []
-                for val in constantsDict["excluded_folders"]:
-                    newExcludedFolders.append(val.strip().lower())
-                constantsDict["excluded_folders"] = newExcludedFolders
-
-            configFile.write("CONSTANTS = {\n")
-            for subKey in constantsDict:
-                if subKey == "excluded_folders":
-                    configFile.write(f'    "{subKey}": {constantsDict[subKey]},\n')
-                elif subKey == "storage_locations" or subKey == "revision_labels":
-                    configFile.write(f'    "{subKey}": {constantsDict[subKey]},\n')
-                else:
-                    configFile.write(f'    "{subKey}": "{constantsDict[subKey]}",\n')
-            configFile.write("}")
+        configDict = dict(appconfig.loadConfig())
+        configDict[actualKey] = newval
+
+        if key == "excluded":
+            configDict["excluded_folders"] = configDict["excluded_folders"].split(",")
+
+            newExcludedFolders = []
+            for val in configDict["excluded_folders"]:
+                newExcludedFolders.append(val.strip().lower())
+            configDict["excluded_folders"] = newExcludedFolders
+
+        appconfig.saveConfig(configDict)
         click.echo("Completed")
     else:
         return {"key": actualKey, "value": newval}
 
+def parseDefault(key):
+    # The default of a typed setting, as the type click prompts with
+    defaultValue = configDefaults[keyLabels[key]]
+    if keyTypes[key] == bool:
+        return defaultValue == "true"
+    if isinstance(keyTypes[key], click.IntRange):
+        return int(defaultValue)
+    return defaultValue
+
+def formatValue(value):
+    # Settings are stored as text, the same as modify saves them
+    if type(value) == bool:
+        return "true" if value else "false"
+    return str(value)
+
 @click.command("build")
 @click.pass_context
 def buildConfig(ctx):
@@ -77,16 +99,22 @@ def buildConfig(ctx):
         "root": "The path to the root directory of the filesystem", 
         "meta": "The path to the Obsidian Projects Folder, All metafiles will be created at this path", 
         "template": "The path to the template file for an Obsidian Project", 
-        "excluded": "A list of folder names that are to be excluded"
-
+        "excluded": "A list of folder names that are to be excluded",
+        "workers": "The number of folders that are read at the same time when scanning the root directory",
+        "freshness": "Automatic scans are skipped if the IDs were updated less than this many seconds ago (0 to always scan)",
+        "store": "How the IDs are stored, json (one file per area) or sqlite (a single indexed database)",
+        "pretty": "Whether the json ID files are indented so they are easier to read by hand (true or false)"
     }
     click.echo("Welcome to Looking Glass, Please setup a few configuration variables")
     dataDict = {}
     for key in configKeys:
         click.echo(f"{click.style(key, fg='blue')} - {descriptions[key]}")
-        newValue = click.prompt("What should this value be?", type=str)
-        newValue = newValue.replace("\\", "/")
-        dataDict[keyLabels[key]] = newValue
+        if key in keyTypes:
+            newValue = click.prompt("What should this value be?", type=keyTypes[key], default=parseDefault(key))
+            dataDict[keyLabels[key]] = formatValue(newValue)
+        else:
+            newValue = click.prompt("What should this value be?", type=str, default=configDefaults.get(keyLabels[key]))
+            dataDict[keyLabels[key]] = newValue.replace("\\", "/")
 
     click.echo("\n")
     click.echo(f"{'Attribute':<20} | {'Value':<20}")
@@ -107,17 +135,9 @@ def buildConfig(ctx):
         click.echo("Canceled")
         return
     
-    # Write the config settings to configManager
-    with open(f"{__file__.replace('configmanager.py', '')}constants.py", "w") as configFile:
-        configFile.write("CONSTANTS = {\n")
-        for subKey in dataDict.keys():
-            if subKey == "excluded_folders":
-                configFile.write(f'    "{subKey}": {dataDict[subKey]},\n')
-            elif subKey == "storage_locations" or subKey == "revision_labels":
-                configFile.write(f'    "{subKey}": {dataDict[subKey]},\n')
-            else:
-                configFile.write(f'    "{subKey}": "{dataDict[subKey]}",\n')
-        configFile.write("}")
+    # Write the config settings to the config file
+    appconfig.saveConfig(dataDict)
+    click.echo(f"Saved the config to {appconfig.getConfigPath()}")
 
     # Create the necessary files into the .glass folder
     os.mkdir(f"{dataDict['root_path']}/.glass")
@@ -0,0 +1,243 @@
+from .appinfo import version
+import io
+import json
+import os
+import secrets
+import socket
+import sys
+import threading
+import traceback
+
+import click
+
+from . import client
+from . import drivemanager
+from . import metacache
+from . import project
+from . import util
+
+
+class ThreadOutput:
+    # Stands in for sys.stdout or sys.stderr while the daemon runs, so a forwarded command's output is captured by the
+    # thread running it, while every other thread (like the background tasks) still writes to the real stream
+    # It's installed once rather than swapped for each command, which wouldn't be safe alongside the other threads
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+        # click writes to any text stream that claims a usable encoding directly
+        self.encoding = "utf-8"
+        self.errors = "strict"
+
+    def capture(self):
+        # Send this thread's output to a new buffer, which is returned
+        self.local.buffer = io.StringIO()
+        return self.local.buffer
+
+    def release(self):
+        self.local.buffer = None
+
+    def getStream(self):
+        buffer = getattr(self.local, "buffer", None)
+        return buffer if buffer != None else self.stream
+
+    def write(self, text):
+        return self.getStream().write(text)
+
+    def flush(self):
+        self.getStream().flush()
+
+    def isatty(self):
+        return self.getStream().isatty()
+
+    def __getattr__(self, name):
+        return getattr(self.getStream(), name)
+
+
+class GlassDaemon:
+    def __init__(self, cli, ctxObj):
+        # Keeps the IDs, drives and projects in memory and runs forwarded commands against them
+        self.cli = cli
+        self.obj = dict(ctxObj)
+        self.root = ctxObj["root"]
+        self.loadedMTimes = None
+        self.loadedVault = None
+        self.backgroundThread = None
+        self.refresh()
+        self.refreshProjects()
+
+    def getMTimes(self):
+        mTimes = []
+        for fileName in ["IDPaths.json", "drives.json"]:
+            try:
+                mTimes.append(os.stat(os.path.join(self.root, ".glass/data", fileName)).st_mtime_ns)
+            except FileNotFoundError:
+                mTimes.append(None)
+        return mTimes
+
+    def getVaultSignature(self):
+        # The path, mtime and size of every note in the vault
+        # Notes are usually edited in place, which doesn't change the mtime of their directory, so each one is stat'ed
+        return hash(tuple((filePath, fileStat.st_mtime_ns, fileStat.st_size) for filePath, fileStat in project.walkMarkdownFiles(self.obj["metafiles"])))
+
+    def refresh(self):
+        # Reload the cached data if the background tasks (or another command) have rewritten it
+        mTimes = self.getMTimes()
+        if mTimes == self.loadedMTimes:
+            return
+
+        self.obj["ids"] = util.loadIDDict(self.root)
+        self.obj["drives"] = drivemanager.loadDrives(self.root)
+        self.loadedMTimes = mTimes
+        # The projects are built from the IDs, so they have to be rebuilt as well
+        self.loadedVault = None
+
+    def refreshProjects(self):
+        # Rebuild the projects if the IDs or any metafile changed, only the changed notes are read again (see metacache)
+        vaultSignature = self.getVaultSignature()
+        if vaultSignature == self.loadedVault:
+            return
+
+        validProjects, invalidProjects = project.generateProjectList(
+            list(self.obj["ids"].values()),
+            self.obj["metafiles"],
+            self.obj["ids"].tree,
+            metacache.getCachePath(self.root)
+        )
+        self.obj["projects"] = {"valid": validProjects, "invalid": invalidProjects}
+        self.loadedVault = vaultSignature
+
+    def runBackgroundTasks(self):
+        # Run the background tasks after an open, without delaying the response
+        if self.backgroundThread != None and self.backgroundThread.is_alive():
+            return
+        self.backgroundThread = threading.Thread(
+            target=util.doBackgroundTasks,
+            args=(
+                self.root,
+                self.obj["metafiles"],
+                self.obj["excludeDirs"],
+                "glass serve",
+                version('glass'),
+                self.obj["scanWorkers"],
+            ),
+            kwargs={"freshness": self.obj["scanFreshness"], "wait": False},
+            daemon=True
+        )
+        self.backgroundThread.start()
+
+    def runCommand(self, argv, color):
+        self.refresh()
+        if argv[0] == "project":
+            self.refreshProjects()
+
+        # open normally runs the background tasks before returning, the daemon runs them afterwards instead
+        runBackground = argv[0] == "open" and "--no-background" not in argv
+        if runBackground:
+            argv = argv + ["--no-background"]
+
+        stdout, stderr = sys.stdout.capture(), sys.stderr.capture()
+        exitCode = 0
+        try:
+            # Each command gets its own copy of the context so it can't modify the cached state
+            # Without standalone mode click leaves the errors to be reported here, the same way it would have
+            self.cli.main(argv, prog_name="glass", standalone_mode=False, obj=dict(self.obj), color=color)
+        except click.ClickException as e:
+            e.show()
+            exitCode = e.exit_code
+        except click.Abort:
+            click.echo("Aborted!", err=True)
+            exitCode = 1
+        except SystemExit as e:
+            exitCode = e.code if isinstance(e.code, int) else (0 if e.code == None else 1)
+        except Exception:
+            stderr.write(traceback.format_exc())
+            exitCode = 1
+        finally:
+            sys.stdout.release()
+            sys.stderr.release()
+
+        if runBackground:
+            self.runBackgroundTasks()
+        return {"exitCode": exitCode, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+    def handleConnection(self, connection, token):
+        # Returns False if the daemon has been asked to stop
+        with connection, connection.makefile("rb") as requestFile:
+            try:
+                request = json.loads(requestFile.readline())
+            except ValueError:
+                return True
+            if request.get("token", "") != token:
+                return True
+
+            if request.get("ping", False):
+                response = {"exitCode": 0, "stdout": "", "stderr": ""}
+            elif request.get("stop", False):
+                response = {"exitCode": 0, "stdout": "Stopped the glass daemon\n", "stderr": ""}
+            else:
+                response = self.runCommand(request["argv"], request.get("color", False))
+            connection.sendall(json.dumps(response).encode("utf-8") + b"\n")
+        return not request.get("stop", False)
+
+    def serve(self):
+        token = ""
+        if hasattr(socket, "AF_UNIX"):
+            socketPath = client.runtimePath(self.root, ".sock")
+            if os.path.exists(socketPath):
+                # Remove the socket left behind by a daemon that didn't shut down cleanly
+                try:
+                    client.sendRequest(self.root, {"ping": True}, timeout=2)
+                    raise click.ClickException("The glass daemon is already running for this root directory")
+                except OSError:
+                    os.remove(socketPath)
+
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            # The socket is created with owner only permissions, as the runtime directory may be the shared temp
+            # directory and changing them after bind would leave a moment where other users could connect
+            previousMask = os.umask(0o177)
+            try:
+                server.bind(socketPath)
+            finally:
+                os.umask(previousMask)
+            cleanupPath = socketPath
+        else:
+            # Without unix sockets, only processes that can read the info file (and its token) can connect
+            token = secrets.token_hex(16)
+            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server.bind(("127.0.0.1", 0))
+            cleanupPath = client.runtimePath(self.root, ".json")
+            with os.fdopen(os.open(cleanupPath, os.O_CREAT | os.O_TRUNC | os.O_WRONLY, 0o600), "w", encoding="utf-8") as infoFile:
+                json.dump({"port": server.getsockname()[1], "token": token, "pid": os.getpid()}, infoFile)
+
+        server.listen()
+        click.echo(f"Serving {self.root}, press Ctrl+C to stop")
+        realStdout, realStderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = ThreadOutput(realStdout), ThreadOutput(realStderr)
+        try:
+            with server:
+                while True:
+                    connection, address = server.accept()
+                    if not self.handleConnection(connection, token):
+                        break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sys.stdout, sys.stderr = realStdout, realStderr
+            if os.path.exists(cleanupPath):
+                os.remove(cleanupPath)
+
+
+@click.command("serve")
+@click.option("stop", "--stop", is_flag=True, default=False, help="Stops the daemon that is currently running")
+@click.pass_context
+def serveCommands(ctx, stop):
+    "Keep IDs in memory and answer open --print, list and project view quickly"
+    if stop:
+        try:
+            response = client.sendRequest(ctx.obj["root"], {"stop": True})
+        except (OSError, ValueError):
+            raise click.ClickException("The glass daemon is not running")
+        click.echo(response["stdout"], nl=False)
+        return
+
+    GlassDaemon(ctx.find_root().command, ctx.obj).serve()
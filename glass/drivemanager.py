@@ -1,4 +1,4 @@
-from importlib.metadata import version
+from .appinfo import version
 import json
 import time
 import click
@@ -0,0 +1,119 @@
+from datetime import date
+import functools
+import re
+
+from . import metrics
+
+# Reads the properties (YAML frontmatter) of Obsidian notes
+# Only the block between the --- on the first line and the next --- is read, so the body of the note (which can hold
+# large embedded attachments and its own --- horizontal rules) is never loaded
+# Values are parsed with the subset of YAML the metafiles use: true/false, integers, YYYY-MM-DD dates and quoted
+# strings, anything else is kept as text. Lists and nested mappings are not supported, their keys have a value of ""
+# and their items are skipped
+
+# Notes with a longer frontmatter than this only have the properties in the first maxFrontmatterBytes read
+maxFrontmatterBytes = 64 * 1024
+delimiter = b"---"
+chunkBytes = 4096
+closingPattern = re.compile(rb"^---[ \t]*\r?$", re.MULTILINE)
+
+intPattern = re.compile(r"[-+]?[0-9]+")
+datePattern = re.compile(r"[0-9]{4}-[0-9]{2}-[0-9]{2}")
+escapes = {'"': '"', "\\": "\\", "/": "/", "n": "\n", "t": "\t", "r": "\r"}
+
+
+def readFrontmatter(metaFilePath):
+    # Returns the properties of a note as text, keyed by property name
+    # A note that doesn't start with a --- line has no properties
+    # The note is read in chunks until the closing --- turns up, which for most notes is the first chunk
+    properties = {}
+    with open(metaFilePath, "rb") as metaFile:
+        data = metaFile.read(min(chunkBytes, maxFrontmatterBytes))
+        endOfFile = len(data) < min(chunkBytes, maxFrontmatterBytes)
+        blockStart = data.find(b"\n") + 1
+        if blockStart != 0 and data[:blockStart].lstrip(b"\xef\xbb\xbf").strip() == delimiter:
+            closing = findClosing(data, blockStart, endOfFile)
+            while closing == None and not endOfFile and len(data) < maxFrontmatterBytes:
+                chunk = metaFile.read(min(chunkBytes, maxFrontmatterBytes - len(data)))
+                endOfFile = len(chunk) == 0
+                data += chunk
+                closing = findClosing(data, blockStart, endOfFile)
+            if closing == None:
+                # The end of the file also ends an unclosed block, but a line cut off by the limit is left out
+                closing = len(data) if endOfFile else data.rfind(b"\n") + 1
+            withinBlock = False
+            for line in data[blockStart:max(blockStart, closing)].decode("utf-8", errors="replace").split("\n"):
+                withinBlock = addProperty(properties, line, withinBlock)
+    metrics.add("markdown_files_parsed")
+    metrics.add("markdown_bytes_read", len(data))
+    return properties
+
+def findClosing(data, blockStart, endOfFile):
+    # The offset of the closing --- line, or None if it isn't in data yet
+    # A match at the very end of data might be the start of a longer line, unless the file has ended
+    match = closingPattern.search(data, blockStart)
+    if match == None or (match.end() == len(data) and not endOfFile):
+        return None
+    return match.start()
+
+def addProperty(properties, line, withinBlock):
+    # Adds a "key: value" line, and returns whether the lines after it belong to a list or nested mapping
+    # A key without a value starts such a block, and the indented lines after it are its items, which are skipped
+    # Any other indented "key: value" line is read with its indentation removed, as the parser before this one did
+    if withinBlock and line[:1] in [" ", "\t"]:
+        return True
+    line = line.strip()
+    if line[:1] in ["-", "#"] or ":" not in line:
+        # List items, comments and blank lines don't end a block
+        return withinBlock
+    key, value = line.split(":", 1)
+    properties[key.strip()] = value.strip()
+    return properties[key.strip()] == ""
+
+@functools.lru_cache(maxsize=4096)
+def parseValue(text):
+    # Most values repeat across notes (the type, revision stage, override flag...), hence the cache
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in ['"', "'"]:
+        return unquote(text)
+    lowerText = text.lower()
+    if lowerText == "true":
+        return True
+    if lowerText == "false":
+        return False
+    if intPattern.fullmatch(text):
+        return int(text)
+    if datePattern.fullmatch(text):
+        try:
+            return date.fromisoformat(text)
+        except ValueError:
+            pass
+    return text
+
+def unquote(text):
+    if text[0] == "'":
+        # Single quoted strings only escape the quote itself, by doubling it
+        return text[1:-1].replace("''", "'")
+    value = []
+    characters = iter(text[1:-1])
+    for character in characters:
+        if character == "\\":
+            escaped = next(characters, "")
+            value.append(escapes.get(escaped, "\\" + escaped))
+        else:
+            value.append(character)
+    return "".join(value)
+
+def parseProperties(rawProperties):
+    return {key: parseValue(text) for key, text in rawProperties.items()}
+
+def readProperties(metaFilePath):
+    # The typed properties of a note
+    return parseProperties(readFrontmatter(metaFilePath))
+
+def formatValue(value):
+    # A property as it would be written in the frontmatter
+    if type(value) == bool:
+        return "true" if value else "false"
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
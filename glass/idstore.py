@@ -0,0 +1,467 @@
+from contextlib import closing
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from . import appconfig
+from . import idtree
+
+# IDPaths{letter}.json is a small manifest describing where the IDs of a storage location are kept
+# With the json engine, the IDs are split into one shard file per area, kept in IDPaths{letter}.shards/
+# Writing only rewrites the shards whose contents changed, and a lookup only reads the shard holding the ID
+# With the sqlite engine, the IDs of every storage location are kept in one indexed database
+# locations.json maps every ID (without its storage letter) to its path on each storage location that has it,
+# it's updated whenever a storage location's IDs are written so an ID can be found on every drive with one read
+# Every file is written to a temporary file first and then swapped in, so a reader never sees a half written file
+manifestFormat = 2
+engines = ["json", "sqlite"]
+# The engine used when writing IDs, and whether the json files are indented for reading by hand
+# None reads them from the app config each time IDs are written, so a long running process sees `glass config modify`
+engine = None
+pretty = None
+databaseName = "ids.sqlite"
+locationsName = "locations.json"
+locationsLockName = "locations.lock"
+# A lock on the locations older than this (in seconds) was left behind by a process that died while holding it
+lockMaxAge = 30
+locationsFormat = 1
+databaseSchema = """
+CREATE TABLE IF NOT EXISTS ids (
+    storage TEXT NOT NULL,
+    idText TEXT NOT NULL,
+    numericalID TEXT NOT NULL,
+    type TEXT NOT NULL,
+    parentID TEXT,
+    position INTEGER NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (storage, idText)
+);
+CREATE INDEX IF NOT EXISTS idsByNumericalID ON ids (storage, numericalID);
+CREATE INDEX IF NOT EXISTS idsByType ON ids (storage, type);
+CREATE INDEX IF NOT EXISTS idsByParent ON ids (storage, parentID);
+"""
+
+def shardKey(numericalID):
+    # IDs are sharded by their area digit, anything without one (e.g. invalid IDs) shares a shard
+    if len(numericalID) != 0 and numericalID[0].isdigit():
+        return numericalID[0]
+    return "_"
+
+def shardKeyForID(idText):
+    # The shard that holds an ID, ignoring the storage letter at the front of alternate storage IDs
+    if len(idText) != 0 and not idText[0].isdigit():
+        idText = idText[1:]
+    return shardKey(idText)
+
+def stripStorageLetter(idText):
+    if len(idText) != 0 and not idText[0].isdigit():
+        return idText[1:]
+    return idText
+
+def getShardDir(manifestPath):
+    return manifestPath[:-len(".json")] + ".shards"
+
+def getStorageLabel(manifestPath):
+    # The storage letter of an ID file, the central IDPaths.json belongs to A
+    label = os.path.basename(manifestPath)[len("IDPaths"):-len(".json")]
+    return label if label != "" else "A"
+
+def getDatabasePath(manifestPath):
+    return os.path.join(os.path.dirname(manifestPath), databaseName)
+
+def connectDatabase(databasePath):
+    # sqlite3 is only imported when the sqlite engine is used
+    import sqlite3
+    connection = sqlite3.connect(databasePath)
+    connection.executescript(databaseSchema)
+    return connection
+
+def readManifest(manifestPath):
+    with open(manifestPath, "r", encoding="utf-8") as manifestFile:
+        return json.load(manifestFile)
+
+def prefixRange(prefix):
+    # Every numerical ID starting with prefix sorts between these two values, which lets sqlite use its index
+    return prefix, prefix + "\U0010ffff"
+
+def sortRecords(records):
+    # Records are written in numerical ID order, ties broken by the ID text so the files don't depend on scan order
+    return sorted(records.items(), key=lambda item: (item[1]["numericalID"], item[0]))
+
+def getEngine():
+    if engine != None:
+        return engine
+    return appconfig.getChoice(appconfig.loadConfig(), "id_store", engines)
+
+def isPretty():
+    if pretty != None:
+        return pretty
+    return appconfig.getChoice(appconfig.loadConfig(), "pretty_index", ["true", "false"]) == "true"
+
+def encodeJSON(data, level=0, indented=None):
+    # Compact by default, indented with 4 spaces at the given nesting level when pretty output is on
+    if indented == None:
+        indented = isPretty()
+    if not indented:
+        return json.dumps(data, separators=(",", ":"), sort_keys=True)
+    return json.dumps(data, indent=4, sort_keys=True).replace("\n", "\n" + " "*4*level)
+
+def encodeShard(sortedRecords, indented):
+    # Yields a shard file a record at a time, rather than building the whole document in memory
+    if len(sortedRecords) == 0:
+        yield encodeJSON({"IDs": {}}, 0, indented)
+        return
+    separator, keySeparator, closing = (",\n        ", ": ", "\n    }\n}") if indented else (",", ":", "}}")
+    yield '{\n    "IDs": {\n        ' if indented else '{"IDs":{'
+    for position, (idText, record) in enumerate(sortedRecords):
+        yield (separator if position != 0 else "") + json.dumps(idText) + keySeparator + encodeJSON(record, 2, indented)
+    yield closing
+
+def writeAtomic(path, chunks, unchangedChecksum=None):
+    # Streams the chunks of text into a temporary file beside path, then replaces path with it in one step
+    # Returns the sha1 checksum of the contents, if it matches unchangedChecksum the old file is left alone
+    tempPath = f"{path}.{os.getpid()}.tmp"
+    checksum = hashlib.sha1()
+    try:
+        with open(tempPath, "w", encoding="utf-8", newline="") as tempFile:
+            for chunk in chunks:
+                checksum.update(chunk.encode("utf-8"))
+                tempFile.write(chunk)
+        if checksum.hexdigest() == unchangedChecksum and os.path.exists(path):
+            os.remove(tempPath)
+        else:
+            os.replace(tempPath, path)
+    except BaseException:
+        try:
+            os.remove(tempPath)
+        except FileNotFoundError:
+            pass
+        raise
+    return checksum.hexdigest()
+
+def readRecords(manifestPath, prefix=None):
+    # Returns the raw records of the IDs keyed by their ID text
+    # prefix limits the IDs to those whose numerical ID starts with it, e.g. "21.01" for a subfolder and its descendants
+    manifest = readManifest(manifestPath)
+    if "IDs" in manifest:
+        # An ID file written before the index was sharded
+        records = manifest["IDs"]
+    elif manifest.get("engine", "json") == "sqlite":
+        query = "SELECT idText, record FROM ids WHERE storage = ?"
+        parameters = [getStorageLabel(manifestPath)]
+        if prefix != None:
+            query += " AND numericalID >= ? AND numericalID < ?"
+            parameters += prefixRange(prefix)
+        with closing(connectDatabase(getDatabasePath(manifestPath))) as connection:
+            rows = connection.execute(query + " ORDER BY numericalID, idText", parameters).fetchall()
+        return {idText: json.loads(record) for idText, record in rows}
+    else:
+        records = {}
+        shardDir = getShardDir(manifestPath)
+        for key in sorted(manifest["shards"].keys()):
+            if prefix != None and key != shardKey(prefix):
+                continue
+            # A missing shard raises FileNotFoundError, the same as a missing ID file
+            with open(os.path.join(shardDir, manifest["shards"][key]["file"]), "r", encoding="utf-8") as shardFile:
+                records.update(json.load(shardFile)["IDs"])
+
+    if prefix == None:
+        return records
+    return {idText: record for idText, record in records.items() if record["numericalID"].startswith(prefix)}
+
+def readRecord(manifestPath, idText):
+    # Returns the raw record of a single ID, or None if it isn't in the storage location
+    manifest = readManifest(manifestPath)
+    if manifest.get("engine", "json") == "sqlite" and "IDs" not in manifest:
+        with closing(connectDatabase(getDatabasePath(manifestPath))) as connection:
+            row = connection.execute(
+                "SELECT record FROM ids WHERE storage = ? AND idText = ?",
+                (getStorageLabel(manifestPath), idText)
+            ).fetchone()
+        return json.loads(row[0]) if row != None else None
+
+    key = shardKeyForID(idText)
+    return readRecords(manifestPath, key if key != "_" else None).get(idText)
+
+def countChildren(manifestPath, numericalID):
+    # The number of distinct IDs directly below a numerical ID
+    manifest = readManifest(manifestPath)
+    if manifest.get("engine", "json") == "sqlite" and "IDs" not in manifest:
+        with closing(connectDatabase(getDatabasePath(manifestPath))) as connection:
+            return connection.execute(
+                "SELECT COUNT(DISTINCT numericalID) FROM ids WHERE storage = ? AND parentID = ?",
+                (getStorageLabel(manifestPath), numericalID)
+            ).fetchone()[0]
+
+    childIDs = set()
+    for record in readRecords(manifestPath, numericalID[0]).values():
+        parent = idtree.getParentID(record["numericalID"], record["type"])
+        if parent != None and parent[0] == numericalID:
+            childIDs.add(record["numericalID"])
+    return len(childIDs)
+
+def writeRecords(manifestPath, records):
+    # Writes the records (keyed by ID text) with the configured engine
+    records = sortRecords(records)
+    try:
+        oldManifest = readManifest(manifestPath)
+    except (OSError, ValueError):
+        oldManifest = {}
+    oldEngine = oldManifest.get("engine", "json") if "shards" in oldManifest else None
+
+    if getEngine() == "sqlite":
+        writeDatabase(manifestPath, records)
+        if oldEngine == "json":
+            # The shards were replaced by the database
+            shutil.rmtree(getShardDir(manifestPath), ignore_errors=True)
+    else:
+        writeShards(manifestPath, records, oldManifest.get("shards", {}) if oldEngine == "json" else {})
+        if oldEngine == "sqlite":
+            with closing(connectDatabase(getDatabasePath(manifestPath))) as connection, connection:
+                connection.execute("DELETE FROM ids WHERE storage = ?", (getStorageLabel(manifestPath),))
+    updateLocations(manifestPath, records)
+
+def updateRecords(manifestPath, changedRecords):
+    # Applies changes to a storage location's IDs (keyed by ID text, None removes the ID), only reading and
+    # rewriting the shards (or database rows) that hold them
+    try:
+        manifest = readManifest(manifestPath)
+    except (OSError, ValueError):
+        manifest = {}
+    oldEngine = manifest.get("engine", "json") if "shards" in manifest else None
+
+    if oldEngine != getEngine():
+        # A missing ID file, one from before the index was sharded or one written with the other engine is written in full
+        records = readRecords(manifestPath) if len(manifest) != 0 else {}
+        for idText, record in changedRecords.items():
+            if record == None:
+                records.pop(idText, None)
+            else:
+                records[idText] = record
+        writeRecords(manifestPath, records)
+        return
+
+    manifest["metaData"] = {"createdUTC": round(time.time())}
+    if oldEngine == "sqlite":
+        storage = getStorageLabel(manifestPath)
+        with closing(connectDatabase(getDatabasePath(manifestPath))) as connection, connection:
+            connection.executemany("DELETE FROM ids WHERE storage = ? AND idText = ?", [(storage, idText) for idText in changedRecords.keys()])
+            # Reads are ordered by numerical ID, so new rows can go after the others
+            position = connection.execute("SELECT COALESCE(MAX(position), -1) FROM ids WHERE storage = ?", (storage,)).fetchone()[0] + 1
+            addedRecords = sortRecords({idText: record for idText, record in changedRecords.items() if record != None})
+            connection.executemany("INSERT INTO ids VALUES (?, ?, ?, ?, ?, ?, ?)", getDatabaseRows(storage, addedRecords, position))
+        writeAtomic(manifestPath, [encodeJSON(manifest)])
+    else:
+        updateShards(manifestPath, manifest, changedRecords)
+    changeLocations(manifestPath, changedRecords)
+
+def updateShards(manifestPath, manifest, changedRecords):
+    changedShards = {}
+    for idText, record in changedRecords.items():
+        changedShards.setdefault(shardKeyForID(idText), {})[idText] = record
+
+    shardDir = getShardDir(manifestPath)
+    os.makedirs(shardDir, exist_ok=True)
+    indented = isPretty()
+    removedFiles = []
+    for key in sorted(changedShards.keys()):
+        oldInfo = manifest["shards"].get(key)
+        records = {}
+        if oldInfo != None:
+            with open(os.path.join(shardDir, oldInfo["file"]), "r", encoding="utf-8") as shardFile:
+                records = json.load(shardFile)["IDs"]
+        for idText, record in changedShards[key].items():
+            if record == None:
+                records.pop(idText, None)
+            else:
+                records[idText] = record
+
+        if len(records) == 0:
+            if oldInfo != None:
+                manifest["shards"].pop(key)
+                removedFiles.append(oldInfo["file"])
+            continue
+        shardInfo = {"file": f"{key}.json", "generation": 1, "checksum": None, "count": len(records)}
+        oldChecksum = oldInfo["checksum"] if oldInfo != None else None
+        shardInfo["checksum"] = writeAtomic(os.path.join(shardDir, shardInfo["file"]), encodeShard(sortRecords(records), indented), oldChecksum)
+        if oldInfo != None:
+            if shardInfo["checksum"] == oldChecksum:
+                continue
+            shardInfo["generation"] = oldInfo["generation"] + 1
+        manifest["shards"][key] = shardInfo
+
+    # As in writeShards, the manifest is written after the shards and before the removed ones are deleted
+    writeAtomic(manifestPath, [encodeJSON(manifest)])
+    for fileName in removedFiles:
+        try:
+            os.remove(os.path.join(shardDir, fileName))
+        except FileNotFoundError:
+            pass
+
+def getDatabaseRows(storage, records, firstPosition=0):
+    rows = []
+    for position, (idText, record) in enumerate(records, firstPosition):
+        parent = idtree.getParentID(record["numericalID"], record["type"])
+        rows.append((
+            storage,
+            idText,
+            record["numericalID"],
+            record["type"],
+            parent[0] if parent != None else None,
+            position,
+            json.dumps(record)
+        ))
+    return rows
+
+def writeDatabase(manifestPath, records):
+    storage = getStorageLabel(manifestPath)
+    rows = getDatabaseRows(storage, records)
+
+    # The storage location's IDs are replaced in a single transaction, so readers never see a partial write
+    with closing(connectDatabase(getDatabasePath(manifestPath))) as connection, connection:
+        connection.execute("DELETE FROM ids WHERE storage = ?", (storage,))
+        connection.executemany("INSERT INTO ids VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    manifest = {"metaData": {"createdUTC": round(time.time())}, "format": manifestFormat, "engine": "sqlite", "shards": {}}
+    writeAtomic(manifestPath, [encodeJSON(manifest)])
+
+def writeShards(manifestPath, records, oldShards):
+    shards = {}
+    for idText, record in records:
+        shards.setdefault(shardKey(record["numericalID"]), []).append((idText, record))
+
+    shardDir = getShardDir(manifestPath)
+    os.makedirs(shardDir, exist_ok=True)
+    manifest = {"metaData": {"createdUTC": round(time.time())}, "format": manifestFormat, "engine": "json", "shards": {}}
+    indented = isPretty()
+    for key in sorted(shards.keys()):
+        shardInfo = {"file": f"{key}.json", "generation": 1, "checksum": None, "count": len(shards[key])}
+        oldInfo = oldShards.get(key)
+        oldChecksum = oldInfo["checksum"] if oldInfo != None else None
+        shardInfo["checksum"] = writeAtomic(os.path.join(shardDir, shardInfo["file"]), encodeShard(shards[key], indented), oldChecksum)
+
+        if oldInfo != None:
+            if shardInfo["checksum"] == oldChecksum:
+                # This shard hasn't changed, so it was left alone
+                manifest["shards"][key] = oldInfo
+                continue
+            shardInfo["generation"] = oldInfo["generation"] + 1
+        manifest["shards"][key] = shardInfo
+
+    # The manifest is written last so it never lists a shard that hasn't been written yet
+    writeAtomic(manifestPath, [encodeJSON(manifest)])
+
+    # Remove the shards of areas that no longer have any IDs
+    for key in oldShards.keys():
+        if key not in manifest["shards"]:
+            try:
+                os.remove(os.path.join(shardDir, oldShards[key]["file"]))
+            except FileNotFoundError:
+                pass
+
+class FileLock:
+    # Held by one process at a time, while it reads and rewrites a shared file
+    # Each update is quick, so a lock older than lockMaxAge is taken to be left behind and removed
+    def __init__(self, lockPath, pollInterval=0.02):
+        self.lockPath = lockPath
+        self.pollInterval = pollInterval
+
+    def __enter__(self):
+        while True:
+            try:
+                os.close(os.open(self.lockPath, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return self
+            except FileExistsError:
+                pass
+            try:
+                if time.time() - os.stat(self.lockPath).st_mtime > lockMaxAge:
+                    os.remove(self.lockPath)
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(self.pollInterval)
+
+    def __exit__(self, *exc):
+        try:
+            os.remove(self.lockPath)
+        except FileNotFoundError:
+            pass
+        return False
+
+def getLocationsPath(dataDir):
+    return os.path.join(dataDir, locationsName)
+
+def setLocations(locations, storage, records):
+    # Replace the paths of one storage location with those in records (sorted (ID text, record) pairs)
+    for paths in locations["ids"].values():
+        paths.pop(storage, None)
+    for idText, record in records:
+        # If an ID appears twice in a storage location, the first one is kept
+        locations["ids"].setdefault(stripStorageLetter(idText), {}).setdefault(storage, record["path"])
+    locations["ids"] = {idText: paths for idText, paths in locations["ids"].items() if len(paths) != 0}
+    locations["storages"] = sorted(set(locations["storages"]) | {storage})
+
+def buildLocations(dataDir):
+    # Rebuild the locations from every storage location's ID file
+    locations = {"format": locationsFormat, "storages": [], "ids": {}}
+    for fileName in sorted(os.listdir(dataDir)):
+        if not (fileName.startswith("IDPaths") and fileName.endswith(".json")):
+            continue
+        manifestPath = os.path.join(dataDir, fileName)
+        setLocations(locations, getStorageLabel(manifestPath), sortRecords(readRecords(manifestPath)))
+    return locations
+
+def loadLocations(dataDir):
+    # The saved locations, or None if they're missing or from an older version
+    try:
+        with open(getLocationsPath(dataDir), "r", encoding="utf-8") as locationsFile:
+            locations = json.load(locationsFile)
+        if locations.get("format") == locationsFormat:
+            return locations
+    except (FileNotFoundError, ValueError):
+        pass
+    return None
+
+def rebuildMissingLocations(dataDir):
+    # Only called while holding the locations lock, so the rebuilt file can't replace another process's update
+    locations = loadLocations(dataDir)
+    if locations == None:
+        locations = buildLocations(dataDir)
+        writeAtomic(getLocationsPath(dataDir), [encodeJSON(locations)])
+    return locations
+
+def readLocations(dataDir):
+    # The locations are rebuilt if they're missing (e.g. the IDs were written by an older version)
+    locations = loadLocations(dataDir)
+    if locations != None:
+        return locations
+    with FileLock(os.path.join(dataDir, locationsLockName)):
+        return rebuildMissingLocations(dataDir)
+
+def updateLocations(manifestPath, records):
+    # The file is read, changed and written back while locked, so processes writing the IDs of different
+    # storage locations at the same time don't drop each other's paths
+    dataDir = os.path.dirname(manifestPath)
+    with FileLock(os.path.join(dataDir, locationsLockName)):
+        locations = rebuildMissingLocations(dataDir)
+        setLocations(locations, getStorageLabel(manifestPath), records)
+        writeAtomic(getLocationsPath(dataDir), [encodeJSON(locations)])
+
+def changeLocations(manifestPath, changedRecords):
+    # Updates the paths of only the changed IDs of a storage location (keyed by ID text, None removes the ID)
+    dataDir = os.path.dirname(manifestPath)
+    storage = getStorageLabel(manifestPath)
+    with FileLock(os.path.join(dataDir, locationsLockName)):
+        locations = rebuildMissingLocations(dataDir)
+        for idText, record in changedRecords.items():
+            paths = locations["ids"].setdefault(stripStorageLetter(idText), {})
+            if record == None:
+                paths.pop(storage, None)
+            else:
+                paths[storage] = record["path"]
+            if len(paths) == 0:
+                locations["ids"].pop(stripStorageLetter(idText))
+        locations["storages"] = sorted(set(locations["storages"]) | {storage})
+        writeAtomic(getLocationsPath(dataDir), [encodeJSON(locations)])
@@ -0,0 +1,99 @@
+levels = ["area", "category", "subfolder", "project", "child-project"]
+
+def getParentID(numericalID, idType):
+    # Returns the numerical ID and type of the level directly above an ID, or None for areas
+    if idType == "category":
+        return f"{numericalID[0]}0", "area"
+    if idType == "subfolder":
+        return numericalID[0:2], "category"
+    if idType == "project":
+        return numericalID[0:5], "subfolder"
+    if idType == "child-project":
+        return numericalID[0:8], "project"
+    return None
+
+
+class IDNode:
+    def __init__(self, numericalID, idType, parent):
+        self.numericalID = numericalID
+        self.idType = idType
+        self.parent = parent
+        self.children = []
+        # The pathIDs with this numerical ID. Usually one, but the file system can contain duplicates
+        # Empty if only the node's descendants are present (e.g. a partially duplicated storage location)
+        self.ids = []
+
+        # The numerical ID of every level at or above this node
+        self.ancestors = dict(parent.ancestors) if parent != None else {}
+        self.ancestors[idType] = numericalID
+
+    @property
+    def id(self):
+        # The pathID that is stored in the ID files when there are duplicates (the last one)
+        if len(self.ids) == 0:
+            return None
+        return self.ids[-1]
+
+
+class IDTree:
+    def __init__(self, ids):
+        # Index a collection of pathIDs by numerical ID, linking every ID to its parent and children
+        # IDs from a single storage location are expected, as the storage letter is ignored
+        self.nodes = {}
+        self.roots = []
+        self.levels = {level: [] for level in levels}
+
+        for thisID in ids:
+            if thisID.idType not in self.levels:
+                continue
+            self.getNode(thisID.numericalID, thisID.idType).ids.append(thisID)
+
+        # Keep nodes in ID order so walks match the order of the ID files
+        for node in self.nodes.values():
+            node.children.sort(key=lambda child: child.numericalID)
+        for levelNodes in self.levels.values():
+            levelNodes.sort(key=lambda levelNode: levelNode.numericalID)
+        self.roots.sort(key=lambda root: root.numericalID)
+
+    def getNode(self, numericalID, idType):
+        # Find the node for an ID, creating it and any missing ancestors
+        node = self.nodes.get(numericalID)
+        if node != None:
+            return node
+
+        parentData = getParentID(numericalID, idType)
+        parent = None
+        if parentData != None:
+            parent = self.getNode(*parentData)
+
+        node = IDNode(numericalID, idType, parent)
+        self.nodes[numericalID] = node
+        self.levels[idType].append(node)
+        if parent != None:
+            parent.children.append(node)
+        else:
+            self.roots.append(node)
+        return node
+
+    def get(self, numericalID):
+        return self.nodes.get(numericalID)
+
+    def children(self, numericalID):
+        # The pathIDs directly below an ID
+        node = self.nodes.get(numericalID)
+        if node == None:
+            return []
+        return [childID for child in node.children for childID in child.ids]
+
+    def walk(self, numericalID=None):
+        # Yield every pathID at or below an ID (or in the whole tree) in ID order
+        if numericalID == None:
+            toVisit = list(reversed(self.roots))
+        else:
+            node = self.nodes.get(numericalID)
+            toVisit = [node] if node != None else []
+
+        while len(toVisit) != 0:
+            node = toVisit.pop()
+            yield from node.ids
+            toVisit.extend(reversed(node.children))
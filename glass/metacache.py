@@ -0,0 +1,61 @@
+import json
+import os
+import time
+
+from . import frontmatter
+from . import idstore
+from . import metrics
+from . import scanstate
+
+# Bump whenever the layout of the cache, or what the parser returns, changes so older caches are ignored
+cacheVersion = 3
+
+
+def getCachePath(rootPath):
+    return os.path.join(rootPath, ".glass/data/metaCache.json")
+
+
+class MetaCache:
+    def __init__(self, cachePath):
+        # The properties of every markdown file in the vault, keyed by path
+        # Each entry is [mtime, size, properties as text], and a file is only read again once its mtime or size changes
+        # The text is kept rather than the typed values, which (like dates) can't all be stored in JSON
+        # Without a cachePath nothing is loaded or saved
+        self.cachePath = cachePath
+        self.previousFiles = {}
+        self.files = {}
+        self.changed = False
+        self.startedNs = time.time_ns()
+        self.load()
+
+    def load(self):
+        if self.cachePath == None:
+            return
+        try:
+            with open(self.cachePath, "r", encoding="utf-8") as cacheFile:
+                cacheData = json.load(cacheFile)
+        except (FileNotFoundError, ValueError):
+            return
+        if cacheData.get("version") == cacheVersion:
+            self.previousFiles = cacheData.get("files", {})
+
+    def getProperties(self, filePath, fileStat):
+        # Returns the typed properties of a file, only reading it if it changed since it was cached
+        cached = self.previousFiles.get(filePath)
+        if cached != None and cached[0] == fileStat.st_mtime_ns and cached[1] == fileStat.st_size:
+            metrics.add("markdown_files_reused")
+            self.files[filePath] = cached
+            return frontmatter.parseProperties(cached[2])
+
+        rawProperties = frontmatter.readFrontmatter(filePath)
+        # A file written within the same mtime tick as this read could change again unnoticed, so it's read next time too
+        mtime = fileStat.st_mtime_ns if fileStat.st_mtime_ns < self.startedNs - scanstate.racyWindowNs else None
+        self.files[filePath] = [mtime, fileStat.st_size, rawProperties]
+        self.changed = True
+        return frontmatter.parseProperties(rawProperties)
+
+    def save(self):
+        # Only the files seen in this walk are kept, so deleted notes drop out of the cache
+        if self.cachePath == None or (not self.changed and len(self.files) == len(self.previousFiles)):
+            return
+        idstore.writeAtomic(self.cachePath, [json.dumps({"version": cacheVersion, "files": self.files}, separators=(",", ":"))])
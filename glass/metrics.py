@@ -0,0 +1,144 @@
+import json
+import os
+import threading
+import time
+
+from . import idstore
+from . import trace
+
+# Counters from each run of the background tasks
+# The last run is written to .glass/logs/metrics.prom in the Prometheus text format (e.g. for node_exporter's textfile
+# collector), and every run is appended to .glass/logs/history.jsonl, which keeps the last historyLength runs
+# Shown with `glass bg --history`
+metricsName = "metrics.prom"
+historyName = "history.jsonl"
+historyLength = 200
+
+# The counters of a run and their descriptions
+counterHelp = {
+    "directories_scanned": "Directories read during the scan",
+    "directories_skipped": "Unchanged directories reused from the previous scan",
+    "ids_found": "Folders found that are named like an ID",
+    "ids_valid": "Valid IDs found",
+    "ids_invalid": "Invalid IDs found",
+    "markdown_files_parsed": "Markdown files whose properties were read",
+    "markdown_files_reused": "Unchanged markdown files whose cached properties were used",
+    "markdown_bytes_read": "Bytes read from markdown files",
+    "metafiles_rewritten": "Metafiles updated with a new revision",
+}
+
+
+class RunMetrics:
+    def __init__(self, command, version):
+        self.command = command
+        self.version = version
+        self.started = time.time()
+        self.startedCounter = time.perf_counter()
+        self.duration = 0
+        self.success = False
+        self.counters = dict.fromkeys(counterHelp.keys(), 0)
+        # Seconds spent in each phase, keyed by phase name
+        self.phases = {}
+        # Only the thread running the background tasks counts towards them (the daemon reads metafiles on other threads)
+        self.threadID = threading.get_ident()
+
+    def toRecord(self):
+        return {
+            "started": round(self.started, 3),
+            "duration": round(self.duration, 4),
+            "success": self.success,
+            "command": self.command,
+            "version": self.version,
+            "counters": self.counters,
+            "phases": {phase: round(seconds, 4) for phase, seconds in self.phases.items()},
+        }
+
+
+class Phase:
+    # Times a phase of the current run, and records it as a trace span
+    __slots__ = ("name", "span", "startCounter")
+
+    def __init__(self, name):
+        self.name = name
+        self.span = trace.span(name)
+
+    def __enter__(self):
+        self.span.__enter__()
+        self.startCounter = time.perf_counter()
+        return self.span
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.startCounter
+        if current != None:
+            current.phases[self.name] = current.phases.get(self.name, 0) + elapsed
+        return self.span.__exit__(*exc)
+
+# The run in progress in this process, if any
+current = None
+
+def start(command, version):
+    global current
+    current = RunMetrics(command, version)
+    return current
+
+def add(name, value=1):
+    if current != None and current.threadID == threading.get_ident():
+        current.counters[name] += value
+
+def phase(name):
+    # with metrics.phase("checkDrives"): ...
+    return Phase(name)
+
+def getLogsDir(rootPath):
+    return os.path.join(rootPath, ".glass/logs")
+
+def formatMetrics(run):
+    # The run in the Prometheus text exposition format
+    lines = []
+    def addMetric(name, metricType, helpText, samples):
+        lines.append(f"# HELP glass_{name} {helpText}")
+        lines.append(f"# TYPE glass_{name} {metricType}")
+        for labels, value in samples:
+            labelText = ",".join(f'{key}="{labelValue}"' for key, labelValue in labels.items())
+            lines.append(f"glass_{name}{{{labelText}}} {value}" if labelText != "" else f"glass_{name} {value}")
+
+    addMetric("last_run_timestamp_seconds", "gauge", "When the last background run started", [({}, round(run.started, 3))])
+    addMetric("last_run_success", "gauge", "Whether the last background run finished without an error", [({}, int(run.success))])
+    addMetric("last_run_duration_seconds", "gauge", "How long the last background run took", [({}, round(run.duration, 4))])
+    for counter, helpText in counterHelp.items():
+        addMetric(f"last_run_{counter}", "gauge", f"{helpText} in the last background run", [({}, run.counters[counter])])
+    addMetric("last_run_phase_duration_seconds", "gauge", "How long each phase of the last background run took",
+        [({"phase": phaseName}, round(seconds, 4)) for phaseName, seconds in run.phases.items()])
+    return "\n".join(lines) + "\n"
+
+def readHistory(rootPath):
+    # The recorded runs, oldest first
+    runs = []
+    try:
+        with open(os.path.join(getLogsDir(rootPath), historyName), "r", encoding="utf-8") as historyFile:
+            for line in historyFile:
+                try:
+                    runs.append(json.loads(line))
+                except ValueError:
+                    # A line cut short by a run that was killed while writing
+                    continue
+    except FileNotFoundError:
+        pass
+    return runs
+
+def finish(rootPath, success):
+    # Save the current run to the metrics file and the history
+    global current
+    run = current
+    current = None
+    if run == None:
+        return None
+    run.success = success
+    run.duration = time.perf_counter() - run.startedCounter
+
+    logsDir = getLogsDir(rootPath)
+    idstore.writeAtomic(os.path.join(logsDir, metricsName), [formatMetrics(run)])
+    history = readHistory(rootPath)[-(historyLength - 1):]
+    history.append(run.toRecord())
+    idstore.writeAtomic(os.path.join(logsDir, historyName), [json.dumps(record, separators=(",", ":")) + "\n" for record in history])
+    return run
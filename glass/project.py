@@ -1,16 +1,27 @@
 import json
 import click
 
+from . import completion
+from . import frontmatter
+from . import idtree
+from . import metacache
+from . import metrics
 from . import tools
+from . import trace
 from . import util
 import os
 from datetime import datetime
 import sys
-from importlib.metadata import version
+from .appinfo import version
 
 revisionStages = ["planning", "working-document", "editing", "submission"]
 
 class Project:
+    __slots__ = ("id", "metaFilePath", "childIDs", "isValid", "descriptor", "properties")
+
+    revisionStages = {"A": "planning", "B": "working paper", "C": "editing", "D": "submission"}
+    revisionLetters = {"planning": "A", "working paper": "B", "editing": "C", "submission": "D"}
+
     def __init__(self, id:util.pathID, metaFilePath:str, childIDs, doValidation=True, **kwargs) -> None:
         self.id = id
         self.metaFilePath = metaFilePath
@@ -22,9 +33,6 @@ class Project:
 
         if doValidation:
             self.isValid, self.descriptor = self.validate()
-        
-        self.revisionStages = {"A": "planning", "B": "working paper", "C": "editing", "D": "submission"}
-        self.revisionLetters = {"planning": "A", "working paper": "B", "editing": "C", "submission": "D"}
 
     def validate(self):
         # Validate that all the data is normal and stuff
@@ -39,12 +47,13 @@ class Project:
         if not self.metaFilePath[-3:] == ".md":
             return [False, f"The meta file located at {self.metaFilePath} is not a Markdown file"]
         
-        # Load data from the file
+        # Load data from the file, unless generateProjectList already has
         try:
-            self.properties = readFileProperties(self.metaFilePath)
+            if len(self.properties) == 0:
+                self.properties = readFileProperties(self.metaFilePath)
             if self.properties["glassID"] != self.id.getHigherLevel("project"):
                 return [False, f"The ID present in the file indicates "]
-            if self.properties["meta-override"] not in ["true", "false"]:
+            if type(self.properties["meta-override"]) != bool:
                 return [False, f"The meta-override value is not 'true' or 'false'. Value is '{self.properties['meta-override']}'"]
         except KeyError as exception:
             return [False, f"The metafile located at {self.metaFilePath} does not have the necessary information in the file properties. It is missing a value for {exception}"]
@@ -54,11 +63,11 @@ class Project:
         # Update the meta file to reflect new revision
         try:
             modified = False
-            if self.properties["meta-override"] != "true":
-                if self.properties["revision-stage"].replace("-", " ") != self.revisionStages[self.id.revisionStage]:
+            if self.properties["meta-override"] != True:
+                if str(self.properties["revision-stage"]).replace("-", " ") != self.revisionStages[self.id.revisionStage]:
                     self.modifyPair("revision-stage", self.revisionStages[self.id.revisionStage].replace(" ", "-"))
                     modified = True
-                if self.properties["revision-number"].replace('"', '') != str(self.id.revision) and self.id.revision != -1:
+                if str(self.properties["revision-number"]) != str(self.id.revision) and self.id.revision != -1:
                     self.modifyPair("revision-number", self.id.revision)
                     modified = True
                 return modified
@@ -73,10 +82,11 @@ class Project:
             oldLines = metaFile.readlines()
 
         newLines = []
+        # Only the frontmatter at the top of the note is changed, --- lines further down are horizontal rules
         withinProperties = False
-        for line in oldLines:
+        for lineIndex, line in enumerate(oldLines):
             thisLine = line
-            if "---" in line:
+            if line.strip().lstrip("\ufeff") == "---" and (lineIndex == 0 or withinProperties):
                 withinProperties = not withinProperties
 
             if f"{propertyKey}:" in line and withinProperties:
@@ -98,7 +108,7 @@ class Project:
         # Adjust the subheadings to track the new revisions
         if propertyKey == "revision-number":
             foundsubheading = False
-            revStage = self.properties['revision-stage'].replace('-', ' ')
+            revStage = str(self.properties['revision-stage']).replace('-', ' ')
         
             # Get all the subheadings within the subheading for the revision
             for lineIndex, line in enumerate(newLines):
@@ -124,58 +134,70 @@ class Project:
         return
 
 def readFileProperties(metaFilePath):
-    # Read the Properties of an Obsidian markdown file 
-    with open(metaFilePath, "r") as metaFile:
-        fileLines = metaFile.readlines()
-
-    withinProperties = False
-    data = {}
-    for line in fileLines:
-        line = line.strip()
-        if line == "---":
-            withinProperties = not withinProperties
-
-        if withinProperties and ":" in line:
-            keyPair = line.split(":")
-
-            if len(keyPair) > 2:
-                keyPair[1] = ":".join(keyPair[1:])
-
-            key, value = keyPair[0], keyPair[1][1:]
-            key.strip()
-            value.strip()
-            data[key] = value
-    return data
-
-def generateProjectList(idList, metaFilePath):
+    # Read the Properties of an Obsidian markdown file, see frontmatter for the values they can have
+    return frontmatter.readProperties(metaFilePath)
+
+def walkMarkdownFiles(dirPath):
+    # Yields the path and stat of every markdown file below dirPath, in the same order and with the same paths as os.walk
+    # scandir gives each file's stat without opening it (and without an extra call on Windows)
+    subDirs = []
+    try:
+        with os.scandir(dirPath) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        # os.walk doesn't follow links to directories either
+                        if not entry.is_symlink():
+                            subDirs.append(os.path.join(dirPath, entry.name))
+                    elif entry.name[-3:] == ".md":
+                        yield dirPath + "/" + entry.name, entry.stat()
+                except OSError:
+                    continue
+    except OSError:
+        return
+    for subDir in subDirs:
+        yield from walkMarkdownFiles(subDir)
+
+def generateProjectList(idList, metaFilePath, tree=None, cachePath=None):
     # Generates a list of Projects based on their IDs
+    # An existing tree index of idList can be provided to avoid rebuilding it
+    # With a cachePath (see metacache.getCachePath), notes that haven't changed since the last call aren't read again
+    if tree == None:
+        tree = idtree.IDTree(idList)
     projectIDs = [thisId for thisId in idList if thisId.idType == "project"]
     
     # Get list of all the metafiles
     metaFiles = {}
-    for (dirpath, dirNames, fileNames) in os.walk(metaFilePath):
-        for fileName in fileNames:
-            if(fileName[-3:] == ".md"):
-                fileProperties = readFileProperties(dirpath + "/" + fileName)
-                try:
-                    if fileProperties["type"] == "project":
-                        metaFiles[fileProperties["glassID"]] = dirpath + "/" + fileName
-                except Exception:
-                    pass
+    metaProperties = {}
+    cache = metacache.MetaCache(cachePath)
+    with trace.span("walkVault", path=metaFilePath):
+        for filePath, fileStat in walkMarkdownFiles(metaFilePath):
+            with trace.span("readFileProperties", "vault", path=filePath):
+                fileProperties = cache.getProperties(filePath, fileStat)
+            try:
+                if fileProperties["type"] == "project":
+                    metaFiles[str(fileProperties["glassID"])] = filePath
+                    metaProperties[filePath] = fileProperties
+            except Exception:
+                pass
+    try:
+        cache.save()
+    except OSError:
+        # The cache only saves time, so the projects are still returned if it can't be written
+        pass
     
     projects = []
-    for projectID in projectIDs:
-        # Find Child IDs
-        childIDs = []
-        for child in idList:
-            if child.idText[:8] == projectID.numericalID and child != projectID.numericalID:
-                childIDs.append(child)
-        
-        try:
-            projects.append(Project(projectID, metaFiles[projectID.numericalID.strip()], childIDs))
-        except KeyError as E:
-            # If there is no metafile
-            projects.append(Project(projectID, "", childIDs))
+    with trace.span("validateProjects", projects=len(projectIDs)):
+        for projectID in projectIDs:
+            childIDs = tree.children(projectID.numericalID)
+            
+            try:
+                metaPath = metaFiles[projectID.numericalID.strip()]
+                # A copy, as the project changes its properties when it updates the metafile
+                projects.append(Project(projectID, metaPath, childIDs, projectProperties=dict(metaProperties[metaPath])))
+            except KeyError as E:
+                # If there is no metafile
+                projects.append(Project(projectID, "", childIDs))
 
     validIDs = [project for project in projects if project.isValid]
     invalidIDs = [project for project in projects if not project.isValid]
@@ -222,13 +244,15 @@ def generateMetaFile(metaRoot, templatePath, id, title, revisionStage, revisionN
 
     return
 
-def readProjectsFileSystem(logFile, metaPath, IDList):
+def readProjectsFileSystem(logFile, metaPath, IDList, cachePath=None):
     # Read the File System to find the most recent revision of each project and update metadata file
+    # Returns the valid projects
     indent = " "*1
     logFile.write(f"{datetime.now().isoformat()}{indent}BEGIN Loading Projects\n")
     indent = " "*3
     
-    validProjects, invalidProjects = generateProjectList(IDList, metaPath)
+    with metrics.phase("generateProjectList"):
+        validProjects, invalidProjects = generateProjectList(IDList, metaPath, cachePath=cachePath)
     logFile.write(f"{datetime.now().isoformat()}{indent}INFO found {len(validProjects)} valid Projects\n")
     
     # Write Invalid Projects
@@ -241,9 +265,12 @@ def readProjectsFileSystem(logFile, metaPath, IDList):
     indent = " "*3
     logFile.write(f"{datetime.now().isoformat()}{indent}INFO Updating metafiles\n")
     modifiedMetaList = []
-    for proj in validProjects:
-        if proj.updateMetaFileRevisions(): # Returns true if the meta file is updated
-            modifiedMetaList.append(proj.metaFilePath)
+    with metrics.phase("updateMetaFileRevisions") as updateSpan:
+        for proj in validProjects:
+            if proj.updateMetaFileRevisions(): # Returns true if the meta file is updated
+                modifiedMetaList.append(proj.metaFilePath)
+        updateSpan.set(updated=len(modifiedMetaList))
+    metrics.add("metafiles_rewritten", len(modifiedMetaList))
     
     # Write list of meta files that are updated
     logFile.write(f"{datetime.now().isoformat()}{indent}INFO Updated {len(modifiedMetaList)} metafiles\n")
@@ -253,6 +280,7 @@ def readProjectsFileSystem(logFile, metaPath, IDList):
 
     indent = " "*1
     logFile.write(f"{datetime.now().isoformat()}{indent}END Loading Projects\n")
+    return validProjects
 
 # Manage the users projects
 @click.command("new")
@@ -288,7 +316,7 @@ def newProj(ctx, id, title, revisionStage, revisionNumber, dueDate, className, i
         # If the user has supplied a subfolder ID, create a new project within that subfolder
         projectsCount = 0
         for project in ctx.obj['projects']['valid'] + ctx.obj['projects']['invalid']:
-            if project.id.getHigherLevel("subfolder") == id:
+            if project.id.getAncestor("subfolder") == id:
                 projectsCount += 1
         
         id = f"{id}.{str(projectsCount+1).zfill(2)}"
@@ -354,12 +382,13 @@ def newProj(ctx, id, title, revisionStage, revisionNumber, dueDate, className, i
     )
 
     # Do Background Tasks to add newly created project to the stack
-    ctx.invoke(tools.manuallyDoBackgroundTasks)
+    # They finish before returning, so the next command sees the new project and its ID
+    ctx.invoke(tools.manuallyDoBackgroundTasks, afterChange=True)
 
     return
 
 @click.command("view")
-@click.argument("id")
+@click.argument("id", shell_complete=completion.completeProjectID)
 @click.option("jsonOutput", "--json", is_flag=True, default=False, help="Returns the data in a JSON format")
 @click.pass_context
 def viewProj(ctx, id, jsonOutput):
@@ -380,7 +409,7 @@ def viewProj(ctx, id, jsonOutput):
         click.echo(f"{'ID':<20}| {selectedProj.id.idText}")
         for attr in attributes:
             try:
-                click.echo(f"{attr:<20}| {selectedProj.properties[attr]}")
+                click.echo(f"{attr:<20}| {frontmatter.formatValue(selectedProj.properties[attr])}")
             except KeyError:
                 click.echo(f"{attr:<20}| EMPTY")
 
@@ -392,7 +421,7 @@ def viewProj(ctx, id, jsonOutput):
         'id': selectedProj.id.idText,
         'path': selectedProj.id.path,
         'metapath': selectedProj.metaFilePath,
-        'properties': selectedProj.properties
+        'properties': {key: frontmatter.formatValue(value) for key, value in selectedProj.properties.items()}
         }
     click.echo(json.dumps({
                 "status": "success",
@@ -0,0 +1,83 @@
+import json
+import os
+import threading
+import time
+
+# Bump whenever the layout of the state file changes so older files are ignored
+stateVersion = 2
+
+# Directories modified this close to the start of a scan may change again within the
+# same mtime tick, so they are always rescanned on the next run
+racyWindowNs = 2 * 1000 * 1000 * 1000
+
+
+class ScanState:
+    def __init__(self, statePath, excludedList, changedPaths=None, previousDirs=None):
+        # The results of the previous scan, keyed by the path of each scanned directory
+        # Every entry stores the directory's mtime and the IDs found directly within it
+        # When a file system watcher knows exactly which directories changed (changedPaths),
+        # every other directory is trusted without being stat'ed
+        # A watcher that keeps the previous scan in memory passes it as previousDirs, rather than it being loaded
+        self.statePath = statePath
+        self.excludedList = list(excludedList)
+        self.changedPaths = changedPaths
+        self.previousDirs = {}
+        self.dirs = {}
+        self.scannedCount = 0
+        self.skippedCount = 0
+        self.startedNs = time.time_ns()
+        # Directories may be scanned from several threads at once
+        self.lock = threading.Lock()
+        if previousDirs != None:
+            self.previousDirs = previousDirs
+        else:
+            self.load()
+
+    def load(self):
+        # Load the previous scan, discarding it if it was made with different settings
+        try:
+            with open(self.statePath, "r", encoding="utf-8") as stateFile:
+                stateData = json.load(stateFile)
+        except (FileNotFoundError, ValueError):
+            return
+
+        if stateData.get("version") != stateVersion or stateData.get("excluded") != self.excludedList:
+            return
+        self.previousDirs = stateData.get("dirs", {})
+
+    def getMTime(self, dirPath):
+        if self.changedPaths != None and dirPath not in self.changedPaths:
+            cached = self.previousDirs.get(dirPath)
+            if cached != None and cached["mtime"] != None:
+                return cached["mtime"]
+        return os.stat(dirPath).st_mtime_ns
+
+    def lookup(self, dirPath, mtime):
+        # Returns the cached (valid, invalid) records of a directory if it hasn't changed, otherwise None
+        cached = self.previousDirs.get(dirPath)
+        with self.lock:
+            if cached == None or cached["mtime"] != mtime:
+                self.scannedCount += 1
+                return None
+
+            self.skippedCount += 1
+            self.dirs[dirPath] = cached
+        return cached["valid"], cached["invalid"]
+
+    def store(self, dirPath, mtime, validRecords, invalidRecords):
+        # Record the freshly scanned contents of a directory
+        if mtime >= self.startedNs - racyWindowNs:
+            mtime = None
+        with self.lock:
+            self.dirs[dirPath] = {"mtime": mtime, "valid": validRecords, "invalid": invalidRecords}
+
+    def scannedPaths(self):
+        # Every directory read by the last scan that was saved
+        return list(self.previousDirs.keys())
+
+    def save(self):
+        # Only the directories visited in this scan are kept, so deleted folders drop out of the state
+        # Sorted so that the file doesn't depend on the order the threads finished in
+        stateData = {"version": stateVersion, "excluded": self.excludedList, "dirs": dict(sorted(self.dirs.items()))}
+        with open(self.statePath, "w", encoding="utf-8") as stateFile:
+            json.dump(stateData, stateFile, separators=(",", ":"))
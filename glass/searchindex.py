@@ -0,0 +1,222 @@
+from collections import Counter
+import hashlib
+import json
+import math
+import os
+import re
+
+from . import idstore
+
+# A trigram index over the descriptors of every ID and the titles of the projects, kept in .glass/data/search/
+# Each storage location's documents are split into one shard per area like the ID files (see idstore), and a shard
+# is only rebuilt when the text in it changes
+# Words are padded with two spaces at the front, so the first trigrams of a word ("  r", " re") act as a prefix index
+# A shard is three files:
+#  - {storage}{area}.docs holds its documents as tab separated lines ("idText, storage, kind, text, path")
+#  - {storage}{area}.grams has a line per trigram, "trigram, space separated document line numbers", sorted by trigram
+#  - {storage}{area}.json gives the byte range of the .grams lines for each pair of leading characters
+# A query only reads the ranges holding its trigrams, and the documents of the shards with matches
+indexFormat = 1
+indexDirName = "search"
+titlesName = "projectTitles.json"
+# The share of the query's trigrams a document needs to contain to be returned
+minimumMatch = 0.6
+wordPattern = re.compile(r"[^\W_]+")
+
+def getIndexDir(dataDir):
+    return os.path.join(dataDir, indexDirName)
+
+def getManifestPath(dataDir):
+    return os.path.join(getIndexDir(dataDir), "index.json")
+
+def normalise(text):
+    return " ".join(wordPattern.findall(text.lower()))
+
+def getTrigrams(text):
+    trigrams = set()
+    for word in wordPattern.findall(text.lower()):
+        paddedWord = "  " + word
+        for position in range(len(paddedWord) - 2):
+            trigrams.add(paddedWord[position:position+3])
+    return trigrams
+
+def cleanField(value):
+    return str(value if value != None else "").replace("\t", " ").replace("\n", " ")
+
+def readManifest(dataDir):
+    try:
+        with open(getManifestPath(dataDir), "r", encoding="utf-8") as manifestFile:
+            manifest = json.load(manifestFile)
+        if manifest.get("format") == indexFormat:
+            return manifest
+    except (FileNotFoundError, ValueError):
+        pass
+    return None
+
+def readTitles(dataDir):
+    # The titles of the projects from their metafiles, keyed by numerical ID
+    try:
+        with open(os.path.join(dataDir, titlesName), "r", encoding="utf-8") as titlesFile:
+            return json.load(titlesFile)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def getDocuments(storage, records, titles):
+    # The lines of each shard, keyed by shard
+    documents = {}
+    for idText, record in records:
+        lines = documents.setdefault(idstore.shardKey(record["numericalID"]), [])
+        descriptor = cleanField(record["descriptor"])
+        path = cleanField(record["path"])
+        lines.append("\t".join([idText, storage, "descriptor", descriptor, path]))
+        # Project titles only come from the primary storage location's metafiles
+        title = cleanField(titles.get(record["numericalID"])) if storage == "A" and record["type"] == "project" else ""
+        if title != "" and normalise(title) != normalise(descriptor):
+            lines.append("\t".join([idText, storage, "title", title, path]))
+    return documents
+
+def getShardPath(indexDir, fileName, extension):
+    return os.path.join(indexDir, fileName[:-len(".json")] + extension)
+
+def buildShard(lines):
+    # Returns the text of the .grams file and the byte range of each block of trigrams sharing their first two characters
+    postings = {}
+    for lineNumber, line in enumerate(lines):
+        for trigram in getTrigrams(line.split("\t")[3]):
+            postings.setdefault(trigram, []).append(str(lineNumber))
+
+    gramLines = []
+    blocks = {}
+    offset = 0
+    for trigram in sorted(postings.keys()):
+        gramLine = f"{trigram}\t{' '.join(postings[trigram])}\n"
+        block = blocks.setdefault(trigram[:2], [offset, offset])
+        offset += len(gramLine.encode("utf-8"))
+        block[1] = offset
+        gramLines.append(gramLine)
+    return "".join(gramLines), {"blocks": blocks}
+
+def removeShard(indexDir, fileName):
+    for extension in [".json", ".grams", ".docs"]:
+        try:
+            os.remove(getShardPath(indexDir, fileName, extension))
+        except FileNotFoundError:
+            pass
+
+def updateStorage(dataDir, storage, records, titles=None, shardKeys=None):
+    # Bring the index of a storage location up to date with its records (sorted (ID text, record) pairs)
+    # With shardKeys only those shards are rebuilt, and records only need to hold the IDs within them
+    if titles == None:
+        titles = readTitles(dataDir)
+    manifest = readManifest(dataDir)
+    if manifest == None:
+        manifest = {"format": indexFormat, "shards": {}}
+    indexDir = getIndexDir(dataDir)
+    os.makedirs(indexDir, exist_ok=True)
+
+    oldShards = {key: info for key, info in manifest["shards"].items() if info["storage"] == storage}
+    if shardKeys != None:
+        oldShards = {key: info for key, info in oldShards.items() if key[len(storage):-len(".json")] in shardKeys}
+    for key, lines in getDocuments(storage, records, titles).items():
+        documents = "\n".join(lines)
+        shardInfo = {"file": f"{storage}{key}.json", "storage": storage, "checksum": hashlib.sha1(documents.encode("utf-8")).hexdigest(), "count": len(lines)}
+        oldInfo = oldShards.pop(shardInfo["file"], None)
+        if oldInfo != None and oldInfo["checksum"] == shardInfo["checksum"] and os.path.exists(os.path.join(indexDir, shardInfo["file"])):
+            # The text in this shard hasn't changed
+            continue
+        # The block ranges are written after the files they describe
+        grams, blocks = buildShard(lines)
+        idstore.writeAtomic(getShardPath(indexDir, shardInfo["file"], ".docs"), [documents])
+        idstore.writeAtomic(getShardPath(indexDir, shardInfo["file"], ".grams"), [grams])
+        idstore.writeAtomic(os.path.join(indexDir, shardInfo["file"]), [idstore.encodeJSON(blocks)])
+        manifest["shards"][shardInfo["file"]] = shardInfo
+
+    # Remove the shards of areas that no longer have any IDs
+    for key in oldShards.keys():
+        manifest["shards"].pop(key)
+        removeShard(indexDir, key)
+    idstore.writeAtomic(getManifestPath(dataDir), [idstore.encodeJSON(manifest)])
+
+def setProjectTitles(dataDir, titles, records):
+    # Save the project titles and re-index the primary storage location's records (sorted (ID text, record) pairs)
+    if titles == readTitles(dataDir) and readManifest(dataDir) != None:
+        return
+    writeTitles(dataDir, titles)
+    updateStorage(dataDir, "A", records, titles)
+
+def writeTitles(dataDir, titles):
+    idstore.writeAtomic(os.path.join(dataDir, titlesName), [idstore.encodeJSON(titles)])
+
+def buildIndex(dataDir):
+    # Index every storage location's ID file, raises FileNotFoundError if there aren't any
+    titles = readTitles(dataDir)
+    for fileName in sorted(os.listdir(dataDir)):
+        if fileName.startswith("IDPaths") and fileName.endswith(".json"):
+            manifestPath = os.path.join(dataDir, fileName)
+            updateStorage(dataDir, idstore.getStorageLabel(manifestPath), idstore.sortRecords(idstore.readRecords(manifestPath)), titles)
+    manifest = readManifest(dataDir)
+    if manifest == None:
+        # There are no ID files to index yet
+        raise FileNotFoundError(getManifestPath(dataDir))
+    return manifest
+
+def search(dataDir, text, limit=20):
+    # Returns the documents that best match text, best first
+    # Each match is a dictionary with the ID text, storage location, kind ("descriptor" or "title"), matched text and path
+    queryTrigrams = getTrigrams(text)
+    if len(queryTrigrams) == 0:
+        return []
+    query = normalise(text)
+    requiredCount = max(1, math.ceil(len(queryTrigrams) * minimumMatch))
+
+    manifest = readManifest(dataDir)
+    if manifest == None:
+        manifest = buildIndex(dataDir)
+
+    # Group the trigrams by the block they're in, so each block is only read once
+    queryBlocks = {}
+    for trigram in queryTrigrams:
+        queryBlocks.setdefault(trigram[:2], []).append(trigram)
+
+    indexDir = getIndexDir(dataDir)
+    bestMatches = {}
+    for fileName in sorted(manifest["shards"].keys()):
+        with open(os.path.join(indexDir, fileName), "r", encoding="utf-8") as blocksFile:
+            blocks = json.load(blocksFile)["blocks"]
+        counts = Counter()
+        with open(getShardPath(indexDir, fileName, ".grams"), "rb") as gramsFile:
+            for blockKey, trigrams in queryBlocks.items():
+                if blockKey not in blocks:
+                    continue
+                start, end = blocks[blockKey]
+                gramsFile.seek(start)
+                blockData = b"\n" + gramsFile.read(end - start)
+                for trigram in trigrams:
+                    lineStart = blockData.find(b"\n" + trigram.encode("utf-8") + b"\t")
+                    if lineStart == -1:
+                        continue
+                    lineStart += len(trigram.encode("utf-8")) + 2
+                    counts.update(blockData[lineStart:blockData.find(b"\n", lineStart)].split(b" "))
+
+        lines = None
+        for lineNumber, count in counts.items():
+            if count < requiredCount:
+                continue
+            if lines == None:
+                with open(getShardPath(indexDir, fileName, ".docs"), "r", encoding="utf-8", newline="") as docsFile:
+                    lines = docsFile.read().split("\n")
+            idText, storage, kind, matchedText, path = lines[int(lineNumber)].split("\t")
+            normalisedText = normalise(matchedText)
+            # Whole matches of the query rank above fuzzy ones, and matches at the start above those
+            score = count / len(queryTrigrams)
+            if query in normalisedText:
+                score += 0.5
+                if normalisedText.startswith(query):
+                    score += 0.25
+            match = {"id": idText, "storage": storage, "kind": kind, "text": matchedText, "path": path, "score": round(score, 3)}
+            key = (storage, idText)
+            if key not in bestMatches or bestMatches[key]["score"] < match["score"]:
+                bestMatches[key] = match
+
+    matches = sorted(bestMatches.values(), key=lambda match: (-match["score"], len(match["text"]), match["storage"], match["id"]))
+    return matches[:limit]
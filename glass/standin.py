@@ -1,4 +1,4 @@
-from importlib.metadata import version
+from .appinfo import version
 import json
 import sys
 import click
@@ -82,6 +82,7 @@ def newStandIn(ctx, id, title, description, url, people, doReccurance=True):
                 ctx.obj['excludeDirs'],
                 " ".join(sys.argv), 
                 version('glass'),
+                ctx.obj['scanWorkers'],
             )
             ctx.obj['ids'] = util.loadIDDict(ctx.obj['root']) # Load the JSON file into the context again
             # Re-run current command with the new context 
@@ -130,6 +131,7 @@ def viewStandIn(ctx, id, doReccurance=True):
                 ctx.obj['excludeDirs'],
                 " ".join(sys.argv), 
                 version('glass'),
+                ctx.obj['scanWorkers'],
             )
             ctx.obj['ids'] = util.loadIDDict(ctx.obj['root']) # Load the JSON file into the context again
             # Re-run current command with the new context 
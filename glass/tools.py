@@ -1,6 +1,6 @@
 import os
 from . import drivemanager
-from importlib.metadata import version
+from .appinfo import version
 import sys
 import click
 import glass.util as util
@@ -24,38 +24,100 @@ def generateMermaidDiagram(ctx, includeProjects, storageLocation):
         levels.append("project")
     mermaidIds = {}
     a = 0
+    tree = idDict.tree
     for level in levels:
-        for pathID in idDict:
-            if idDict[pathID].idType == level:
-                mermaidIds[idDict[pathID].numericalID] = f"id{a}" 
-                mermaidStr += f"id{a}({idDict[pathID].descriptor})\n" 
+        for node in tree.levels[level]:
+            if node.id != None:
+                mermaidIds[node.numericalID] = f"id{a}" 
+                mermaidStr += f"id{a}({node.id.descriptor})\n" 
                 a += 1
 
-    for pathID in idDict:
-        thisID = idDict[pathID]
-        if thisID.idType not in ["area", "child-project"]:
-            if (thisID.idType == "project") and includeProjects:
-                parentID = thisID.getHigherLevel(levels[levels.index(thisID.idType)-1])
-                mermaidStr += f"{mermaidIds[parentID]}-->{mermaidIds[thisID.numericalID]}\n"
-            elif thisID.idType != "project":
-                parentID = thisID.getHigherLevel(levels[levels.index(thisID.idType)-1])
-                mermaidStr += f"{mermaidIds[parentID]}-->{mermaidIds[thisID.numericalID]}\n"
+    for thisID in tree.walk():
+        if thisID.idType in levels[1:]:
+            parentNode = tree.get(thisID.numericalID).parent
+            # Skip IDs whose parent isn't in this storage location
+            if parentNode.numericalID in mermaidIds:
+                mermaidStr += f"{mermaidIds[parentNode.numericalID]}-->{mermaidIds[thisID.numericalID]}\n"
 
     click.echo(mermaidStr)
 
 @click.command("bg")
+@click.option("watch", "--watch", is_flag=True, default=False, help="Keep running and update the IDs and projects whenever a folder or metafile changes")
+@click.option("interval", "--interval", type=float, default=5, help="Seconds between checks when watching without inotify (default=5)")
+@click.option("detach", "--detach", is_flag=True, default=False, help="Runs the tasks in a separate process and returns immediately")
+@click.option("lowPriority", "--low-priority", is_flag=True, default=False, help="Lowers the priority of this process before running the tasks")
+@click.option("ifStale", "--if-stale", is_flag=True, default=False, help="Skips the tasks if the IDs were updated within the freshness window or another scan is already running (for read-only commands)")
+@click.option("afterChange", "--after-change", is_flag=True, default=False, hidden=True, help="Scans again after a scan that is already running, which may have missed the calling command's change")
+@click.option("history", "--history", is_flag=True, default=False, help="Shows the recent runs of the background tasks instead of running them")
 @click.pass_context
-def manuallyDoBackgroundTasks(ctx):
+def manuallyDoBackgroundTasks(ctx, watch, interval, detach, lowPriority, ifStale, afterChange, history):
     "Manually perform the background tasks"
+    if history:
+        printHistory(ctx.obj['root'])
+        return
+
+    if detach:
+        if util.spawnBackgroundTasks(ctx.obj['root'], ifStale):
+            return
+        # If the process couldn't be started, run the tasks in this one instead
+
+    if lowPriority and hasattr(os, "nice"):
+        # Windows sets the priority when the process is created (see util.spawnBackgroundTasks)
+        os.nice(10)
+
+    if watch:
+        from . import watcher
+        try:
+            watcher.watchFileSystem(
+                ctx.obj['root'],
+                ctx.obj['metafiles'],
+                ctx.obj['excludeDirs'],
+                " ".join(sys.argv),
+                version('glass'),
+                ctx.obj['scanWorkers'],
+                interval,
+                click.echo
+            )
+        except KeyboardInterrupt:
+            click.echo("Stopped watching")
+        return
+
     util.doBackgroundTasks(
             ctx.obj['root'],
             ctx.obj['metafiles'],
             ctx.obj['excludeDirs'],
             " ".join(sys.argv), 
             version('glass'),
+            ctx.obj['scanWorkers'],
+            freshness=ctx.obj['scanFreshness'] if ifStale else 0,
+            wait=not ifStale,
+            reuseRunning=not afterChange
         )
     
 
+def printHistory(rootPath, count=20):
+    # Show the most recent runs of the background tasks, oldest first, so a scan that keeps getting slower stands out
+    from datetime import datetime
+    from . import metrics
+    runs = metrics.readHistory(rootPath)
+    if len(runs) == 0:
+        click.echo("The background tasks haven't been run since the history was added")
+        return
+
+    click.echo(f"{'Started':<19} | {'Time (s)':>8} | {'Scanned':>7} | {'Reused':>7} | {'IDs':>7} | {'Invalid':>7} | {'Markdown':>8} | {'KB Read':>7} | {'Rewritten':>9} | Result")
+    for run in runs[-count:]:
+        counters = run["counters"]
+        line = (
+            f"{datetime.fromtimestamp(run['started']).strftime('%H:%M:%S %d/%m/%Y'):<19} | {run['duration']:>8.2f} | "
+            f"{counters['directories_scanned']:>7} | {counters['directories_skipped']:>7} | {counters['ids_valid']:>7} | "
+            f"{counters['ids_invalid']:>7} | {counters['markdown_files_parsed']:>8} | {counters['markdown_bytes_read'] / 1000:>7.0f} | "
+            f"{counters['metafiles_rewritten']:>9} | {'ok' if run['success'] else 'FAILED'}"
+        )
+        click.echo(line if run["success"] else click.style(line, fg="red"))
+    if len(runs) > count:
+        click.echo(f"Showing the last {count} of {len(runs)} runs, the rest are in {os.path.join(metrics.getLogsDir(rootPath), metrics.historyName)}")
+
+
 @click.command("duplicate")
 @click.argument("parentstorage")
 @click.argument("childstorage")
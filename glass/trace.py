@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+# Records nested timing spans as Chrome trace events, which can be opened in chrome://tracing or ui.perfetto.dev
+# Turned on for a single command with `glass --profile`, or for every command (including the detached background
+# tasks) by setting GLASS_TRACE to 1, a directory or a file path
+# When tracing is off span() returns a shared do nothing context manager, so the spans can stay in hot loops
+# This module is imported before every command, so it must stay free of click and the rest of glass
+traceVariable = "GLASS_TRACE"
+
+events = []
+# The name of every thread that recorded a span, the scanning threads have finished by the time the trace is saved
+threadNames = {}
+outputPath = None
+enabled = False
+# Timestamps are in microseconds from when tracing started
+originNs = 0
+
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+nullSpan = NullSpan()
+
+
+class Span:
+    __slots__ = ("name", "category", "args", "startNs")
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.startNs = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, excType, exc, traceback):
+        endNs = time.perf_counter_ns()
+        threadID = threading.get_ident()
+        if threadID not in threadNames:
+            threadNames[threadID] = threading.current_thread().name
+        if excType != None:
+            self.args["error"] = excType.__name__
+        # list.append is atomic, so spans can be recorded from the scanning threads without a lock
+        events.append({
+            "name": self.name,
+            "cat": self.category,
+            "ph": "X",
+            "ts": (self.startNs - originNs) / 1000,
+            "dur": (endNs - self.startNs) / 1000,
+            "pid": os.getpid(),
+            "tid": threadID,
+            "args": self.args,
+        })
+        return False
+
+    def set(self, **args):
+        # Add arguments that are only known once the span has run, e.g. the number of entries read
+        self.args.update(args)
+
+
+def span(name, category="glass", **args):
+    # with trace.span("generateIDList"): ...
+    if not enabled:
+        return nullSpan
+    return Span(name, category, args)
+
+def start(path=None):
+    # Start recording, path is where the trace is saved (see getOutputPath if it is None)
+    global enabled, outputPath, originNs
+    events.clear()
+    threadNames.clear()
+    outputPath = path
+    originNs = time.perf_counter_ns()
+    enabled = True
+
+def startFromEnvironment():
+    # Start recording if GLASS_TRACE is set, returns whether tracing is on
+    value = os.environ.get(traceVariable, "")
+    if value == "" or value == "0":
+        return enabled
+    if not enabled:
+        start(None if value.lower() in ["1", "true", "yes"] else value)
+    return True
+
+def getChildVariable():
+    # The GLASS_TRACE to give a detached child process
+    # A file path gets a suffix, so the child (which usually finishes last) doesn't overwrite this command's trace
+    value = os.environ.get(traceVariable, "")
+    if value == "" or value == "0" or value.lower() in ["1", "true", "yes"] or os.path.isdir(value):
+        return value
+    base, extension = os.path.splitext(value)
+    return f"{base}-bg-{os.getpid()}{extension}"
+
+def getOutputPath(rootPath):
+    # A new file in .glass/logs, or in the directory given by GLASS_TRACE
+    fileName = f"trace-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.json"
+    if outputPath == None:
+        logsDir = os.path.join(rootPath, ".glass/logs") if rootPath != None else "."
+        return os.path.join(logsDir if os.path.isdir(logsDir) else ".", fileName)
+    if os.path.isdir(outputPath):
+        return os.path.join(outputPath, fileName)
+    return outputPath
+
+def save(rootPath=None):
+    # Write the recorded spans and stop recording, returns the path of the trace or None if tracing was off
+    global enabled
+    if not enabled:
+        return None
+    enabled = False
+
+    # Name the threads, so the scanning threads are told apart from the main thread in the viewer
+    metadata = [{"name": "process_name", "ph": "M", "pid": os.getpid(), "tid": 0, "args": {"name": "glass"}}]
+    for threadID, threadName in threadNames.items():
+        metadata.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": threadID, "args": {"name": threadName}})
+
+    path = getOutputPath(rootPath)
+    with open(path, "w", encoding="utf-8") as traceFile:
+        json.dump({"traceEvents": metadata + sorted(events, key=lambda event: event["ts"]), "displayTimeUnit": "ms"}, traceFile, separators=(",", ":"))
+    events.clear()
+    threadNames.clear()
+    return path
@@ -1,27 +1,170 @@
+import functools
 import os
 import re
 import json
+import sys
+from collections.abc import MutableMapping
 from datetime import datetime
 import time
 
 import click
-from . import project
+from . import completion
+from . import frontmatter
+from . import idstore
+from . import idtree
+from . import metacache
+from . import metrics
+from . import scanstate
+from . import searchindex
+from . import trace
+
+# Matches a single digit, used to read the parts of an ID
+digitPattern = re.compile("[0-9]")
+
+# Every ID format described in docs/idFormat.md: an optional storage letter, the area and category digits,
+# then optionally a subfolder, a project and a project child's revision
+idGrammar = re.compile(r"""
+    (?P<storage>[A-Z])?
+    (?P<area>[0-9])(?P<category>[0-9])
+    (?:\.(?P<subfolder>[0-9]{2})
+        (?:\.(?P<project>[0-9]{2})
+            (?:(?P<stage>[A-D])(?P<revision>[1-9]))?
+        )?
+    )?
+""", re.VERBOSE)
+
+@functools.lru_cache(maxsize=65536)
+def parseID(idText):
+    # Determine the level of the ID (area, catergory, subfolder, project or invalid)
+    # Returns (idType, numericalID, storageLocation, revision, revisionStage, descriptor), where None means the
+    # pathID keeps the value it was given
+    match = idGrammar.fullmatch(idText)
+    if match == None:
+        # IDs outside the grammar are read the long way, which explains why they're invalid
+        return parseIDFallback(idText)
+
+    storageLocation = match["storage"]
+    numericalID = idText[1:] if storageLocation != None else idText
+    # Two character IDs have always recorded their second digit as a revision
+    revision = idText[1:] if len(idText) == 2 else None
+
+    if match["subfolder"] == None:
+        return ("area" if match["category"] == "0" else "category"), numericalID, storageLocation, revision, None, None
+    if match["project"] == None:
+        return "subfolder", numericalID, storageLocation, revision, None, None
+    if match["stage"] == None:
+        return "project", numericalID, storageLocation, revision, None, None
+    return "child-project", numericalID, storageLocation, int(match["revision"]), match["stage"], None
+
+def parseIDFallback(idText):
+    # Classifies IDs that don't match the grammar, with the same results parseID has always given them
+    numbers = digitPattern
+    numericalID = idText
+    storageLocation = None
+    revision = None
+    revisionStage = None
+    
+    if len(idText) < 2:
+        return "invalid", numericalID, None, None, None, "ID is too short"
+
+    if len(idText) == 2:
+        idType = "child-project"
+        revision = idText[1:]
+    elif not numbers.match(idText):
+        # If the first letter of the ID points to a different storage location
+        storageLocation = idText[0]
+        numericalID = idText[1:]
+
+    idDepth = numericalID.count(".")
+    if idDepth == 0:
+        # It's either an area or a subject
+        if numbers.match(numericalID[0]) and numericalID[1] == "0":
+            # Area IDs have a non-zero first digit and a zero second digit
+            idType = "area"
+        elif numbers.match(numericalID[1]):
+            # Category Have A non-zero second digit and any first digit
+            idType = "category"
+        else:
+            # Return an error if the first 2 digits of the ID are chars instead of digits (Except for storage letter)
+            descriptor = None
+            if not numbers.match(numericalID[0]):
+                descriptor = "This ID does not have a number for the Area"
+            elif not numbers.match(numericalID[1]):
+                descriptor = "This ID does not have a number for the Category"
+            return "invalid", numericalID, storageLocation, revision, revisionStage, descriptor
+    
+    elif idDepth == 1:
+        # It's a subfolder
+        try:
+            int(idText[-2:])
+            idType = "subfolder"
+        except ValueError:
+            return "invalid", numericalID, storageLocation, revision, revisionStage, "The Subfolder ID contains characters"
+    else:
+        # It's a project
+        idType = "project"
+
+        # The project ID contains all characters after the 3rd period
+        projectID = ""
+        for index, item in enumerate(idText.split(".")):
+            if index >= 2:
+                projectID += "." + item
+
+        projectID = projectID[1:]
+        
+        
+        try:
+            # The ID has no characters, and hence no revisions
+            int(projectID)
+        except ValueError:
+            # If the ID has revision 
+            if (not numbers.match(projectID[-2])) and numbers.match(projectID[-1]):
+                revisionStage = idText[-2]
+                revision = int(idText[-1])
+                idType = "child-project"
+            else:
+                idType = "invalid"
+                return idType, numericalID, storageLocation, revision, revisionStage, "Invalid Project ID, Either you have a 2 digit version number or no Revision Letter"
+
+    return idType, numericalID, storageLocation, revision, revisionStage, None
+
+def getAncestorID(numericalID, idType, level):
+    # Get the numerical ID of the level specified that an ID falls within
+    # Returns None if the ID is invalid or is above that level
+    levelDict = pathID.levelDict
+    if idType not in levelDict or levelDict[idType] < levelDict[level]:
+        return None
+    
+    if level == "area":
+        return f"{numericalID[0]}0"
+    if level == "category":
+        return f"{numericalID[0:2]}"
+    if level == "subfolder":
+        return f"{numericalID[0:5]}"
+    if level == "project":
+        return f"{numericalID[0:8]}"
+    return None
 
 class pathID:
+    # There can be 100k+ pathIDs in memory, so they don't get a __dict__
+    __slots__ = ("path", "idText", "idType", "numericalID", "descriptor", "storageLocation", "revision", "revisionStage")
+
+    # The depth of each type of ID
+    levelDict = {"area": 0, "category": 1, "subfolder": 2, "project": 3, "child-project": 4}
+
     def __init__(self, idString, path, doValidation, **kwargs):
         self.path = path.replace("/", "\\") # The path to the folder 
         self.idText = idString # The ID itself
-        self.idType = kwargs.get("idType", "invalid") # The type of Id
+        # The same few type, storage and stage strings are shared by every ID rather than copied for each
+        self.idType = sys.intern(kwargs.get("idType", "invalid")) # The type of Id
         self.numericalID = kwargs.get("numericalID", "") # The type of Id
 
         self.descriptor = kwargs.get("desc", "")
 
-        self.storageLocation = kwargs.get("storage", "A")
+        self.storageLocation = sys.intern(kwargs.get("storage", "A"))
 
         self.revision = kwargs.get("revision", -1) # The current revision (only applicable if it's a project) 
-        self.revisionStage = kwargs.get("revisionStage", "A")
-
-        self.levelDict = {"area": 0, "category": 1, "subfolder": 2, "project": 3, "child-project": 4}
+        self.revisionStage = sys.intern(kwargs.get("revisionStage", "A"))
 
         if doValidation:
             self.detectIDContext()
@@ -33,74 +176,17 @@ class pathID:
 
     def detectIDContext(self):
         # Determine the level of the ID (area, catergory, subfolder, project or invalid)
-        numbers = re.compile("[0-9]")
-        self.numericalID = self.idText
-        
-        if len(self.idText) < 2:
-            self.idType = "invalid"
-            self.descriptor = "ID is too short"
-            return
-
-        if len(self.idText) == 2:
-            self.idType = "child-project"
-            self.revision = self.idText[1:]
-        elif not numbers.match(self.idText):
-            # If the first letter of the ID points to a different storage location
-            self.storageLocation = self.idText[0]
-            self.numericalID = self.idText[1:]
-
-        idDepth = self.numericalID.count(".")
-        if idDepth == 0:
-            # It's either an area or a subject
-            if numbers.match(self.numericalID[0]) and self.numericalID[1] == "0":
-                # Area IDs have a non-zero first digit and a zero second digit
-                self.idType = "area"
-            elif numbers.match(self.numericalID[1]):
-                # Category Have A non-zero second digit and any first digit
-                self.idType = "category"
-            else:
-                # Return an error if the first 2 digits of the ID are chars instead of digits (Except for storage letter)
-                self.idType = "invalid"
-                if not numbers.match(self.numericalID[0]):
-                    self.descriptor = "This ID does not have a number for the Area"
-                elif not numbers.match(self.numericalID[1]):
-                    self.descriptor = "This ID does not have a number for the Category"
-                return
-        
-        elif idDepth == 1:
-            # It's a subfolder
-            try:
-                int(self.idText[-2:])
-                self.idType = "subfolder"
-            except ValueError:
-                self.idType = "invalid"
-                self.descriptor = "The Subfolder ID contains characters"
-                return
-        else:
-            # It's a project
-            self.idType = "project"
-
-            # The project ID contains all characters after the 3rd period
-            projectID = ""
-            for index, item in enumerate(self.idText.split(".")):
-                if index >= 2:
-                    projectID += "." + item
-
-            projectID = projectID[1:]
-            
-            
-            try:
-                # The ID has no characters, and hence no revisions
-                int(projectID)
-            except ValueError:
-                # If the ID has revision 
-                if (not numbers.match(projectID[-2])) and numbers.match(projectID[-1]):
-                    self.revisionStage = self.idText[-2]
-                    self.revision = int(self.idText[-1])
-                    self.idType = "child-project"
-                else:
-                    self.idType = "invalid"
-                    self.descriptor = "Invalid Project ID, Either you have a 2 digit version number or no Revision Letter"
+        idType, numericalID, storageLocation, revision, revisionStage, descriptor = parseID(self.idText)
+        self.idType = idType
+        self.numericalID = numericalID
+        if storageLocation != None:
+            self.storageLocation = storageLocation
+        if revision != None:
+            self.revision = revision
+        if revisionStage != None:
+            self.revisionStage = revisionStage
+        if descriptor != None:
+            self.descriptor = descriptor
         
     def validatePath(self):
         # Ensure the path (as read from the file name) matches the folder it is within
@@ -114,11 +200,12 @@ class pathID:
 
                 levelIndex = pathIndex - rootIndex
                 if levelIndex <= 3:
-                    if not pathSection.split(' - ')[0] == self.getHigherLevel(levels[levelIndex]):
+                    ancestorID = self.getAncestor(levels[levelIndex])
+                    if not pathSection.split(' - ')[0] == ancestorID:
                         return {
                             "validPath": False, 
                             "desc": (f"There is a mismatch in the path. "
-                                     f"The object has {levels[levelIndex]} ID {self.getHigherLevel(levels[levelIndex])} "
+                                     f"The object has {levels[levelIndex]} ID {ancestorID} "
                                      f"but the path indicates it has ID {pathSection.split(' - ')[0]}"),
                             "path": self.path
                         }
@@ -131,15 +218,11 @@ class pathID:
             raise Exception(f"Error, Cannot get the higher level ID of an invalid ID")
         if self.levelDict[self.idType] < self.levelDict[level]:
             raise Exception(f"Error, Cannot find the {level} of an ID at level {self.idType}")
-        
-        if level == "area":
-            return f"{self.numericalID[0]}0"
-        if level == "category":
-            return f"{self.numericalID[0:2]}"
-        if level == "subfolder":
-            return f"{self.numericalID[0:5]}"
-        if level == "project":
-            return f"{self.numericalID[0:8]}"
+        return self.getAncestor(level)
+
+    def getAncestor(self, level):
+        # The same as getHigherLevel, but returns None instead of raising an exception
+        return getAncestorID(self.numericalID, self.idType, level)
 
     def display(self, storageLabels, revisionLabels):
         # Display the PathID in a human-readable format
@@ -155,139 +238,299 @@ class pathID:
             print(f"Revision: {self.revision}")
    
 
-def generateIDList(fsPath, excludedList):
+def generateIDList(fsPath, excludedList, scanState=None, workers=1):
     # Checks to find all the IDs in the root directory and subfolders
     # Does not search within folders in the excluded list
-    # TODO Maybe recursion?
+    # If a scanState is provided, directories that haven't changed since the last scan are not re-read
+    # With more than one worker, each category's subtree is scanned on its own thread
 
-    # Searches for the children of each ID, going down a level each time
-    IDList, invalidIDList = getSubIDs(fsPath, excludedList)
-    for IDType in ["area", "category", "subfolder", "project", "project-child"]:
-        for itemID in IDList:
-            if itemID.idType == IDType:
-                validIDs, invalidIDs = getSubIDs(itemID.path, excludedList, itemID)
-                IDList = IDList + validIDs
+    # Only the background tasks scan, so other commands don't import the thread pool
+    from concurrent.futures import ThreadPoolExecutor
 
-                # Paths with subfolders cannot be invalid
-                if IDType != "subfolder":
-                    invalidIDList = invalidIDList + invalidIDs
+    IDList, invalidIDList, idPaths = getSubIDs(fsPath, excludedList, scanState=scanState)
+    areas = [(itemID, itemPath) for itemID, itemPath in zip(IDList, idPaths) if itemID.idType == "area"]
+    # Any other valid IDs in the root are scanned as subtrees of their own
+    seeds = [(itemID, itemPath) for itemID, itemPath in zip(IDList, idPaths) if itemID.idType != "area"]
 
-    IDList = assignRevisions(IDList)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        # List the categories of every area, then fan the category subtrees out over the pool
+        # pool.map returns results in submission order, so the merged lists are deterministic
+        for validIDs, invalidIDs, validPaths in pool.map(lambda area: getSubIDs(area[1], excludedList, area[0], scanState), areas):
+            IDList.extend(validIDs)
+            invalidIDList.extend(invalidIDs)
+            seeds.extend(zip(validIDs, validPaths))
+
+        for validIDs, invalidIDs in pool.map(lambda seed: scanSubtree(seed[0], seed[1], excludedList, scanState), seeds):
+            IDList.extend(validIDs)
+            invalidIDList.extend(invalidIDs)
+
+    with trace.span("assignRevisions"):
+        IDList = assignRevisions(IDList)
 
     return IDList, invalidIDList
 
-def getSubIDs(fsPath, excludedList, parentID=None):
-    # Find all subIDs in a path
-    dirStructure = os.scandir(fsPath)
-    ids, invalidIDs = [], []
-    for folder in dirStructure:
-        try:
-            endText = folder.path.split("\\")[-1]
-            if endText.lower() not in excludedList:
-                idText, desc = endText.split(" - ")
+def scanSubtree(seedID, seedPath, excludedList, scanState=None):
+    # Find every ID below seedID in a single depth first pass, reading each directory once
+    subtreeIDs, invalidIDList = [], []
+    toScan = [(seedID, seedPath)]
+    while len(toScan) != 0:
+        parentID, parentPath = toScan.pop()
+        validIDs, invalidIDs, validPaths = getSubIDs(parentPath, excludedList, parentID, scanState)
+        subtreeIDs.extend(validIDs)
+
+        # Subfolders hold the actual files, so folders within them without an ID are expected
+        if parentID.idType != "subfolder":
+            invalidIDList.extend(invalidIDs)
+
+        # Project children are the lowest level of ID, so their contents are never read
+        # Pushed in reverse so that siblings are visited in the order they were listed
+        for childID, childPath in reversed(list(zip(validIDs, validPaths))):
+            if childID.idType != "child-project":
+                toScan.append((childID, childPath))
+
+    return subtreeIDs, invalidIDList
+
+def getSubIDs(fsPath, excludedList, parentID=None, scanState=None):
+    # Find all subIDs in the folders directly within a path
+    # Returns the valid IDs, the invalid IDs and the location on disk of each valid ID
+    if scanState != None:
+        mtime = scanState.getMTime(fsPath)
+        cached = scanState.lookup(fsPath, mtime)
+        if cached != None:
+            validRecords, invalidRecords = cached
+            return (
+                [idFromRecord(record) for record in validRecords],
+                [idFromRecord(record) for record in invalidRecords],
+                [os.path.join(fsPath, record["name"]) for record in validRecords]
+            )
+
+    ids, invalidIDs, idNames = [], [], []
+    with trace.span("scandir", "scan", path=fsPath) as scanSpan, os.scandir(fsPath) as dirStructure:
+        for folder in dirStructure:
+            # Only folders can be IDs. is_dir() uses the type reported by scandir, so no extra stat is needed
+            if not folder.is_dir():
+                continue
+
+            endText = folder.name
+            if endText.lower() in excludedList:
+                continue
 
-                # If the parentID is a project, then the folder may only contain the revision letter
-                # Hence, append the ID of the parent to flesh it out
-                if parentID != None:
-                    if parentID.idType == "project" and len(idText) == 2:
-                        idText = parentID.idText + idText
-
-                thisID = pathID(idText, folder.path, doValidation=True, desc=desc)
-                if thisID.idType != "invalid":
-                    ids.append(thisID)
-                else:
-                    invalidIDs.append(thisID)
-        except ValueError:
-            if endText.lower() not in excludedList:
+            try:
+                idText, desc = endText.split(" - ")
+            except ValueError:
                 thisID = pathID("", folder.path, doValidation=False, desc="Invalid Folder Name, no discernible ID")
                 invalidIDs.append(thisID)
+                continue
+
+            # If the parentID is a project, then the folder may only contain the revision letter
+            # Hence, append the ID of the parent to flesh it out
+            if parentID != None:
+                if parentID.idType == "project" and len(idText) == 2:
+                    idText = parentID.idText + idText
+
+            thisID = pathID(idText, folder.path, doValidation=True, desc=desc)
+            if thisID.idType != "invalid":
+                ids.append(thisID)
+                idNames.append(endText)
+            else:
+                invalidIDs.append(thisID)
+        scanSpan.set(valid=len(ids), invalid=len(invalidIDs))
+
+    if scanState != None:
+        scanState.store(
+            fsPath,
+            mtime,
+            [dict(idToRecord(thisID, True), name=idName) for thisID, idName in zip(ids, idNames)],
+            [idToRecord(thisID, True) for thisID in invalidIDs]
+        )
     
-    return ids, invalidIDs
+    return ids, invalidIDs, [os.path.join(fsPath, idName) for idName in idNames]
+
+def idToRecord(thisID, includeIDText=False):
+    # Convert a pathID into the dictionary stored in the ID files
+    record = {
+        "numericalID": thisID.numericalID,
+        "path": thisID.path,
+        "type": thisID.idType,
+        "descriptor": thisID.descriptor,
+        "storageLocation": thisID.storageLocation,
+        "revisionStage": thisID.revisionStage,
+        "revisionCount": thisID.revision
+    }
+    if includeIDText:
+        record["idText"] = thisID.idText
+    return record
+
+def idFromRecord(record, idText=None):
+    # Rebuild a pathID from a dictionary stored in the ID files, without re-validating it
+    if idText == None:
+        idText = record["idText"]
+    return pathID(
+        idText,
+        record["path"],
+        False,
+        idType=record["type"],
+        numericalID=record["numericalID"],
+        desc=record["descriptor"],
+        storage=record["storageLocation"],
+        revision=record["revisionCount"],
+        revisionStage=record["revisionStage"]
+    )
 
 def exportIDlist(IDList, outputPath):
-    # Exports all the IDs to a .json file
+    # Exports all the IDs to a .json manifest and its per-area shard files (see idstore)
     # TODO Fix issue w/ the paths in the json containing a mix of / and \\
     # TODO Implement a better sorting method for projects (i.e aware of current revision)
 
     IDList.sort(key=lambda x: x.numericalID)
-    outputDict = {"metaData": {"createdUTC": round(time.time())}, "IDs": {}}
+    records = {}
     for exportID in IDList:
-        outputDict["IDs"][exportID.idText] = {
-            "numericalID": exportID.numericalID,
-            "path": exportID.path,
-            "type": exportID.idType,
-            "descriptor": exportID.descriptor,
-            "storageLocation": exportID.storageLocation,
-            "revisionStage": exportID.revisionStage,
-            "revisionCount": exportID.revision
-        }
-    
-    with open(f"{outputPath}", "w", encoding="utf-8") as outputFile:
-        json.dump(outputDict, outputFile, indent=4)
+        records[exportID.idText] = idToRecord(exportID)
+    idstore.writeRecords(outputPath, records)
+    searchindex.updateStorage(os.path.dirname(outputPath), idstore.getStorageLabel(outputPath), idstore.sortRecords(records))
+
+class IDDict(MutableMapping):
+    # A mapping of ID text to pathIDs, which keeps the raw records and only builds a pathID when it's accessed
+    # If idFilePath is given, records are read from that ID file as they're needed: a single ID only reads
+    # the shard (or database row) holding it, while iterating reads every ID
+    # The tree index is built the first time it's needed
+    def __init__(self, records=None, idFilePath=None):
+        self.entries = dict(records) if records != None else {} # Raw records, replaced by pathIDs once accessed
+        self.idFilePath = idFilePath
+        self._tree = None
+
+    def loadAll(self):
+        if self.idFilePath == None:
+            return
+        entries = idstore.readRecords(self.idFilePath)
+        # IDs accessed, modified or added so far replace the records from the file
+        entries.update(self.entries)
+        self.entries = entries
+        self.idFilePath = None
+
+    def loadEntry(self, key):
+        if key not in self.entries and self.idFilePath != None:
+            record = idstore.readRecord(self.idFilePath, key)
+            if record != None:
+                self.entries[key] = record
+        return self.entries[key]
+
+    @property
+    def tree(self):
+        if self._tree == None:
+            self._tree = idtree.IDTree(self.values())
+        return self._tree
+
+    def __getitem__(self, key):
+        entry = self.loadEntry(key)
+        if isinstance(entry, dict):
+            entry = idFromRecord(entry, key)
+            self.entries[key] = entry
+        return entry
+
+    def __contains__(self, key):
+        try:
+            self.loadEntry(key)
+        except KeyError:
+            return False
+        return True
+
+    def __setitem__(self, key, value):
+        self.entries[key] = value
+        self._tree = None
 
-def loadIDDict(rootPath, storageLabel=""):
-    IDDict = {}
+    def __delitem__(self, key):
+        self.loadAll()
+        del self.entries[key]
+        self._tree = None
+
+    def __iter__(self):
+        self.loadAll()
+        return iter(self.entries)
+
+    def __len__(self):
+        self.loadAll()
+        return len(self.entries)
+
+def getIDFilePath(rootPath, storageLabel=""):
     if storageLabel == "A":
         storageLabel = ""
-    with open(os.path.join(rootPath, f".glass/data/IDPaths{storageLabel}.json"), "r", encoding="utf-8") as IDFile:
-        rawData = json.load(IDFile)
-        
-        for key in rawData["IDs"].keys():
-            thisID = rawData["IDs"][key]
-            IDDict[key] = pathID(
-                    key,
-                    thisID["path"],
-                    False,
-                    idType=thisID["type"],
-                    numericalID=thisID["numericalID"],
-                    desc=thisID["descriptor"],
-                    storage=thisID["storageLocation"],
-                    revision=thisID["revisionCount"],
-                    revisionStage=thisID["revisionStage"]
-                )
-    
-    
-    return IDDict
+    return os.path.join(rootPath, f".glass/data/IDPaths{storageLabel}.json")
+
+def loadIDDict(rootPath, storageLabel="", prefix=None):
+    # Raises FileNotFoundError if the storage location doesn't have an ID file
+    # prefix limits the IDs that are loaded to an ID and its descendants (e.g. "21" or "2" for area 20)
+    idFilePath = getIDFilePath(rootPath, storageLabel)
+    if prefix != None:
+        return IDDict(idstore.readRecords(idFilePath, prefix))
+
+    # Check the ID file can be read, the IDs themselves are read as they're used
+    idstore.readManifest(idFilePath)
+    return IDDict(idFilePath=idFilePath)
+
+def findID(rootPath, idText):
+    # The path of an ID on every storage location that has it, keyed by storage letter
+    # Raises KeyError if no storage location has the ID
+    locations = idstore.readLocations(os.path.join(rootPath, ".glass/data"))
+    return locations["ids"][idstore.stripStorageLetter(idText)]
+
+def resolveID(rootPath, idText, storageLabel):
+    # The path of an ID on one storage location, without reading that storage location's ID file
+    # Raises FileNotFoundError if the storage location has no ID file, and KeyError if it doesn't have the ID
+    locations = idstore.readLocations(os.path.join(rootPath, ".glass/data"))
+    if storageLabel not in locations["storages"]:
+        raise FileNotFoundError(getIDFilePath(rootPath, storageLabel))
+    return locations["ids"][idstore.stripStorageLetter(idText)][storageLabel]
+
+def countChildren(rootPath, numericalID, storageLabel=""):
+    # The number of IDs directly within an ID
+    return idstore.countChildren(getIDFilePath(rootPath, storageLabel), numericalID)
 
 def assignRevisions(idList):
     # Determine the revision of every project based on it's child IDs
-    for thisID in idList:
-        if thisID.idType == "project" and thisID.revision == -1:
-            childIDs = []
-            for subID in idList:
-                try:
-                    if subID.getHigherLevel("project") == thisID.numericalID.strip() and subID.revision != -1:
-                        childIDs.append(subID)
-                except Exception:
-                    pass
-            
-            childIDs.sort(key=lambda x: x.numericalID)
-
-            try:
-                thisID.revision = childIDs[-1].revision
-                thisID.revisionStage = childIDs[-1].revisionStage
-            except IndexError:
-                # If there are no children for the ID
-                pass
+    tree = idtree.IDTree(idList)
+    for projectNode in tree.levels["project"]:
+        childIDs = [childID for childID in tree.children(projectNode.numericalID) if childID.revision != -1]
+        if len(childIDs) == 0:
+            # If there are no children for the ID
+            continue
+        latestChild = max(childIDs, key=lambda x: x.numericalID)
+
+        for thisID in projectNode.ids:
+            if thisID.revision == -1:
+                thisID.revision = latestChild.revision
+                thisID.revisionStage = latestChild.revisionStage
     
     return idList
 
-def readFileSystem(logFile, rootPath, excludedList):
+def readFileSystem(logFile, rootPath, excludedList, workers=1, changedPaths=None):
     # Reads the files from the file system and save paths to each ID
+    # changedPaths can list the only directories that may have changed since the last scan (see ScanState)
     indent = " "
     logFile.write(f"{datetime.now().isoformat()}{indent}BEGIN Loading IDs\n")
 
     indent = " "*3
-    IDList, invalidIDList = generateIDList(rootPath, excludedList)
+    scanState = scanstate.ScanState(os.path.join(rootPath, ".glass/data/scanState.json"), excludedList, changedPaths)
+    with metrics.phase("generateIDList") as scanSpan:
+        IDList, invalidIDList = generateIDList(rootPath, excludedList, scanState, workers)
+        scanSpan.set(workers=workers, scanned=scanState.scannedCount, reused=scanState.skippedCount, ids=len(IDList))
+    with trace.span("saveScanState"):
+        scanState.save()
+    metrics.add("directories_scanned", scanState.scannedCount)
+    metrics.add("directories_skipped", scanState.skippedCount)
+    metrics.add("ids_found", len(IDList) + len(invalidIDList))
+    metrics.add("ids_valid", len(IDList))
+    metrics.add("ids_invalid", len(invalidIDList))
+    logFile.write(f"{datetime.now().isoformat()}{indent}INFO scanned {scanState.scannedCount} directories, reused {scanState.skippedCount} unchanged directories\n")
     logFile.write(f"{datetime.now().isoformat()}{indent}INFO found {len(IDList)} valid IDs\n")
 
-     # Detect if any IDs are the same
-    scannedIDs = []
+     # Detect if any IDs are the same, each duplicate is paired with the first ID that had its text
+    firstIDs = {}
     equalIDs = []
     for thisID in IDList:
-        if thisID.idText in scannedIDs:
-            equalIDs.append([thisID, IDList[scannedIDs.index(thisID.idText)]])
-        scannedIDs.append(thisID.idText)
+        firstID = firstIDs.setdefault(thisID.idText, thisID)
+        if firstID is not thisID:
+            equalIDs.append([thisID, firstID])
     
     
     # Write Warning about Equivalent IDs
@@ -311,7 +554,8 @@ def readFileSystem(logFile, rootPath, excludedList):
     
     indent = " "*3
     logFile.write(f"{datetime.now().isoformat()}{indent}INFO Writing data to {rootPath}/.glass/data/IDPaths.json\n")
-    exportIDlist(IDList, os.path.join(rootPath, ".glass/data/IDPaths.json"))
+    with metrics.phase("exportIDlist"):
+        exportIDlist(IDList, os.path.join(rootPath, ".glass/data/IDPaths.json"))
     indent = " "*1
     logFile.write(f"{datetime.now().isoformat()}{indent}END Loading IDs\n")
 
@@ -331,6 +575,9 @@ def checkDrives(logFile, rootPath):
     indent = " "*5
     driveLetters = [item['letter'] for item in driveList]
     for path in os.listdir(f"{rootPath}/.glass/data/"):
+        # Only the ID files correspond to drives, other data files (e.g. scanState.json) are skipped
+        if not (path.startswith("IDPaths") and path.endswith(".json")):
+            continue
         driveLetter = path.split(".")[0][-1]
         # Because the central IDList doesn't end in A
         if driveLetter == "s":
@@ -343,7 +590,155 @@ def checkDrives(logFile, rootPath):
     indent = " "*1
     logFile.write(f"{datetime.now().isoformat()}{indent}END Comparing Drives\n")
 
-def doBackgroundTasks(rootPath, metaPath, excludedList, command, version):
+# A lock held for longer than this is assumed to be left behind by a process that was killed
+lockMaxAge = 60 * 60
+# Callers joining another process's scan give up after this many seconds, in case its owner is stuck or the PID in
+# the lock has been reused by an unrelated process (which keeps the lock looking alive until lockMaxAge)
+lockWaitLimit = 5 * 60
+
+def processIsRunning(pid):
+    # Checks whether the process that wrote a lock file is still alive
+    if os.name == "nt":
+        # os.kill would terminate the process on Windows, so ask the kernel for its exit code instead
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid) # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        exitCode = ctypes.c_ulong()
+        ctypes.windll.kernel32.GetExitCodeProcess(handle, ctypes.byref(exitCode))
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return exitCode.value == 259 # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class BackgroundLock:
+    # Makes sure only one process at a time runs the background tasks for a root directory
+    def __init__(self, rootPath):
+        self.lockPath = os.path.join(rootPath, ".glass/background.lock")
+        self.held = False
+
+    def isStale(self):
+        try:
+            with open(self.lockPath, "r", encoding="utf-8") as lockFile:
+                owner = json.load(lockFile)
+            return time.time() - owner["created"] > lockMaxAge or not processIsRunning(owner["pid"])
+        except FileNotFoundError:
+            return False
+        except (ValueError, KeyError, TypeError):
+            # The owner may still be writing the file, so only an old, unreadable lock is stale
+            try:
+                return time.time() - os.stat(self.lockPath).st_mtime > 10
+            except FileNotFoundError:
+                return False
+
+    def tryAcquire(self):
+        try:
+            lockFd = os.open(self.lockPath, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not self.isStale():
+                return False
+            try:
+                os.remove(self.lockPath)
+            except FileNotFoundError:
+                pass
+            return self.tryAcquire()
+        with os.fdopen(lockFd, "w", encoding="utf-8") as lockFile:
+            json.dump({"pid": os.getpid(), "created": time.time()}, lockFile)
+        self.held = True
+        return True
+
+    def acquire(self, wait, pollInterval=0.2, timeout=None):
+        # Returns False straight away if another process holds the lock and wait is False,
+        # or once timeout seconds have passed without the lock being released
+        deadline = time.monotonic() + timeout if timeout != None else None
+        while not self.tryAcquire():
+            if not wait or (deadline != None and time.monotonic() >= deadline):
+                return False
+            time.sleep(pollInterval)
+        return True
+
+    def release(self):
+        if self.held:
+            self.held = False
+            try:
+                os.remove(self.lockPath)
+            except FileNotFoundError:
+                pass
+
+createdPattern = re.compile(rb'"createdUTC":\s*(\d+)')
+
+def getIndexCreated(rootPath):
+    # Returns when the central ID file was written (UTC seconds), or None if it doesn't exist
+    # The metadata is written first, so it can be read without parsing the whole file
+    try:
+        with open(os.path.join(rootPath, ".glass/data/IDPaths.json"), "rb") as IDFile:
+            match = createdPattern.search(IDFile.read(256))
+            if match != None:
+                return int(match.group(1))
+            IDFile.seek(0)
+            return json.load(IDFile)["metaData"]["createdUTC"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+def doBackgroundTasks(rootPath, metaPath, excludedList, command, version, workers=1, changedPaths=None, freshness=0, wait=True, reuseRunning=True):
+    # Runs the background tasks unless they aren't needed
+    # freshness skips the tasks if the IDs were written less than that many seconds ago, only read-only callers should pass it
+    # If another process is already running the tasks, either wait for it to finish and use its results, or skip them if wait is False
+    # A caller that has just changed the file system passes reuseRunning=False, as the running scan may have read the folders
+    # before the change, so the tasks are run again once it finishes
+    # Returns True if the tasks were run by this call
+    if freshness > 0:
+        createdUTC = getIndexCreated(rootPath)
+        if createdUTC != None and time.time() - createdUTC < freshness:
+            return False
+
+    lock = BackgroundLock(rootPath)
+    waitStarted = int(time.time())
+    if not lock.acquire(False):
+        if not wait:
+            return False
+        with trace.span("waitForLock"):
+            acquired = lock.acquire(True, timeout=lockWaitLimit)
+        if not acquired:
+            with open(os.path.join(rootPath, ".glass/logs/background.txt"), "a") as logFile:
+                logFile.write(f"{datetime.now().isoformat()} WARN Gave up waiting {lockWaitLimit} seconds for the background tasks in another process\n")
+                logFile.write(f"{datetime.now().isoformat()}     WARN Remove {lock.lockPath} if no other glass process is running\n")
+            return False
+        createdUTC = getIndexCreated(rootPath)
+        if reuseRunning and createdUTC != None and createdUTC >= waitStarted:
+            # The other process finished its scan after this call started, so it doesn't need to be repeated
+            lock.release()
+            return False
+
+    metrics.start(command, version)
+    succeeded = False
+    try:
+        with trace.span("runBackgroundTasks"):
+            succeeded = runBackgroundTasks(rootPath, metaPath, excludedList, command, version, workers, changedPaths)
+    finally:
+        try:
+            metrics.finish(rootPath, succeeded == True)
+        except OSError:
+            # The metrics are only informational, so they never stop the lock being released
+            pass
+        lock.release()
+    return True
+
+def writeCompletionCache(rootPath, IDList):
+    # The primary storage location's IDs come from the scan, the other storage locations from their ID files
+    records = [(thisID.idText, idToRecord(thisID)) for thisID in IDList]
+    dataDir = os.path.join(rootPath, ".glass/data")
+    for fileName in sorted(os.listdir(dataDir)):
+        if fileName.startswith("IDPaths") and fileName.endswith(".json") and fileName != "IDPaths.json":
+            records += idstore.readRecords(os.path.join(dataDir, fileName)).items()
+    completion.writeCache(rootPath, records)
+
+def runBackgroundTasks(rootPath, metaPath, excludedList, command, version, workers=1, changedPaths=None):
     indent = " "*1
 
     # Clear Log File
@@ -360,7 +755,8 @@ def doBackgroundTasks(rootPath, metaPath, excludedList, command, version):
 
     # Compare Drives
     try:
-        checkDrives(logFile, rootPath)
+        with metrics.phase("checkDrives"):
+            checkDrives(logFile, rootPath)
     except Exception as e:
         logFile.write(f"{datetime.now().isoformat()}{indent} ERROR in Drive Comparator\n")
         indent = " "*5
@@ -370,7 +766,8 @@ def doBackgroundTasks(rootPath, metaPath, excludedList, command, version):
     
     # Save IDs
     try:
-        IDList = readFileSystem(logFile, rootPath, excludedList)
+        with metrics.phase("readFileSystem"):
+            IDList = readFileSystem(logFile, rootPath, excludedList, workers, changedPaths)
     except Exception as e:
         logFile.write(f"{datetime.now().isoformat()}{indent} ERROR in File System Reader\n")
         indent = " "*5
@@ -379,15 +776,58 @@ def doBackgroundTasks(rootPath, metaPath, excludedList, command, version):
 
     # Save Projects
     try: 
-        project.readProjectsFileSystem(logFile, metaPath, IDList)
+        # project imports this module, and is only needed here
+        from . import project
+        with metrics.phase("readProjectsFileSystem"):
+            validProjects = project.readProjectsFileSystem(logFile, metaPath, IDList, metacache.getCachePath(rootPath))
+        with metrics.phase("updateSearchIndex"):
+            titles = {proj.id.numericalID: frontmatter.formatValue(proj.properties.get("title", "")) for proj in validProjects}
+            records = idstore.sortRecords({thisID.idText: idToRecord(thisID) for thisID in IDList})
+            searchindex.setProjectTitles(os.path.join(rootPath, ".glass/data"), titles, records)
     except Exception as e:
         logFile.write(f"{datetime.now().isoformat()}{indent} ERROR in Project Reader\n")
         indent = " "*5
         logFile.write(f"{datetime.now().isoformat()}{indent} ERROR {e}\n")
         return
     
+    # Save the IDs for shell completion
+    try:
+        with metrics.phase("writeCompletionCache"):
+            writeCompletionCache(rootPath, IDList)
+    except Exception as e:
+        logFile.write(f"{datetime.now().isoformat()}{indent} ERROR in Completion Cache\n")
+        indent = " "*5
+        logFile.write(f"{datetime.now().isoformat()}{indent} ERROR {e}\n")
+        return
+
     indent = " "*1
     logFile.write(f"{datetime.now().isoformat()}{indent}END Background Tasks\n")
+    return True
+
+def spawnBackgroundTasks(rootPath, ifStale=False):
+    # Start `glass bg` in a detached, low priority process so the current command can return straight away
+    # The child process records its progress and outcome in .glass/logs/background.txt
+    import subprocess
+    command = [sys.executable, "-m", "glass", "bg", "--low-priority"]
+    if ifStale:
+        command.append("--if-stale")
+    options = {"stdin": subprocess.DEVNULL, "stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL, "close_fds": True}
+    if trace.traceVariable in os.environ:
+        options["env"] = dict(os.environ, **{trace.traceVariable: trace.getChildVariable()})
+    if os.name == "nt":
+        options["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.BELOW_NORMAL_PRIORITY_CLASS
+    else:
+        # A new session stops the child from being killed along with the terminal that started it
+        options["start_new_session"] = True
+
+    try:
+        subprocess.Popen(command, **options)
+        return True
+    except OSError as e:
+        with open(os.path.join(rootPath, ".glass/logs/background.txt"), "a") as logFile:
+            logFile.write(f"{datetime.now().isoformat()} ERROR Could not start the detached background tasks\n")
+            logFile.write(f"{datetime.now().isoformat()}     ERROR {e}\n")
+        return False
 
 def selectFromList(list):
     # Allow the user to select an item from a list
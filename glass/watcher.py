@@ -0,0 +1,500 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+from . import completion
+from . import frontmatter
+from . import idstore
+from . import metacache
+from . import project
+from . import scanstate
+from . import searchindex
+from . import util
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+treeMask = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+vaultMask = IN_CLOSE_WRITE | IN_MODIFY | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+eventHeader = struct.Struct("iIII")
+
+# Changes are collected until the file system has been quiet for this long, so a burst of
+# changes (e.g. copying a folder tree) is applied as one update
+settleSeconds = 1.0
+
+
+class Changes:
+    def __init__(self):
+        # The directories of the root tree whose entries changed. None if every directory must be checked
+        self.changedPaths = set()
+        # The vault notes that were written, created or removed. None if every note must be checked
+        self.changedNotes = set()
+
+    def isEmpty(self):
+        return self.changedPaths != None and len(self.changedPaths) == 0 and self.changedNotes != None and len(self.changedNotes) == 0
+
+
+class InotifyWatcher:
+    def __init__(self, libc):
+        # Watches every scanned directory of the root tree and every folder of the Obsidian vault
+        # Each watch is tracked by its descriptor, as the kernel reports events (and moves) against the descriptor,
+        # not the path it was added with
+        self.libc = libc
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {} # Watch descriptor: (path, isVault)
+        self.paths = {} # Path: watch descriptor
+
+    def addWatch(self, path, mask, isVault):
+        if path in self.paths:
+            return
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            # The folder was removed before it could be watched
+            return
+        oldWatch = self.watches.get(wd)
+        if oldWatch != None:
+            # The kernel already watched this folder under another path, which it no longer has
+            self.paths.pop(oldWatch[0], None)
+        self.watches[wd] = (path, isVault)
+        self.paths[path] = wd
+
+    def removeWatch(self, wd):
+        path, isVault = self.watches.pop(wd)
+        if self.paths.get(path) == wd:
+            del self.paths[path]
+        # The kernel follows up with IN_IGNORED, which is skipped as the descriptor is no longer known
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def forgetMovedFolder(self, path):
+        # The folders below a moved folder keep their watches, but the paths they were added with are gone
+        # Their new paths are watched once the folders have been scanned at their new location
+        prefix = path + os.sep
+        for watchedPath, wd in list(self.paths.items()):
+            if watchedPath == path or watchedPath.startswith(prefix):
+                self.removeWatch(wd)
+
+    def update(self, treePaths, vaultPath, rescanVault):
+        # Watch the directories of the root tree from the last scan, and the vault's folders if they may have changed
+        treePaths = set(treePaths)
+        for path, wd in list(self.paths.items()):
+            if not self.watches[wd][1] and path not in treePaths:
+                # The folder is no longer part of the tree (e.g. it was renamed so it doesn't have an ID)
+                self.removeWatch(wd)
+        for path in treePaths:
+            self.addWatch(path, treeMask, False)
+        if rescanVault:
+            for dirPath, dirNames, fileNames in os.walk(vaultPath):
+                self.addWatch(dirPath, vaultMask, True)
+
+    def readEvents(self, changes):
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, nameLength = eventHeader.unpack_from(data, offset)
+            name = data[offset + eventHeader.size:offset + eventHeader.size + nameLength].rstrip(b"\0")
+            offset += eventHeader.size + nameLength
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, so every directory and note has to be checked
+                changes.changedPaths = None
+                changes.changedNotes = None
+                continue
+
+            path, isVault = self.watches.get(wd, (None, False))
+            if path == None:
+                continue
+            if mask & IN_IGNORED:
+                # The folder was deleted, or its watch was removed
+                del self.watches[wd]
+                if self.paths.get(path) == wd:
+                    del self.paths[path]
+                continue
+            if mask & IN_MOVE_SELF:
+                # The folder's parent reports the move itself, as IN_MOVED_FROM (or not at all if it moved out of view)
+                self.forgetMovedFolder(path)
+                continue
+
+            if isVault:
+                if mask & IN_ISDIR:
+                    # A folder of notes came or went, so the vault is walked again
+                    changes.changedNotes = None
+                elif os.fsdecode(name).endswith(".md") and changes.changedNotes != None:
+                    # The same path as project.walkMarkdownFiles gives the note
+                    changes.changedNotes.add(path + "/" + os.fsdecode(name))
+            elif mask & IN_ISDIR and changes.changedPaths != None:
+                # Only folders can be IDs, so changes to files are ignored
+                changes.changedPaths.add(path)
+
+    def waitForChanges(self):
+        changes = Changes()
+        # Block until the first event, then keep reading until the events stop
+        timeout = None
+        while True:
+            ready, _, _ = select.select([self.fd], [], [], timeout)
+            if len(ready) != 0:
+                self.readEvents(changes)
+                timeout = settleSeconds
+            elif not changes.isEmpty():
+                return changes
+            else:
+                # Only irrelevant events (e.g. files being saved) were seen
+                timeout = None
+
+
+class PollingWatcher:
+    def __init__(self, interval):
+        # Periodically compares the mtimes of the scanned directories and vault notes with the last update
+        self.interval = interval
+        self.treeMTimes = {}
+        self.vaultSignature = {}
+
+    def getVaultSignature(self, vaultPath):
+        # The mtime and size of every note, keyed by the path project.walkMarkdownFiles gives it
+        return {filePath: (fileStat.st_mtime_ns, fileStat.st_size) for filePath, fileStat in project.walkMarkdownFiles(vaultPath)}
+
+    def update(self, treePaths, vaultPath, rescanVault):
+        # Every note is compared on each poll, so the vault is always read again
+        self.vaultPath = vaultPath
+        self.treeMTimes = {}
+        for path in treePaths:
+            try:
+                self.treeMTimes[path] = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                self.treeMTimes[path] = None
+        self.vaultSignature = self.getVaultSignature(vaultPath)
+
+    def waitForChanges(self):
+        while True:
+            time.sleep(self.interval)
+            changes = Changes()
+            for path, mtime in self.treeMTimes.items():
+                try:
+                    currentMTime = os.stat(path).st_mtime_ns
+                except FileNotFoundError:
+                    currentMTime = None
+                if currentMTime != mtime:
+                    changes.changedPaths.add(path)
+            vaultSignature = self.getVaultSignature(self.vaultPath)
+            for filePath in vaultSignature.keys() | self.vaultSignature.keys():
+                if vaultSignature.get(filePath) != self.vaultSignature.get(filePath):
+                    changes.changedNotes.add(filePath)
+            if not changes.isEmpty():
+                return changes
+
+
+def createWatcher(interval):
+    # Use inotify when the platform provides it, otherwise fall back to polling
+    if sys.platform.startswith("linux"):
+        libcName = ctypes.util.find_library("c")
+        if libcName != None:
+            try:
+                libc = ctypes.CDLL(libcName, use_errno=True)
+                return InotifyWatcher(libc)
+            except (OSError, AttributeError):
+                pass
+    return PollingWatcher(interval)
+
+
+class LiveIndex:
+    # The primary storage location's IDs and the vault's project notes, kept in memory between changes
+    # Each change only rescans the folders it touched, and only rewrites the ID shards, search shards, completion
+    # lines and metafiles of the IDs and projects that changed
+    # Every other file it reads (the scan state and metafile cache) is checked against mtimes when it's used,
+    # so those are only saved when watching stops
+    def __init__(self, rootPath, metaPath, excludedList):
+        self.rootPath = rootPath
+        self.metaPath = metaPath
+        self.excludedList = excludedList
+        self.dataDir = os.path.join(rootPath, ".glass/data")
+        self.manifestPath = os.path.join(self.dataDir, "IDPaths.json")
+        self.statePath = os.path.join(self.dataDir, "scanState.json")
+        self.stateChanged = False
+        self.loadIndex()
+        self.loadNotes()
+
+    def loadIndex(self):
+        # Read the files written by the last full scan
+        self.dirs = scanstate.ScanState(self.statePath, self.excludedList).previousDirs
+        self.records = idstore.readRecords(self.manifestPath)
+        self.titles = searchindex.readTitles(self.dataDir)
+        self.indexCreated = util.getIndexCreated(self.rootPath)
+
+    def loadNotes(self):
+        self.cache = metacache.MetaCache(metacache.getCachePath(self.rootPath))
+        self.notes = {} # The properties of each project's metafile, keyed by path
+        self.metaFiles = {} # The path of each project's metafile, keyed by glassID
+        for filePath, fileStat in project.walkMarkdownFiles(self.metaPath):
+            self.readNote(filePath, fileStat)
+
+    def readNote(self, filePath, fileStat):
+        # Returns the glassID of the note if it's a project's metafile
+        fileProperties = self.cache.getProperties(filePath, fileStat)
+        try:
+            if fileProperties["type"] == "project":
+                glassID = str(fileProperties["glassID"])
+                self.metaFiles[glassID] = filePath
+                self.notes[filePath] = fileProperties
+                return glassID
+        except Exception:
+            pass
+        return None
+
+    def forgetNote(self, filePath):
+        self.cache.files.pop(filePath, None)
+        self.cache.changed = True
+        fileProperties = self.notes.pop(filePath, None)
+        if fileProperties == None:
+            return None
+        glassID = str(fileProperties["glassID"])
+        if self.metaFiles.get(glassID) == filePath:
+            del self.metaFiles[glassID]
+        return glassID
+
+    def updateNotes(self, changedNotes):
+        # Returns the glassIDs the changed notes had before and after the change
+        if changedNotes == None:
+            oldIDs = set(self.metaFiles.keys())
+            self.loadNotes()
+            return oldIDs | set(self.metaFiles.keys())
+
+        glassIDs = set()
+        for filePath in changedNotes:
+            glassIDs.add(self.forgetNote(filePath))
+            try:
+                glassIDs.add(self.readNote(filePath, os.stat(filePath)))
+            except FileNotFoundError:
+                pass
+        glassIDs.discard(None)
+        return glassIDs
+
+    def getDirID(self, dirPath):
+        # The ID of a scanned directory comes from the entry of its parent, the root has none
+        if dirPath == self.rootPath:
+            return None
+        name = os.path.basename(dirPath)
+        parentPath = self.rootPath if os.path.join(self.rootPath, name) == dirPath else os.path.dirname(dirPath)
+        for record in self.dirs.get(parentPath, {"valid": []})["valid"]:
+            if record["name"] == name:
+                return util.idFromRecord(record)
+        return None
+
+    def removeSubtree(self, dirPath, affectedIDs):
+        # Drop a directory that is no longer part of the tree, and everything that was found below it
+        toRemove = [dirPath]
+        while len(toRemove) != 0:
+            removedPath = toRemove.pop()
+            entry = self.dirs.pop(removedPath, None)
+            if entry == None:
+                continue
+            for record in entry["valid"]:
+                affectedIDs.add(record["idText"])
+                toRemove.append(os.path.join(removedPath, record["name"]))
+
+    def rescanDirs(self, changedPaths):
+        # Returns the ID text of every ID that may have been added, removed or changed
+        affectedIDs = set()
+        scanState = scanstate.ScanState(self.statePath, self.excludedList, changedPaths, self.dirs)
+        # Parents first, so the folders below one that moved or was deleted are dropped rather than read
+        for dirPath in sorted(changedPaths, key=len):
+            if dirPath not in self.dirs or dirPath in scanState.dirs:
+                # Not part of the tree, or already scanned as part of a new folder
+                continue
+            dirID = self.getDirID(dirPath)
+            if dirID == None and dirPath != self.rootPath:
+                continue
+            oldEntry = self.dirs[dirPath]
+            try:
+                util.getSubIDs(dirPath, self.excludedList, dirID, scanState)
+            except FileNotFoundError:
+                # Removed along with a parent that isn't watched
+                self.removeSubtree(dirPath, affectedIDs)
+                continue
+            newEntry = scanState.dirs[dirPath]
+            if dirID != None:
+                # A project's revision comes from its children
+                affectedIDs.add(dirID.idText)
+
+            oldChildren = {record["name"]: record for record in oldEntry["valid"]}
+            for record in newEntry["valid"]:
+                if oldChildren.pop(record["name"], None) == record:
+                    continue
+                # A new folder, which is scanned with everything within it
+                affectedIDs.add(record["idText"])
+                childID = util.idFromRecord(record)
+                childPath = os.path.join(dirPath, record["name"])
+                self.removeSubtree(childPath, affectedIDs)
+                if childID.idType != "child-project":
+                    util.scanSubtree(childID, childPath, self.excludedList, scanState)
+            for name, record in oldChildren.items():
+                # A folder that was deleted, moved away or no longer has an ID
+                affectedIDs.add(record["idText"])
+                self.removeSubtree(os.path.join(dirPath, name), affectedIDs)
+
+        for dirPath, entry in scanState.dirs.items():
+            self.dirs[dirPath] = entry
+            for record in entry["valid"]:
+                affectedIDs.add(record["idText"])
+        self.stateChanged = self.stateChanged or len(scanState.dirs) != 0
+        return affectedIDs
+
+    def getRecords(self, affectedIDs):
+        # The records the ID file should hold for the affected IDs, None for those no longer in the tree
+        # A single pass over the tree in memory finds every folder with one of the IDs
+        found = {}
+        for dirPath, entry in self.dirs.items():
+            for record in entry["valid"]:
+                if record["idText"] in affectedIDs:
+                    path = os.path.join(dirPath, record["name"])
+                    # The same ID in several folders is reported by a full scan, here the first path is kept
+                    if record["idText"] not in found or path < found[record["idText"]][0]:
+                        found[record["idText"]] = (path, record)
+
+        records = {idText: None for idText in affectedIDs}
+        for idText, (path, rawRecord) in found.items():
+            thisID = util.idFromRecord(rawRecord)
+            if thisID.idType == "project":
+                childIDs = [util.idFromRecord(record) for record in self.dirs.get(path, {"valid": []})["valid"]]
+                util.assignRevisions([thisID] + childIDs)
+            records[idText] = util.idToRecord(thisID)
+        return records
+
+    def updateProjects(self, numericalIDs):
+        # Update the metafiles and titles of the projects with these numerical IDs
+        # Returns the paths of the metafiles that were rewritten and the numerical IDs whose title changed
+        projectIDs = {}
+        for idText, record in self.records.items():
+            if record["type"] == "project" and record["numericalID"] in numericalIDs:
+                projectIDs.setdefault(record["numericalID"], []).append(util.idFromRecord(record, idText))
+
+        modifiedMetaList, changedTitles = [], set()
+        for numericalID in numericalIDs:
+            title = None
+            for projectID in projectIDs.get(numericalID, []):
+                metaFilePath = self.metaFiles.get(projectID.numericalID.strip(), "")
+                if metaFilePath != "":
+                    # A copy, as the project changes its properties when it updates the metafile
+                    proj = project.Project(projectID, metaFilePath, [], projectProperties=dict(self.notes[metaFilePath]))
+                else:
+                    proj = project.Project(projectID, "", [])
+                if not proj.isValid:
+                    continue
+                if proj.updateMetaFileRevisions():
+                    modifiedMetaList.append(metaFilePath)
+                title = frontmatter.formatValue(proj.properties.get("title", ""))
+
+            if title != self.titles.get(numericalID):
+                changedTitles.add(numericalID)
+                if title == None:
+                    self.titles.pop(numericalID, None)
+                else:
+                    self.titles[numericalID] = title
+        return modifiedMetaList, changedTitles
+
+    def apply(self, changes):
+        # Returns the number of IDs that changed and the metafiles that were rewritten,
+        # or None if a full scan is needed instead
+        lock = util.BackgroundLock(self.rootPath)
+        if not lock.acquire(True, timeout=util.lockWaitLimit):
+            return None
+        try:
+            if util.getIndexCreated(self.rootPath) != self.indexCreated:
+                # Another process wrote the IDs (and the scan state they came from), so start from its results
+                self.loadIndex()
+            if self.rootPath not in self.dirs:
+                return None
+
+            affectedIDs = self.rescanDirs(changes.changedPaths)
+            changedRecords = {idText: record for idText, record in self.getRecords(affectedIDs).items() if record != self.records.get(idText)}
+            oldRecords = {idText: self.records.get(idText) for idText in changedRecords.keys()}
+            for idText, record in changedRecords.items():
+                if record == None:
+                    self.records.pop(idText, None)
+                else:
+                    self.records[idText] = record
+
+            numericalIDs = set(self.updateNotes(changes.changedNotes))
+            for record in list(oldRecords.values()) + list(changedRecords.values()):
+                if record != None and record["type"] == "project":
+                    numericalIDs.add(record["numericalID"])
+            modifiedMetaList, changedTitles = self.updateProjects(numericalIDs)
+
+            if len(changedRecords) != 0:
+                idstore.updateRecords(self.manifestPath, changedRecords)
+                completion.updateCache(self.rootPath, changedRecords)
+            if len(changedTitles) != 0:
+                searchindex.writeTitles(self.dataDir, self.titles)
+            shardKeys = {idstore.shardKeyForID(idText) for idText in changedRecords.keys()} | {idstore.shardKey(numericalID) for numericalID in changedTitles}
+            if len(shardKeys) != 0:
+                shardRecords = {idText: record for idText, record in self.records.items() if idstore.shardKey(record["numericalID"]) in shardKeys}
+                searchindex.updateStorage(self.dataDir, "A", idstore.sortRecords(shardRecords), self.titles, shardKeys)
+            self.indexCreated = util.getIndexCreated(self.rootPath)
+        finally:
+            lock.release()
+        return len(changedRecords), modifiedMetaList
+
+    def save(self):
+        # Keep the scan state and metafile cache warm for the next scan without the watcher
+        if self.stateChanged:
+            scanState = scanstate.ScanState(self.statePath, self.excludedList, previousDirs={})
+            scanState.dirs = self.dirs
+            scanState.save()
+        self.cache.save()
+
+
+def watchFileSystem(rootPath, metaPath, excludedList, command, version, workers=1, interval=5, echo=print):
+    # Keep the ID files and project metafiles up to date until interrupted
+    # Everything is scanned once, then each change is applied to the index in memory (see LiveIndex)
+    watcher = createWatcher(interval)
+    echo(f"Watching {rootPath} and {metaPath} using {'inotify' if isinstance(watcher, InotifyWatcher) else 'polling'}, press Ctrl+C to stop")
+
+    liveIndex = None
+    rescanVault = True
+    try:
+        while True:
+            if liveIndex == None:
+                util.doBackgroundTasks(rootPath, metaPath, excludedList, command, version, workers, reuseRunning=False)
+                try:
+                    liveIndex = LiveIndex(rootPath, metaPath, excludedList)
+                except (OSError, ValueError, KeyError) as exception:
+                    # The scan failed (see the background log), so it's run again after the next change
+                    echo(f"Couldn't read the index, it will be rebuilt after the next change: {exception}")
+            watcher.update(liveIndex.dirs.keys() if liveIndex != None else [rootPath], metaPath, rescanVault)
+
+            changes = watcher.waitForChanges()
+            rescanVault = changes.changedNotes == None
+            if changes.changedPaths == None:
+                echo("Too many changes to track, checking every folder")
+                liveIndex = None
+                continue
+            if liveIndex == None:
+                continue
+            try:
+                result = liveIndex.apply(changes)
+            except (OSError, ValueError, KeyError) as exception:
+                echo(f"Couldn't apply the changes, checking every folder: {exception}")
+                result = None
+            if result == None:
+                liveIndex = None
+                continue
+            changedCount, modifiedMetaList = result
+            echo(f"Updated {changedCount} IDs and {len(modifiedMetaList)} metafiles after changes in {len(changes.changedPaths)} folders and {'every' if changes.changedNotes == None else len(changes.changedNotes)} notes")
+    finally:
+        if liveIndex != None:
+            liveIndex.save()
@@ -0,0 +1,61 @@
+import json
+
+from glass import completion
+
+
+def makeRecord(idType, descriptor):
+    return {"type": idType, "descriptor": descriptor}
+
+# The IDs of every storage location, in no particular order
+records = [
+    ("21.01.01", makeRecord("project", "Lab\tReport")),
+    ("21", makeRecord("category", "Biology")),
+    ("B21.02", makeRecord("subfolder", "Études")),
+    ("21.01", makeRecord("subfolder", "Notes")),
+    ("21.01.01A1", makeRecord("child-project", None)),
+    ("20", makeRecord("area", "School")),
+    ("31", makeRecord("category", "Cooking")),
+]
+
+def testCandidatesStartWithTheIncompleteID(tmp_path):
+    (tmp_path / ".glass" / "data").mkdir(parents=True)
+    rootPath = str(tmp_path)
+    completion.writeCache(rootPath, records)
+
+    assert [idText for idText, descriptor in completion.getCandidates(rootPath, "")] == sorted(idText for idText, record in records)
+    assert completion.getCandidates(rootPath, "21.01") == [("21.01", "Notes"), ("21.01.01", "Lab Report"), ("21.01.01A1", "")]
+    assert completion.getCandidates(rootPath, "21.01", projectsOnly=True) == [("21.01.01", "Lab Report")]
+    assert completion.getCandidates(rootPath, "B") == [("B21.02", "Études")]
+    assert completion.getCandidates(rootPath, "3") == [("31", "Cooking")]
+    assert completion.getCandidates(rootPath, "4") == []
+    assert completion.getCandidates(rootPath, "21.011") == []
+
+def testCompletingFromTheShell(tmp_path, monkeypatch, capsys):
+    (tmp_path / ".glass" / "data").mkdir(parents=True)
+    completion.writeCache(str(tmp_path), records)
+    (tmp_path / "config.json").write_text(json.dumps({"root_path": str(tmp_path)}))
+    monkeypatch.setenv("GLASS_CONFIG", str(tmp_path / "config.json"))
+
+    monkeypatch.setenv("_GLASS_COMPLETE", "bash_complete")
+    monkeypatch.setenv("COMP_WORDS", "glass project view 21.0")
+    monkeypatch.setenv("COMP_CWORD", "3")
+    assert completion.completeFromCache()
+    assert capsys.readouterr().out == "plain,21.01.01\n"
+
+    monkeypatch.setenv("_GLASS_COMPLETE", "zsh_complete")
+    monkeypatch.setenv("COMP_WORDS", "glass list --id 2")
+    assert completion.completeFromCache()
+    assert capsys.readouterr().out.split("\n")[:3] == ["plain", "20", "School"]
+
+    # Anything other than an ID argument is left to click
+    monkeypatch.setenv("COMP_WORDS", "glass project v")
+    monkeypatch.setenv("COMP_CWORD", "2")
+    assert not completion.completeFromCache()
+
+def testIDArguments():
+    assert completion.getIDArgument(["open"], "21") == False
+    assert completion.getIDArgument(["where", "--json"], "21") == False
+    assert completion.getIDArgument(["project", "view"], "21") == True
+    assert completion.getIDArgument(["list", "--id"], "21") == False
+    assert completion.getIDArgument(["open"], "--") == None
+    assert completion.getIDArgument(["project"], "v") == None
@@ -0,0 +1,26 @@
+from glass import frontmatter
+
+
+def writeNote(tmp_path, lines):
+    notePath = tmp_path / "Note.md"
+    notePath.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return notePath
+
+def testIndentedKeysAreRead(tmp_path):
+    notePath = writeNote(tmp_path, ["---", "title: Note", "  revision-number: 2", "\tmeta-override: false", "---"])
+    assert frontmatter.readFrontmatter(notePath) == {"title": "Note", "revision-number": "2", "meta-override": "false"}
+
+def testListAndMappingItemsAreSkipped(tmp_path):
+    notePath = writeNote(tmp_path, [
+        "---",
+        "tags:",
+        "  - school",
+        "- english",
+        "links:",
+        "  title: Not the title",
+        "",
+        "title: Note",
+        "---",
+        "title: The body",
+    ])
+    assert frontmatter.readFrontmatter(notePath) == {"tags": "", "links": "", "title": "Note"}
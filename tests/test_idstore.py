@@ -0,0 +1,138 @@
+from contextlib import closing
+import json
+import multiprocessing
+import os
+import time
+
+from benchmarks import synthetic
+from glass import idstore
+
+# Every process writing a storage location's IDs updates locations.json, which holds the paths of every storage location
+
+
+def writeStorage(dataDir, label, barrier):
+    records = [(f"{label}{area}", {"path": f"/{label}/{area}"}) for area in range(10, 400)]
+    barrier.wait()
+    idstore.updateLocations(os.path.join(dataDir, f"IDPaths{label}.json"), records)
+
+def testConcurrentUpdatesKeepEveryStorage(tmp_path):
+    labels = ["B", "C", "D", "E"]
+    for trial in range(5):
+        dataDir = tmp_path / str(trial)
+        dataDir.mkdir()
+        (dataDir / idstore.locationsName).write_text(json.dumps({"format": idstore.locationsFormat, "storages": [], "ids": {}}))
+
+        # The processes start writing at the same moment, so without the lock they overwrite each other's paths
+        barrier = multiprocessing.Barrier(len(labels))
+        processes = [multiprocessing.Process(target=writeStorage, args=(str(dataDir), label, barrier)) for label in labels]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        locations = json.loads((dataDir / idstore.locationsName).read_text())
+        assert locations["storages"] == labels
+        assert locations["ids"]["10"] == {label: f"/{label}/10" for label in labels}
+        assert not (dataDir / idstore.locationsLockName).exists()
+
+def useConfig(tmp_path, monkeypatch, **settings):
+    configPath = tmp_path / "config.json"
+    configPath.write_text(json.dumps(dict({"root_path": str(tmp_path)}, **settings)))
+    monkeypatch.setenv("GLASS_CONFIG", str(configPath))
+
+def testStoreSettingsAreReadWhenWriting(tmp_path, monkeypatch):
+    # The settings come from the config at the time of the write, not from when idstore was imported
+    manifestPath = str(tmp_path / "IDPaths.json")
+    records = {"10": {"numericalID": "10", "type": "area", "path": "/10 - Area", "descriptor": "Area"}}
+
+    useConfig(tmp_path, monkeypatch, id_store="json", pretty_index="true")
+    idstore.writeRecords(manifestPath, records)
+    assert idstore.readManifest(manifestPath)["engine"] == "json"
+    assert (tmp_path / "IDPaths.shards" / "1.json").read_text().startswith('{\n    "IDs"')
+
+    useConfig(tmp_path, monkeypatch, id_store="sqlite", pretty_index="false")
+    idstore.writeRecords(manifestPath, records)
+    assert idstore.readManifest(manifestPath)["engine"] == "sqlite"
+    assert idstore.readRecords(manifestPath) == records
+
+def testShardedRecordsRoundTrip(tmp_path, monkeypatch):
+    useConfig(tmp_path, monkeypatch, id_store="json")
+    manifestPath = str(tmp_path / "IDPaths.json")
+    records = synthetic.generateIDRecords(400)
+    idstore.writeRecords(manifestPath, records)
+
+    manifest = idstore.readManifest(manifestPath)
+    assert sorted(manifest["shards"].keys()) == sorted({idText[0] for idText in records})
+    assert idstore.readRecords(manifestPath) == records
+    # A prefix only reads the shard of its area
+    assert idstore.readRecords(manifestPath, "21.01") == {idText: record for idText, record in records.items() if idText.startswith("21.01")}
+    assert idstore.readRecord(manifestPath, "21.01") == records["21.01"]
+    assert idstore.readRecord(manifestPath, "99.99") == None
+    assert idstore.countChildren(manifestPath, "21") == len([idText for idText in records if idText.startswith("21.") and len(idText) == 5])
+
+def testOnlyChangedShardsAreRewritten(tmp_path, monkeypatch):
+    useConfig(tmp_path, monkeypatch, id_store="json")
+    manifestPath = str(tmp_path / "IDPaths.json")
+    records = synthetic.generateIDRecords(400)
+    idstore.writeRecords(manifestPath, records)
+    shardDir = tmp_path / "IDPaths.shards"
+    before = {shardFile.name: shardFile.stat().st_mtime_ns for shardFile in shardDir.iterdir()}
+    oldShards = idstore.readManifest(manifestPath)["shards"]
+
+    time.sleep(0.01)
+    records["21"] = dict(records["21"], descriptor="Renamed")
+    for idText in [idText for idText in records if idText.startswith("3")]:
+        del records[idText]
+    idstore.writeRecords(manifestPath, records)
+
+    shards = idstore.readManifest(manifestPath)["shards"]
+    assert shards["2"]["generation"] == oldShards["2"]["generation"] + 1
+    assert {key: info for key, info in shards.items() if key != "2"} == {key: info for key, info in oldShards.items() if key not in ["2", "3"]}
+    after = {shardFile.name: shardFile.stat().st_mtime_ns for shardFile in shardDir.iterdir()}
+    assert "3.json" not in after
+    assert [name for name in after if after[name] != before[name]] == ["2.json"]
+    assert idstore.readRecords(manifestPath) == records
+
+def testUnshardedIDFilesAreStillRead(tmp_path):
+    # ID files written before the index was sharded hold every record in the manifest
+    manifestPath = tmp_path / "IDPaths.json"
+    records = synthetic.generateIDRecords(50)
+    manifestPath.write_text(json.dumps({"metaData": {"createdUTC": 0}, "IDs": records}))
+    assert idstore.readRecords(str(manifestPath)) == records
+    assert idstore.readRecords(str(manifestPath), "11") == {idText: record for idText, record in records.items() if idText.startswith("11")}
+
+def testDatabaseRecordsRoundTrip(tmp_path, monkeypatch):
+    useConfig(tmp_path, monkeypatch, id_store="sqlite")
+    manifestPath = str(tmp_path / "IDPaths.json")
+    otherManifestPath = str(tmp_path / "IDPathsB.json")
+    records = synthetic.generateIDRecords(400)
+    otherRecords = {f"B{idText}": record for idText, record in synthetic.generateIDRecords(50).items()}
+    idstore.writeRecords(manifestPath, records)
+    # Every storage location shares the database, without replacing each other's rows
+    idstore.writeRecords(otherManifestPath, otherRecords)
+
+    assert list(idstore.readRecords(manifestPath).items()) == idstore.sortRecords(records)
+    assert idstore.readRecords(otherManifestPath) == otherRecords
+    assert idstore.readRecords(manifestPath, "21.01") == {idText: record for idText, record in records.items() if idText.startswith("21.01")}
+    assert idstore.readRecord(manifestPath, "21.01") == records["21.01"]
+    assert idstore.readRecord(manifestPath, "B21.01") == None
+    assert idstore.countChildren(manifestPath, "21") == len([idText for idText in records if idText.startswith("21.") and len(idText) == 5])
+    assert not (tmp_path / "IDPaths.shards").exists()
+
+def testSwitchingEngineKeepsTheRecords(tmp_path, monkeypatch):
+    manifestPath = str(tmp_path / "IDPaths.json")
+    records = synthetic.generateIDRecords(100)
+    useConfig(tmp_path, monkeypatch, id_store="json")
+    idstore.writeRecords(manifestPath, records)
+
+    # The shards are replaced by the database, and the rows by shards when switching back
+    useConfig(tmp_path, monkeypatch, id_store="sqlite")
+    idstore.writeRecords(manifestPath, records)
+    assert not (tmp_path / "IDPaths.shards").exists()
+    assert idstore.readRecords(manifestPath) == records
+
+    useConfig(tmp_path, monkeypatch, id_store="json")
+    idstore.writeRecords(manifestPath, records)
+    assert idstore.readRecords(manifestPath) == records
+    with closing(idstore.connectDatabase(idstore.getDatabasePath(manifestPath))) as connection:
+        assert connection.execute("SELECT COUNT(*) FROM ids").fetchone()[0] == 0
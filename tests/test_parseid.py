@@ -0,0 +1,41 @@
+import pytest
+
+from benchmarks import idparse
+from glass import util
+
+# parseID reads the IDs in the grammar in one match, and has to classify every ID the way the step by step parser did
+
+
+@pytest.mark.parametrize("idText, expected", [
+    ("20", ("area", "20", None, "0", None, None)),
+    ("21", ("category", "21", None, "1", None, None)),
+    ("B21", ("category", "21", "B", None, None, None)),
+    ("21.01", ("subfolder", "21.01", None, None, None, None)),
+    ("C21.01.02", ("project", "21.01.02", "C", None, None, None)),
+    ("21.01.02A1", ("child-project", "21.01.02A1", None, 1, "A", None)),
+    ("D21.01.02D9", ("child-project", "21.01.02D9", "D", 9, "D", None)),
+])
+def testGrammar(idText, expected):
+    assert util.parseID(idText) == expected
+
+@pytest.mark.parametrize("idText, descriptor", [
+    ("1", "ID is too short"),
+    ("ab", "This ID does not have a number for the Area"),
+    ("2a", "This ID does not have a number for the Category"),
+    ("21.0x", "The Subfolder ID contains characters"),
+    ("21.01.02AB", "Invalid Project ID, Either you have a 2 digit version number or no Revision Letter"),
+])
+def testInvalidIDsExplainWhy(idText, descriptor):
+    assert util.parseID(idText)[0] == "invalid"
+    assert util.parseID(idText)[5] == descriptor
+    assert util.pathID(idText, "/path", doValidation=True, desc="Folder").idType == "invalid"
+
+def testGrammarMatchesTheStepByStepParser():
+    # Including IDs outside the grammar, which parseID hands to the step by step parser
+    idTexts = idparse.generateIDTexts(20000) + ["a1", "21.01.2", "21.01.02A0", "21.01.02.03", "E21.01.02B3"]
+    for idText in idTexts:
+        assert util.parseID(idText) == util.parseIDFallback(idText), idText
+
+def testPathIDUsesTheParsedValues():
+    thisID = util.pathID("B21.01.02C3", "/path", doValidation=True, desc="Draft")
+    assert (thisID.idType, thisID.numericalID, thisID.storageLocation, thisID.revision, thisID.revisionStage) == ("child-project", "21.01.02C3", "B", 3, "C")
@@ -0,0 +1,110 @@
+import os
+import time
+
+from benchmarks import synthetic
+from glass import scanstate
+from glass import util
+
+excludedList = [".glass"]
+
+
+def ageTree(rootPath):
+    # Folders modified within the racy window are always read again, so the tree is made an hour old
+    agedTime = time.time() - 3600
+    for dirPath, dirNames, fileNames in os.walk(rootPath):
+        os.utime(dirPath, (agedTime, agedTime))
+
+def buildTree(tmp_path):
+    rootPath = str(tmp_path / "root")
+    synthetic.generateTree(rootPath, areas=2, categories=3, subfolders=2, projects=2)
+    ageTree(rootPath)
+    return rootPath
+
+def getRecords(IDList):
+    return sorted((thisID.idText, thisID.path, util.idToRecord(thisID)["revisionCount"]) for thisID in IDList)
+
+def scan(rootPath, changedPaths=None, workers=1):
+    scanState = scanstate.ScanState(os.path.join(rootPath, ".glass/data/scanState.json"), excludedList, changedPaths)
+    IDList, invalidIDList = util.generateIDList(rootPath, excludedList, scanState, workers)
+    scanState.save()
+    return IDList, scanState
+
+def testUnchangedDirectoriesAreReused(tmp_path):
+    rootPath = buildTree(tmp_path)
+    firstIDs, firstState = scan(rootPath)
+    assert firstState.skippedCount == 0
+
+    secondIDs, secondState = scan(rootPath)
+    assert secondState.scannedCount == 0
+    assert secondState.skippedCount == firstState.scannedCount
+    assert getRecords(secondIDs) == getRecords(firstIDs)
+
+def testChangedDirectoriesAreScannedAgain(tmp_path):
+    rootPath = buildTree(tmp_path)
+    scan(rootPath)
+    categoryPath = os.path.join(rootPath, "10 - Area 1", "11 - Category 11")
+    os.mkdir(os.path.join(categoryPath, "11.03 - Subfolder 11.03"))
+    os.rmdir(os.path.join(rootPath, "20 - Area 2", "22 - Category 22", "22.01 - Subfolder 22.01", "22.01.02 - Project 22.01.02", "A2 - Revision A2"))
+
+    IDList, scanState = scan(rootPath)
+    idTexts = [thisID.idText for thisID in IDList]
+    assert "11.03" in idTexts
+    assert [thisID.revision for thisID in IDList if thisID.idText == "22.01.02"] == [1]
+    # Only the two changed folders and the new one are read, deleted folders drop out of the state
+    assert scanState.scannedCount == 3
+    assert getRecords(IDList) == getRecords(util.generateIDList(rootPath, excludedList)[0])
+
+def testWatcherCanListTheChangedDirectories(tmp_path):
+    # With changedPaths, the other directories are trusted without being stat'ed
+    rootPath = buildTree(tmp_path)
+    scan(rootPath)
+    categoryPath = os.path.join(rootPath, "10 - Area 1", "11 - Category 11")
+    os.mkdir(os.path.join(categoryPath, "11.03 - Subfolder 11.03"))
+
+    IDList, scanState = scan(rootPath, {categoryPath})
+    assert "11.03" in [thisID.idText for thisID in IDList]
+    assert scanState.scannedCount == 2
+
+def testParallelScanMatchesOneWorker(tmp_path):
+    rootPath = buildTree(tmp_path)
+    # Invalid folders and a non-area ID in the root are reported by whichever thread finds them
+    os.mkdir(os.path.join(rootPath, "10 - Area 1", "11 - Category 11", "Not an ID"))
+    os.mkdir(os.path.join(rootPath, "30 - Area 3"))
+    os.mkdir(os.path.join(rootPath, "31.01 - Stray Subfolder"))
+
+    def getOrder(IDList, invalidIDList):
+        return [thisID.path for thisID in IDList], [thisID.path for thisID in invalidIDList]
+
+    oneWorker = getOrder(*util.generateIDList(rootPath, excludedList, workers=1))
+    # The results are merged in submission order, so they don't depend on which thread finished first
+    for trial in range(3):
+        assert getOrder(*util.generateIDList(rootPath, excludedList, workers=8)) == oneWorker
+    parallelIDs, scanState = scan(rootPath, workers=8)
+    assert [thisID.path for thisID in parallelIDs] == oneWorker[0]
+    assert getRecords(scan(rootPath, workers=8)[0]) == getRecords(parallelIDs)
+
+def testSinglePassMatchesWithAndWithoutTheCache(tmp_path):
+    rootPath = buildTree(tmp_path)
+    subfolderPath = os.path.join(rootPath, "10 - Area 1", "11 - Category 11", "11.01 - Subfolder 11.01")
+    # Subfolders hold the actual files, so folders without an ID within them aren't invalid
+    os.mkdir(os.path.join(subfolderPath, "Notes"))
+    # Project children are the lowest level of ID, so nothing within them is read
+    os.mkdir(os.path.join(subfolderPath, "11.01.01 - Project 11.01.01", "A1 - Revision A1", "12.05 - Inside a Revision"))
+    os.mkdir(os.path.join(rootPath, "20 - Area 2", "Not an ID"))
+    ageTree(rootPath)
+
+    def getResults(IDList, invalidIDList):
+        return getRecords(IDList), sorted(thisID.path for thisID in invalidIDList)
+
+    uncached = getResults(*util.generateIDList(rootPath, excludedList))
+    idTexts = [record[0] for record in uncached[0]]
+    assert "11.01.01A1" in idTexts and "12.05" not in idTexts
+    # pathID stores its path with backslashes
+    assert [path.split("\\")[-1] for path in uncached[1]] == ["Not an ID"]
+
+    statePath = os.path.join(rootPath, ".glass/data/scanState.json")
+    for run in ["cold", "warm"]:
+        scanState = scanstate.ScanState(statePath, excludedList)
+        assert getResults(*util.generateIDList(rootPath, excludedList, scanState)) == uncached
+        scanState.save()
+    assert scanState.scannedCount == 0
@@ -0,0 +1,68 @@
+import json
+import os
+
+from glass import idstore
+from glass import searchindex
+
+
+def makeRecord(numericalID, idType, descriptor):
+    return {"numericalID": numericalID, "path": f"/root/{numericalID} - {descriptor}", "type": idType, "descriptor": descriptor,
+            "storageLocation": "A", "revisionStage": "A", "revisionCount": -1}
+
+records = {
+    "10": makeRecord("10", "area", "School"),
+    "11": makeRecord("11", "category", "Biology"),
+    "11.01": makeRecord("11.01", "subfolder", "Photosynthesis Notes"),
+    "11.01.01": makeRecord("11.01.01", "project", "Lab Report"),
+    "20": makeRecord("20", "area", "Home"),
+    "21": makeRecord("21", "category", "Photography"),
+}
+titles = {"11.01.01": "Measuring the rate of photosynthesis"}
+
+def writeIndex(tmp_path, monkeypatch):
+    (tmp_path / "config.json").write_text(json.dumps({"root_path": str(tmp_path), "id_store": "json"}))
+    monkeypatch.setenv("GLASS_CONFIG", str(tmp_path / "config.json"))
+    dataDir = str(tmp_path)
+    idstore.writeRecords(os.path.join(dataDir, "IDPaths.json"), records)
+    searchindex.setProjectTitles(dataDir, titles, idstore.sortRecords(records))
+    return dataDir
+
+def getIDs(matches):
+    return [(match["id"], match["kind"]) for match in matches]
+
+def testSearchFindsDescriptorsAndTitles(tmp_path, monkeypatch):
+    dataDir = writeIndex(tmp_path, monkeypatch)
+    # Whole matches rank above fuzzy ones, and shorter texts above longer ones
+    assert getIDs(searchindex.search(dataDir, "photosynthesis")) == [("11.01", "descriptor"), ("11.01.01", "title")]
+    # A misspelt word still shares most of its trigrams
+    assert getIDs(searchindex.search(dataDir, "photosynthsis"))[:2] == [("11.01", "descriptor"), ("11.01.01", "title")]
+    # The padded trigrams at the start of each word act as a prefix index
+    assert getIDs(searchindex.search(dataDir, "photo")) == [("21", "descriptor"), ("11.01", "descriptor"), ("11.01.01", "title")]
+    assert searchindex.search(dataDir, "zebra") == []
+    assert searchindex.search(dataDir, "?!") == []
+
+def testSearchBuildsAMissingIndex(tmp_path, monkeypatch):
+    dataDir = writeIndex(tmp_path, monkeypatch)
+    expected = searchindex.search(dataDir, "lab report")
+    os.remove(searchindex.getManifestPath(dataDir))
+    assert searchindex.search(dataDir, "lab report") == expected
+
+def testOnlyChangedShardsAreRebuilt(tmp_path, monkeypatch):
+    dataDir = writeIndex(tmp_path, monkeypatch)
+    indexDir = searchindex.getIndexDir(dataDir)
+
+    changedRecords = {"20": records["20"], "21": makeRecord("21", "category", "Gardening")}
+    os.utime(os.path.join(indexDir, "A2.docs"), ns=(0, 0))
+    searchindex.updateStorage(dataDir, "A", idstore.sortRecords(changedRecords), titles)
+
+    # The first area's shard has no IDs left so it's removed, and the second is rebuilt
+    assert sorted(searchindex.readManifest(dataDir)["shards"].keys()) == ["A2.json"]
+    assert not os.path.exists(os.path.join(indexDir, "A1.docs"))
+    assert os.stat(os.path.join(indexDir, "A2.docs")).st_mtime_ns != 0
+    assert getIDs(searchindex.search(dataDir, "gardening")) == [("21", "descriptor")]
+    assert searchindex.search(dataDir, "photosynthesis") == []
+
+    # Unchanged text leaves the shard alone
+    os.utime(os.path.join(indexDir, "A2.docs"), ns=(0, 0))
+    searchindex.updateStorage(dataDir, "A", idstore.sortRecords(changedRecords), titles)
+    assert os.stat(os.path.join(indexDir, "A2.docs")).st_mtime_ns == 0
@@ -0,0 +1,9 @@
+from benchmarks import startup
+
+# Every command pays for importing glass.__main__, so it must only import what every command needs
+# How long the import takes is checked by python -m benchmarks.startup, as timings vary too much between machines
+
+
+def testStartupImportsOnlyWhatEveryCommandNeeds():
+    importTimes = startup.measureImport("glass.__main__")
+    assert [moduleName for moduleName in startup.lazyModules if moduleName in importTimes] == []
@@ -0,0 +1,92 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from benchmarks import synthetic
+from glass import completion
+from glass import idstore
+from glass import searchindex
+from glass import util
+from glass import watcher
+
+# The watcher applies each change to the index in memory, which has to leave the same files as a full scan
+
+
+def buildWorkspace(tmp_path, monkeypatch, engine="json"):
+    rootPath = str(tmp_path / "root")
+    vaultPath = str(tmp_path / "vault")
+    synthetic.generateVault(vaultPath, synthetic.generateTree(rootPath, areas=2, categories=2, subfolders=2, projects=2))
+    with open(os.path.join(rootPath, ".glass", "data", "drives.json"), "w") as driveFile:
+        json.dump({"drives": [{"letter": "A", "label": "Local Storage", "path": rootPath}]}, driveFile)
+    configPath = tmp_path / "config.json"
+    configPath.write_text(json.dumps({"root_path": rootPath, "markdown_path": vaultPath, "id_store": engine}))
+    monkeypatch.setenv("GLASS_CONFIG", str(configPath))
+    return rootPath, vaultPath
+
+def readIndex(rootPath, vaultPath):
+    dataDir = os.path.join(rootPath, ".glass", "data")
+    with open(completion.getCachePath(rootPath), "r", encoding="utf-8") as cacheFile:
+        completionLines = cacheFile.read()
+    with open(os.path.join(vaultPath, "Project 11.01.01.md"), "r") as metaFile:
+        metaFileText = metaFile.read()
+    return {
+        "records": idstore.readRecords(os.path.join(dataDir, "IDPaths.json")),
+        "locations": idstore.readLocations(dataDir)["ids"],
+        "search": {key: info["checksum"] for key, info in searchindex.readManifest(dataDir)["shards"].items()},
+        "titles": searchindex.readTitles(dataDir),
+        "completion": completionLines,
+        "metafile": metaFileText,
+    }
+
+@pytest.mark.parametrize("engine", idstore.engines)
+def testChangesMatchAFullScan(tmp_path, monkeypatch, engine):
+    rootPath, vaultPath = buildWorkspace(tmp_path, monkeypatch, engine)
+    excludedList = [".glass"]
+    util.doBackgroundTasks(rootPath, vaultPath, excludedList, "test", "test")
+    liveIndex = watcher.LiveIndex(rootPath, vaultPath, excludedList)
+
+    areaPath = os.path.join(rootPath, "10 - Area 1")
+    subfolderPath = os.path.join(areaPath, "11 - Category 11", "11.01 - Subfolder 11.01")
+    projectPath = os.path.join(subfolderPath, "11.01.01 - Project 11.01.01")
+    categoryPath = os.path.join(rootPath, "20 - Area 2", "22 - Category 22")
+    # A new revision, a renamed project, a deleted subfolder and a new category holding a subfolder
+    os.mkdir(os.path.join(projectPath, "B1 - Revision B1"))
+    os.rename(os.path.join(subfolderPath, "11.01.02 - Project 11.01.02"), os.path.join(subfolderPath, "11.01.02 - Renamed"))
+    shutil.rmtree(os.path.join(categoryPath, "22.02 - Subfolder 22.02"))
+    os.makedirs(os.path.join(areaPath, "13 - Category 13", "13.01 - Subfolder 13.01"))
+
+    changes = watcher.Changes()
+    changes.changedPaths = {projectPath, subfolderPath, categoryPath, areaPath}
+    changedCount, modifiedMetaList = liveIndex.apply(changes)
+    assert modifiedMetaList == [os.path.join(vaultPath, "Project 11.01.01.md")]
+    incremental = readIndex(rootPath, vaultPath)
+    assert "13.01" in incremental["records"] and "22.02" not in incremental["records"]
+    assert incremental["records"]["11.01.02"]["descriptor"] == "Renamed"
+    assert incremental["records"]["11.01.01"]["revisionStage"] == "B"
+    assert "revision-stage: working-paper" in incremental["metafile"]
+
+    util.doBackgroundTasks(rootPath, vaultPath, excludedList, "test", "test", reuseRunning=False)
+    assert readIndex(rootPath, vaultPath) == incremental
+
+def testMovedFoldersAreNoLongerWatchedByTheirOldPath(tmp_path, monkeypatch):
+    fileWatcher = watcher.createWatcher(1)
+    if not isinstance(fileWatcher, watcher.InotifyWatcher):
+        pytest.skip("inotify isn't available")
+    monkeypatch.setattr(watcher, "settleSeconds", 0.1)
+    oldPath, newPath = str(tmp_path / "10 - Old"), str(tmp_path / "10 - New")
+    os.makedirs(os.path.join(oldPath, "11 - Child"))
+    (tmp_path / "vault").mkdir()
+    fileWatcher.update([str(tmp_path), oldPath, os.path.join(oldPath, "11 - Child")], str(tmp_path / "vault"), True)
+
+    os.rename(oldPath, newPath)
+    changes = fileWatcher.waitForChanges()
+    assert changes.changedPaths == {str(tmp_path)}
+    assert set(fileWatcher.paths.keys()) == {str(tmp_path), str(tmp_path / "vault")}
+
+    # Once the folders are watched at their new paths, events are reported against those paths
+    fileWatcher.update([str(tmp_path), newPath, os.path.join(newPath, "11 - Child")], str(tmp_path / "vault"), False)
+    os.mkdir(os.path.join(newPath, "11 - Child", "11.01 - Subfolder"))
+    assert fileWatcher.waitForChanges().changedPaths == {os.path.join(newPath, "11 - Child")}
+    assert len(fileWatcher.watches) == len(fileWatcher.paths) == 4